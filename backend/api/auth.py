@@ -1,19 +1,46 @@
 from datetime import datetime, timedelta
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import time
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 import jwt
 import bcrypt
 from pydantic import BaseModel, Field
 from beanie import PydanticObjectId
+from pymongo.errors import DuplicateKeyError
 
 from models import User
+from core.cache import user_cache
+from core.metrics import auth_duration, password_hash_duration
+from core.storage import get_storage
+from core.tracing import span
+from core.ratelimit import RateLimit, InFlightLimit
 
 # --- Config ---
 SECRET_KEY = "supersecretkey" # In prod, use environment variable
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 4320 # 3 days
 
+# bcrypt work factor for new hashes; existing hashes are upgraded on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt releases the GIL, so a small thread pool keeps hashing off the event loop
+# while bounding how many CPU-heavy hashes run at once.
+_hash_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", "2")),
+    thread_name_prefix="bcrypt"
+)
+
+# Admission control for credential endpoints ("<requests>/<seconds>" token buckets)
+auth_ip_limit = RateLimit("auth-ip", os.getenv("AUTH_RATE_LIMIT_IP", "20/60"))
+auth_account_limit = RateLimit("auth-account", os.getenv("AUTH_RATE_LIMIT_ACCOUNT", "5/60"))
+# Account-wide cap across every client, above the per-client one so the owner keeps some headroom
+auth_account_total_limit = RateLimit("auth-account-total", os.getenv("AUTH_RATE_LIMIT_ACCOUNT_TOTAL", "10/60"))
+# Hash operations queued or running at once; beyond this, requests are rejected with 429
+hash_admission = InFlightLimit(int(os.getenv("HASH_MAX_IN_FLIGHT", "8")))
+
 # --- Security Setup ---
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token")
 
@@ -43,9 +70,51 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def get_password_hash(password: str) -> str:
     # bcrypt.hashpw requires bytes and returns bytes
-    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
     return hashed.decode('utf-8')
 
+def needs_rehash(hashed_password: str) -> bool:
+    # bcrypt hashes look like $2b$<rounds>$<salt+hash>
+    try:
+        return int(hashed_password.split("$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+def _timed(fn, *args):
+    # Runs in the hash pool; the elapsed time is recorded back on the event loop
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    async with hash_admission:
+        loop = asyncio.get_running_loop()
+        with span("auth.bcrypt", operation="verify"):
+            result, elapsed = await loop.run_in_executor(_hash_pool, _timed, verify_password, plain_password, hashed_password)
+    password_hash_duration.observe(elapsed, operation="verify")
+    return result
+
+async def get_password_hash_async(password: str) -> str:
+    async with hash_admission:
+        loop = asyncio.get_running_loop()
+        with span("auth.bcrypt", operation="hash"):
+            result, elapsed = await loop.run_in_executor(_hash_pool, _timed, get_password_hash, password)
+    password_hash_duration.observe(elapsed, operation="hash")
+    return result
+
+def client_ip(request: Request) -> str:
+    # Behind a proxy this is X-Forwarded-For, but only from FORWARDED_ALLOW_IPS (see Procfile)
+    return request.client.host if request.client else "unknown"
+
+async def limit_auth_by_ip(request: Request):
+    await auth_ip_limit.hit(client_ip(request))
+
+async def limit_auth_by_account(request: Request, email: str):
+    # The per-client bucket runs first, so one noisy address cannot drain the account-wide one
+    email = email.lower()
+    await auth_account_limit.hit(f"{client_ip(request)}|{email}")
+    await auth_account_total_limit.hit(email)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -57,53 +126,75 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+    with auth_duration.time(operation="current_user"):
+        credentials_exception = HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+        try:
+            with span("auth.jwt"):
+                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            email: str = payload.get("sub")
+            if email is None:
+                raise credentials_exception
+        except jwt.PyJWTError:
             raise credentials_exception
-    except jwt.PyJWTError:
-        raise credentials_exception
-    
-    user = await User.find_one(User.email == email)
-    if user is None:
-        raise credentials_exception
-    return user
+
+        with span("auth.user") as lookup:
+            user = user_cache.get(email)
+            lookup.set(cached=user is not None)
+            if user is None:
+                user = await get_storage().users.get_by_email(email)
+                if user is None:
+                    raise credentials_exception
+                user_cache.set(email, user)
+        return user
 
 # --- Endpoints ---
-@router.post("/register", response_model=UserResponse)
-async def register(user: UserCreate):
-    # Check if user exists
-    existing_user = await User.find_one(User.email == user.email)
-    if existing_user:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    
-    hashed_password = get_password_hash(user.password)
-    new_user = User(email=user.email, hashed_password=hashed_password)
-    # Beanie insert is async
-    await new_user.insert()
-    return new_user
-
-@router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = await User.find_one(User.email == form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect username or password",
-            headers={"WWW-Authenticate": "Bearer"},
+@router.post("/register", response_model=UserResponse, dependencies=[Depends(limit_auth_by_ip)])
+async def register(user: UserCreate, request: Request):
+    with auth_duration.time(operation="register"):
+        await limit_auth_by_account(request, user.email)
+
+        if not user.email.strip():
+            raise HTTPException(status_code=400, detail="Email is required")
+
+        # Check if user exists
+        existing_user = await get_storage().users.get_by_email(user.email)
+        if existing_user:
+            raise HTTPException(status_code=400, detail="Email already registered")
+
+        hashed_password = await get_password_hash_async(user.password)
+        try:
+            return await get_storage().users.create(user.email, hashed_password)
+        except DuplicateKeyError:
+            # A concurrent registration won the race past the check above
+            raise HTTPException(status_code=400, detail="Email already registered")
+
+@router.post("/token", response_model=Token, dependencies=[Depends(limit_auth_by_ip)])
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    with auth_duration.time(operation="login"):
+        await limit_auth_by_account(request, form_data.username)
+
+        with span("db.user"):
+            user = await get_storage().users.get_by_email(form_data.username)
+        if not user or not await verify_password_async(form_data.password, user.hashed_password):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Incorrect username or password",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+        # Upgrade hashes made with a different BCRYPT_ROUNDS while we have the plain password
+        if needs_rehash(user.hashed_password):
+            await get_storage().users.set_password(user, await get_password_hash_async(form_data.password))
+
+        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        access_token = create_access_token(
+            data={"sub": user.email}, expires_delta=access_token_expires
         )
-    
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+        return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=UserResponse)
 async def read_users_me(current_user: User = Depends(get_current_user)):
@@ -1,25 +1,41 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
+import asyncio
 import json
+import logging
 from datetime import datetime
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Dict, Optional
 from beanie import PydanticObjectId 
 
 from models import ChatRequest, User, Plan, ChatSession, Link
+from core.context import format_plan
 from core.llm import stream_chat
+from core.metrics import tool_call_parse_failures
+from core.events import Meta, PlanUpdate, StreamError, StreamEvent, ToolCallDelta, TurnAccumulator, encode_sequenced
+from core.plan_stream import PlanStepParser
+from core.tool_dispatch import dispatch_tool_calls
+from core.plan_patch import PlanPatchError, check_unique_ids
+from core.chat_store import PROMPT_HISTORY_MESSAGES, ChatSessionGone
+from core.storage import get_storage
+from core.tracing import span
+from core.turns import turns
 from api.auth import get_current_user
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 async def save_and_stream(
     chat_request: ChatRequest, 
     user: User, 
     plan: Plan, 
-    chat_session: ChatSession
-) -> AsyncGenerator[str, None]:
+    chat_session: ChatSession,
+    turn_id: Optional[str] = None,
+    use_cache: bool = True
+) -> AsyncGenerator[StreamEvent, None]:
     """
     Generator that:
-    1. Yields 'meta' event with plan_id.
+    1. Yields 'meta' event with plan_id and turn_id.
     2. Saves User message.
     3. Streams AI response (yields chunks).
     4. Accumulates AI response.
@@ -27,40 +43,63 @@ async def save_and_stream(
     6. Updates Plan if tool called.
     """
     
+    chats = get_storage().chats
+
     # 1. Yield Meta
-    yield json.dumps({"type": "meta", "plan_id": str(plan.id)}) + "\n"
+    yield Meta(str(plan.id), turn_id)
     
     # 2. Save User Message
-    user_msg_content = chat_request.messages[-1]["content"] # Assuming last msg is new
-    chat_session.messages.append({
-        "role": "user", 
-        "content": user_msg_content,
-        "timestamp": datetime.utcnow().isoformat()
-    })
-    await chat_session.save()
+    if chat_request.message is not None:
+        user_msg_content = chat_request.message
+    else:
+        user_msg_content = chat_request.messages[-1]["content"] # Assuming last msg is new
+    with span("db.save_user_message"):
+        await chats.append_message(chat_session, {
+            "role": "user", 
+            "content": user_msg_content,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+
+    # The stored session is authoritative when the client only sent the new message
+    if chat_request.message is not None:
+        with span("db.history"):
+            history, _ = await chats.get_messages(chat_session.id, limit=PROMPT_HISTORY_MESSAGES)
+    else:
+        history = chat_request.messages
     
     # 3. Stream AI
-    ai_content = ""
-    tool_call_args = ""
+    turn = TurnAccumulator()
+    plan_steps: Dict[int, PlanStepParser] = {}
     
     # Serialize current plan for context
-    plan_context = json.dumps(plan.model_dump(include={"title", "steps"}), indent=2)
+    plan_context = format_plan(plan.model_dump(include={"title", "steps"}))
     
-    async for chunk_str in stream_chat(chat_request.messages, plan_context):
-        yield chunk_str
-        
-        # Parse chunk to accumulate
+    try:
+        async for event in stream_chat(history, plan_context, use_cache=use_cache):
+            yield event
+            turn.add(event)
+            # Let the plan pane fill in while a full rewrite is still generating
+            if isinstance(event, ToolCallDelta) and turn.tool_calls[event.index].name == "manage_plan":
+                parser = plan_steps.setdefault(event.index, PlanStepParser())
+                for step_event in parser.feed(event.content):
+                    yield step_event
+    except asyncio.CancelledError:
+        # The turn was abandoned (see core.turns); keep what was generated, without tool calls
         try:
-            chunk = json.loads(chunk_str)
-            if chunk["type"] == "text":
-                ai_content += chunk["content"]
-            elif chunk["type"] == "tool_chunk":
-                tool_call_args += chunk["content"]
-        except:
-            pass
+            await chats.append_message(chat_session, {
+                "role": "assistant",
+                "content": turn.text,
+                "truncated": True,
+                "timestamp": datetime.utcnow().isoformat()
+            })
+        except ChatSessionGone:
+            pass  # the plan was deleted as well; nothing to keep
+        raise
             
-    # 4. Save AI Message & Execute Tool
-    if not ai_content and tool_call_args:
+    # 4. Save AI Message & Execute Tools
+    ai_content = turn.text
+    tool_calls = [call for call in turn.calls if call.arguments]
+    if not ai_content and tool_calls:
         ai_content = "Strategy updated."
 
     ai_msg = {
@@ -69,41 +108,119 @@ async def save_and_stream(
         "timestamp": datetime.utcnow().isoformat()
     }
     
-    if tool_call_args:
-        # It was a tool call (manage_plan)
+    parsed_calls = []
+    for call in tool_calls:
         try:
-            args = json.loads(tool_call_args)
-            ai_msg["tool_calls"] = [{"function": {"name": "manage_plan", "arguments": tool_call_args}}]
-            
-            # Update Plan in DB
-            plan.title = args.get("title", plan.title)
-            plan.steps = args.get("steps", plan.steps)
-            plan.updated_at = datetime.utcnow()
-            await plan.save()
-            
+            parsed_calls.append((call, json.loads(call.arguments)))
         except json.JSONDecodeError:
-            print("Failed to decode tool args for DB save")
+            tool_call_parse_failures.inc(tool=call.name or "unknown")
+            logger.warning("Failed to decode %s arguments; the call is not applied", call.name)
+
+    if parsed_calls:
+        ai_msg["tool_calls"] = [
+            {"function": {"name": call.name, "arguments": call.arguments}} for call, _ in parsed_calls
+        ]
+
+        async def execute(parsed):
+            call, args = parsed
+            try:
+                await apply_tool_call(plan, call.name, args)
+            except PlanPatchError as e:
+                logger.warning("Rejected plan patch for plan %s: %s", plan.id, e)
+                return StreamError(f"Plan update rejected: {e}")
+            return None
+
+        # Both plan tools edit this chat's plan, so they share a resource and apply in order
+        with span("tools", calls=len(parsed_calls)):
+            errors = await dispatch_tool_calls(parsed_calls, execute, resource_of=lambda parsed: plan.id)
+        for error in errors:
+            if error:
+                yield error
+        if not all(errors):
+            yield PlanUpdate(plan.model_dump(include={"title", "steps"}))
             
-    chat_session.messages.append(ai_msg)
-    await chat_session.save()
+    with span("db.save_assistant_message"):
+        try:
+            await chats.append_message(chat_session, ai_msg)
+        except ChatSessionGone:
+            logger.info("Plan %s was deleted during the turn; the answer is not saved", plan.id)
+            yield StreamError("This plan was deleted, so the answer was not saved.")
+
+
+async def apply_tool_call(plan: Plan, name: str, args: dict):
+    """Apply a plan tool call to the stored plan and keep `plan` in sync."""
+    if name not in ("manage_plan", "patch_plan"):
+        raise PlanPatchError(f"Unknown tool '{name}'")
+    if not isinstance(args, dict) or not isinstance(args.get("title") or "", str):
+        raise PlanPatchError(f"Malformed {name} arguments")
+
+    if name == "patch_plan":
+        # Validated before anything is written; a rejected patch leaves the plan untouched
+        await get_storage().plans.patch(plan, args.get("operations", []), title=args.get("title"))
+        return
+
+    # manage_plan: full rewrite
+    steps = args.get("steps", plan.steps)
+    check_unique_ids(steps)
+    plan.updated_at = datetime.utcnow()
+    plan.title = args.get("title", plan.title)
+    plan.steps = steps
+    await get_storage().plans.save(plan)
 
 
 @router.post("/chat")
-async def chat_endpoint(request: ChatRequest, current_user: User = Depends(get_current_user)):
+async def chat_endpoint(
+    request: ChatRequest,
+    http_request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    if request.message is None and not request.messages:
+        raise HTTPException(status_code=422, detail="Provide 'message' or 'messages'")
+
     # 1. Find or Create Plan & Session
+    storage = get_storage()
     if request.plan_id:
-        plan = await Plan.find_one(Plan.id == PydanticObjectId(request.plan_id), Plan.user_id == current_user.id)
+        with span("db.plan"):
+            plan = await storage.plans.get(PydanticObjectId(request.plan_id), current_user.id)
         if not plan:
             raise HTTPException(status_code=404, detail="Plan not found")
-        chat_session = await ChatSession.find_one(ChatSession.plan_id == plan.id)
+        with span("db.session"):
+            chat_session = await storage.chats.get_session(plan.id)
+            if not chat_session:
+                chat_session = await storage.chats.create_session(plan.id, current_user.id)
     else:
         # Create new
-        plan = Plan(title="Untitled Strategy", user_id=current_user.id)
-        await plan.insert()
-        chat_session = ChatSession(plan_id=plan.id, user_id=current_user.id, messages=[])
-        await chat_session.insert()
+        with span("db.create_plan"):
+            plan = await storage.plans.create(current_user.id, "Untitled Strategy")
+            chat_session = await storage.chats.create_session(plan.id, current_user.id)
         
+    # "Cache-Control: no-cache" asks for a fresh answer instead of a cached replay
+    use_cache = "no-cache" not in http_request.headers.get("cache-control", "").lower()
+
+    # The turn runs as its own task so it completes even if this connection drops
+    turn_id = turns.new_turn_id()
+    turn = turns.start(
+        turn_id, str(current_user.id),
+        save_and_stream(request, current_user, plan, chat_session, turn_id, use_cache)
+    )
+    return StreamingResponse(
+        encode_sequenced(turn.follow()),
+        media_type="application/x-ndjson",
+        headers={"X-Turn-Id": turn_id}
+    )
+
+
+@router.get("/chat/turns/{turn_id}")
+async def resume_turn(
+    turn_id: str,
+    after: int = Query(-1, ge=-1, description="Last seq the client received; later events are replayed"),
+    current_user: User = Depends(get_current_user)
+):
+    turn = turns.get(turn_id, str(current_user.id))
+    if not turn:
+        raise HTTPException(status_code=404, detail="Turn not found or expired")
     return StreamingResponse(
-        save_and_stream(request, current_user, plan, chat_session),
-        media_type="application/x-ndjson"
+        encode_sequenced(turn.follow(after)),
+        media_type="application/x-ndjson",
+        headers={"X-Turn-Id": turn_id}
     )
@@ -1,44 +1,98 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from typing import List, Optional, Tuple
+from datetime import datetime
+import base64
 from beanie import PydanticObjectId
 
-from models import Plan, ChatSession, User
+from models import PlanSummary, User
 from api.auth import get_current_user
+from core.chat_store import HISTORY_PAGE_SIZE
+from core.storage import get_storage
 
 router = APIRouter()
 
-@router.get("/", response_model=List[Plan])
-async def list_user_plans(current_user: User = Depends(get_current_user)):
-    """List all plans for the current user."""
-    plans = await Plan.find(Plan.user_id == current_user.id).sort(-Plan.updated_at).to_list()
+PLAN_PAGE_SIZE = 50
+
+def encode_cursor(plan: PlanSummary) -> str:
+    raw = f"{plan.updated_at.isoformat()}|{plan.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, PydanticObjectId]:
+    try:
+        updated_at, plan_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(updated_at), PydanticObjectId(plan_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/", response_model=List[PlanSummary])
+async def list_user_plans(
+    response: Response,
+    limit: int = Query(PLAN_PAGE_SIZE, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    current_user: User = Depends(get_current_user)
+):
+    """List the current user's plans, most recently updated first, one page at a time."""
+    # Keyset pagination: strictly after the last (updated_at, _id) of the previous page
+    after = decode_cursor(cursor) if cursor else None
+    plans = await get_storage().plans.list_summaries(current_user.id, limit + 1, after=after)
+    if len(plans) > limit:
+        plans = plans[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(plans[-1])
     return plans
 
 @router.get("/{plan_id}")
 async def get_plan_details(plan_id: PydanticObjectId, current_user: User = Depends(get_current_user)):
-    """Get a specific plan and its chat history."""
-    plan = await Plan.find_one(Plan.id == plan_id, Plan.user_id == current_user.id)
+    """Get a specific plan and the latest page of its chat history."""
+    storage = get_storage()
+    plan = await storage.plans.get(plan_id, current_user.id)
     if not plan:
         raise HTTPException(status_code=404, detail="Plan not found")
         
     # Fetch associated chat session
-    chat_session = await ChatSession.find_one(ChatSession.plan_id == plan.id)
+    chat_session = await storage.chats.get_session(plan.id)
+    if not chat_session:
+        return {"plan": plan, "chat_history": [], "history_cursor": None}
+
+    messages, cursor = await storage.chats.get_messages(chat_session.id)
     
     return {
         "plan": plan,
-        "chat_history": chat_session.messages if chat_session else []
+        "chat_history": messages,
+        "history_cursor": cursor
     }
 
+@router.get("/{plan_id}/messages")
+async def get_plan_messages(
+    plan_id: PydanticObjectId,
+    before: Optional[int] = Query(None, description="Cursor from a previous page: return messages older than this"),
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=200),
+    current_user: User = Depends(get_current_user)
+):
+    """Page backwards through a plan's chat history."""
+    storage = get_storage()
+    plan = await storage.plans.get(plan_id, current_user.id)
+    if not plan:
+        raise HTTPException(status_code=404, detail="Plan not found")
+
+    chat_session = await storage.chats.get_session(plan.id)
+    if not chat_session:
+        return {"messages": [], "next_cursor": None}
+
+    messages, cursor = await storage.chats.get_messages(chat_session.id, limit=limit, before=before)
+    return {"messages": messages, "next_cursor": cursor}
+
 @router.delete("/{plan_id}")
 async def delete_plan(plan_id: PydanticObjectId, current_user: User = Depends(get_current_user)):
     """Delete a plan and its associated chat session."""
-    plan = await Plan.find_one(Plan.id == plan_id, Plan.user_id == current_user.id)
+    storage = get_storage()
+    plan = await storage.plans.get(plan_id, current_user.id)
     if not plan:
         raise HTTPException(status_code=404, detail="Plan not found")
     
-    # Delete associated chat session
-    await ChatSession.find_many(ChatSession.plan_id == plan.id).delete()
+    # Delete associated chat session and its messages
+    await storage.chats.delete_for_plan(plan.id)
     
     # Delete the plan
-    await plan.delete()
+    await storage.plans.delete(plan)
     
     return {"message": "Plan deleted successfully"}
@@ -0,0 +1,76 @@
+"""
+Benchmark: persisting one chat message with save() vs. the message store.
+
+save() rewrites the whole embedded messages array, so its cost grows with
+history length; core.chat_store.append_message only sends the new message.
+Requires MONGODB_URL and uses a throwaway database that is dropped afterwards.
+
+Usage (from backend/):
+    python -m benchmarks.bench_chat_writes --lengths 10,100,1000 --repeat 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import datetime
+
+from beanie import PydanticObjectId
+
+from benchmarks.common import bench_database
+from models import ChatSession
+from core.chat_store import append_message, migrate_session
+
+
+def make_message(i):
+    return {
+        "role": "user" if i % 2 == 0 else "assistant",
+        "content": "Please outline the discovery schedule and the meet-and-confer obligations. " * 4,
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+
+
+async def time_writes(write, repeat):
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        await write(i)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+async def run(lengths, repeat):
+    async with bench_database():
+        print(f"{'history':>8} | {'save() ms':>10} | {'append ms':>10}")
+        print("-" * 36)
+        for length in lengths:
+            history = [make_message(i) for i in range(length)]
+
+            saved = ChatSession(plan_id=PydanticObjectId(), user_id=PydanticObjectId(), messages=list(history))
+            await saved.insert()
+
+            async def save_write(i):
+                saved.messages.append(make_message(i))
+                await saved.save()
+
+            pushed = ChatSession(plan_id=PydanticObjectId(), user_id=PydanticObjectId(), messages=list(history))
+            await pushed.insert()
+            await migrate_session(pushed)
+
+            async def push_write(i):
+                await append_message(pushed, make_message(i))
+
+            save_ms = await time_writes(save_write, repeat)
+            push_ms = await time_writes(push_write, repeat)
+            print(f"{length:>8} | {save_ms:>10.2f} | {push_ms:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", default="10,100,1000", help="Comma-separated history lengths")
+    parser.add_argument("--repeat", type=int, default=20, help="Writes per measurement")
+    args = parser.parse_args()
+    asyncio.run(run([int(n) for n in args.lengths.split(",")], args.repeat))
+
+
+if __name__ == "__main__":
+    main()
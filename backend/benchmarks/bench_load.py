@@ -0,0 +1,299 @@
+"""
+Benchmark: end-to-end load test of the auth, chat and plan APIs.
+
+Starts benchmarks.load_server (mock LLM, in-memory storage) in a
+subprocess, registers --users accounts, then runs every simulated user
+concurrently:
+
+    POST /api/auth/token
+    --turns x POST /api/chat   (first turn creates a plan; later turns continue it)
+    GET /api/plans/ and GET /api/plans/{id}
+
+Chats are read as a stream over real HTTP, so time to first token is what a
+client sees. Reports p50/p95/p99 latency per endpoint, time to first token,
+throughput and peak memory (server peak RSS from /proc; client peak RSS),
+and writes everything to --output as JSON. --baseline compares against an
+earlier output file.
+
+Usage (from backend/):
+    python -m benchmarks.bench_load --users 50 --turns 3 --output load.json
+    python -m benchmarks.bench_load --users 50 --baseline load.json
+    python -m benchmarks.bench_load --base-url http://localhost:8000   # an already running server
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from benchmarks.common import summarize_ms
+
+BACKEND_DIR = Path(__file__).parent.parent
+PASSWORD = "loadtest-password"
+
+
+class Recorder:
+    """Latencies and status codes per endpoint, plus chat stream timings."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.ttft = []
+        self.events = 0
+
+    def record(self, endpoint, started, status):
+        self.latencies[endpoint].append((time.perf_counter() - started) * 1000)
+        self.statuses[endpoint][str(status)] += 1
+
+    def summary(self):
+        endpoints = {}
+        for endpoint, samples in self.latencies.items():
+            statuses = dict(self.statuses[endpoint])
+            errors = sum(n for status, n in statuses.items() if not status.startswith("2"))
+            endpoints[endpoint] = {"requests": len(samples), "errors": errors, "statuses": statuses, **summarize_ms(samples)}
+        return endpoints
+
+
+async def request_with_retry(client, recorder, endpoint, method, url, max_attempts=5, **kwargs):
+    """One logical request; 429s are retried after Retry-After like a well-behaved client."""
+    for _ in range(max_attempts):
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        recorder.record(endpoint, started, response.status_code)
+        if response.status_code != 429:
+            return response
+        await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+    return response
+
+
+async def chat_turn(client, recorder, headers, message, plan_id):
+    body = {"message": message}
+    if plan_id:
+        body["plan_id"] = plan_id
+    started = time.perf_counter()
+    first_token = None
+    status = None
+    try:
+        async with client.stream("POST", "/api/chat", json=body, headers=headers) as response:
+            status = response.status_code
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                recorder.events += 1
+                if event["type"] == "meta":
+                    plan_id = event["plan_id"]
+                elif first_token is None and event["type"] in ("text", "tool_chunk"):
+                    first_token = time.perf_counter()
+                    recorder.ttft.append((first_token - started) * 1000)
+                elif event["type"] == "error":
+                    status = "stream_error"
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    recorder.record("chat", started, status)
+    return plan_id
+
+
+async def simulated_user(client, recorder, index, turns, think_s):
+    email = f"load{index}@example.com"
+    response = await request_with_retry(
+        client, recorder, "auth_token", "POST", "/api/auth/token",
+        data={"username": email, "password": PASSWORD},
+    )
+    if response.status_code != 200:
+        return
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    plan_id = None
+    for turn in range(turns):
+        # Distinct prompts, so the response cache does not answer them
+        plan_id = await chat_turn(client, recorder, headers, f"User {index}, turn {turn}: plan a motion to dismiss", plan_id)
+        await asyncio.sleep(think_s)
+
+    started = time.perf_counter()
+    response = await client.get("/api/plans/", headers=headers)
+    recorder.record("plans_list", started, response.status_code)
+    if plan_id:
+        started = time.perf_counter()
+        response = await client.get(f"/api/plans/{plan_id}", headers=headers)
+        recorder.record("plan_detail", started, response.status_code)
+
+
+async def register_users(client, users):
+    """Create the accounts up front (not measured), a few at a time to stay within hash admission."""
+    semaphore = asyncio.Semaphore(4)
+
+    async def register(index):
+        async with semaphore:
+            for _ in range(10):
+                response = await client.post("/api/auth/register", json={"email": f"load{index}@example.com", "password": PASSWORD})
+                if response.status_code != 429:
+                    return
+                await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+
+    await asyncio.gather(*(register(i) for i in range(users)))
+
+
+def start_server(port, env_overrides):
+    env = {**os.environ, **env_overrides}
+    return subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.load_server", "--port", str(port)],
+        cwd=BACKEND_DIR, env=env,
+    )
+
+
+async def wait_until_ready(client, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    sys.exit("load server did not start")
+
+
+def peak_rss_mb(pid):
+    """Peak resident memory of a process (Linux /proc), or None where unavailable."""
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args):
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server = start_server(args.port, {
+            "MOCK_LLM_TOKENS_PER_SECOND": str(args.tokens_per_second),
+            "MOCK_LLM_TTFT_MS": str(args.ttft_ms),
+            "BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+        })
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+            await wait_until_ready(client)
+            await register_users(client, args.users)
+
+            recorder = Recorder()
+            started = time.perf_counter()
+
+            async def ramped(index):
+                await asyncio.sleep(args.ramp_seconds * index / max(args.users, 1))
+                await simulated_user(client, recorder, index, args.turns, args.think_ms / 1000)
+
+            await asyncio.gather(*(ramped(i) for i in range(args.users)))
+            duration = time.perf_counter() - started
+    finally:
+        server_rss = peak_rss_mb(server.pid) if server else None
+        if server:
+            server.terminate()
+            server.wait()
+
+    endpoints = recorder.summary()
+    total_requests = sum(e["requests"] for e in endpoints.values())
+    chat_turns = endpoints.get("chat", {}).get("requests", 0)
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "duration_s": duration,
+        "endpoints": endpoints,
+        "chat": {
+            "ttft_ms": summarize_ms(recorder.ttft) if recorder.ttft else None,
+            "turns_per_s": chat_turns / duration,
+            "events_per_s": recorder.events / duration,
+        },
+        "throughput_rps": total_requests / duration,
+        "memory": {
+            "server_peak_rss_mb": server_rss,
+            "client_peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        },
+    }
+
+
+def print_report(result, baseline=None):
+    def delta(current, previous):
+        if previous in (None, 0) or current is None:
+            return ""
+        return f" ({(current - previous) / previous * 100:+.0f}%)"
+
+    base_endpoints = (baseline or {}).get("endpoints", {})
+    header = f"{'endpoint':<12} | {'requests':>8} | {'errors':>6} | {'p50 ms':>8} | {'p95 ms':>16} | {'p99 ms':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, stats in result["endpoints"].items():
+        previous = base_endpoints.get(name, {}).get("p95")
+        print(
+            f"{name:<12} | {stats['requests']:>8} | {stats['errors']:>6} | {stats['p50']:>8.1f} | "
+            f"{stats['p95']:>8.1f}{delta(stats['p95'], previous):<8} | {stats['p99']:>8.1f}"
+        )
+
+    chat = result["chat"]
+    if chat["ttft_ms"]:
+        previous = ((baseline or {}).get("chat") or {}).get("ttft_ms") or {}
+        ttft = chat["ttft_ms"]
+        print(f"\ntime to first token ms: p50 {ttft['p50']:.1f}  p95 {ttft['p95']:.1f}{delta(ttft['p95'], previous.get('p95'))}  p99 {ttft['p99']:.1f}")
+    print(
+        f"throughput: {result['throughput_rps']:.1f} req/s{delta(result['throughput_rps'], (baseline or {}).get('throughput_rps'))}, "
+        f"{chat['turns_per_s']:.2f} chat turns/s, {chat['events_per_s']:.0f} stream events/s"
+    )
+    memory = result["memory"]
+    server_rss = memory["server_peak_rss_mb"]
+    previous_rss = ((baseline or {}).get("memory") or {}).get("server_peak_rss_mb")
+    print(
+        f"peak memory: server {server_rss:.0f} MB{delta(server_rss, previous_rss)}" if server_rss is not None else "peak memory: server n/a",
+        f"| client {memory['client_peak_rss_mb']:.0f} MB",
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50, help="Concurrent simulated users")
+    parser.add_argument("--turns", type=int, default=3, help="Chat turns per user")
+    parser.add_argument("--ramp-seconds", type=float, default=2.0, help="Spread user start times over this many seconds")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Pause between a user's chat turns")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="Mock LLM output rate")
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="Mock LLM time to first token")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--port", type=int, default=8765, help="Port for the load server")
+    parser.add_argument("--base-url", help="Test an already running server instead of starting the load server")
+    parser.add_argument("--output", default="load_results.json", help="Where to write the JSON results")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    print_report(result, baseline)
+    Path(args.output).write_text(json.dumps(result, indent=2))
+    print(f"\nresults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark: patch_plan vs. full manage_plan rewrites for small edits.
+
+For plans of increasing size, flips one step's status and compares
+  - output tokens the model has to generate for the tool call,
+  - turn latency when streaming those tokens through stream_chat
+    (MockProvider paced at --tokens-per-second, gpt-4o is roughly 50-100),
+  - bytes sent to MongoDB for the resulting write.
+
+Usage (from backend/):
+    python -m benchmarks.bench_plan_patch --tokens-per-second 80
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+import bson
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.context import count_tokens
+from core.llm import stream_chat
+from core.plan_patch import apply_plan_patch, plan_patch_writes
+from core.providers import MockProvider
+import core.llm
+
+
+def make_plan(n_steps):
+    return {
+        "title": "Motion for Summary Judgment Strategy",
+        "steps": [
+            {
+                "id": str(i),
+                "title": f"Step {i}: Draft supporting declaration",
+                "description": "Collect exhibits and prepare a declaration addressing each undisputed fact; due 30 days after service.",
+                "status": "pending",
+            }
+            for i in range(1, n_steps + 1)
+        ],
+    }
+
+
+class ToolOnlyProvider(MockProvider):
+    """Streams a single fixed tool call with no text."""
+    def __init__(self, name, args, tokens_per_second):
+        super().__init__(tokens_per_second=tokens_per_second, ttft_ms=0, text="")
+        self.call = (name, args)
+
+    def build_tool_call(self, messages):
+        return self.call
+
+
+async def timed_turn(name, args, tokens_per_second):
+    provider = ToolOnlyProvider(name, args, tokens_per_second)
+    original = core.llm.get_provider
+    core.llm.get_provider = lambda: provider
+    try:
+        start = time.perf_counter()
+        async for _ in stream_chat([{"role": "user", "content": "Mark step 2 done"}], use_cache=False):
+            pass
+        return time.perf_counter() - start
+    finally:
+        core.llm.get_provider = original
+
+
+async def run(sizes, tokens_per_second):
+    rows = []
+    for n in sizes:
+        plan = make_plan(n)
+        operations = [{"op": "update", "id": "2", "step": {"status": "done"}}]
+
+        rewrite = {"title": plan["title"], "steps": apply_plan_patch(plan["steps"], operations)}
+        patch_args = {"operations": operations}
+
+        rewrite_json = json.dumps(rewrite)
+        patch_json = json.dumps(patch_args)
+
+        rewrite_bytes = len(bson.encode({"$set": rewrite}))
+        patch_bytes = sum(len(bson.encode(w._doc)) for w in plan_patch_writes({"_id": 1}, plan["steps"], operations))
+
+        rows.append({
+            "steps": n,
+            "rewrite_tokens": count_tokens(rewrite_json),
+            "patch_tokens": count_tokens(patch_json),
+            "rewrite_latency_s": await timed_turn("manage_plan", rewrite, tokens_per_second),
+            "patch_latency_s": await timed_turn("patch_plan", patch_args, tokens_per_second),
+            "rewrite_write_bytes": rewrite_bytes,
+            "patch_write_bytes": patch_bytes,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="5,10,20,40", help="Comma-separated plan sizes")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    rows = asyncio.run(run(sizes, args.tokens_per_second))
+
+    header = f"{'steps':>5} | {'out tokens (rewrite/patch)':>26} | {'turn latency s (rewrite/patch)':>30} | {'write bytes (rewrite/patch)':>27}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(
+            f"{r['steps']:>5} | {r['rewrite_tokens']:>12} / {r['patch_tokens']:<11} | "
+            f"{r['rewrite_latency_s']:>14.2f} / {r['patch_latency_s']:<13.2f} | "
+            f"{r['rewrite_write_bytes']:>13} / {r['patch_write_bytes']:<11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Benchmark: prompt layout and plan encoding vs. provider prefix caching.
+
+Replays a conversation in which the plan grows and changes every turn, and
+builds each turn's prompt two ways:
+  - legacy: plan as indented JSON appended to the system prompt, older turns
+    condensed one message per turn,
+  - current: static system prompt first, compact plan just before the newest
+    message, older turns condensed LLM_CONTEXT_CONDENSE_STEP at a time.
+
+For every turn it reports prompt tokens, the tokens a prefix cache could
+reuse from the previous turn's prompt (OpenAI caches prompts of at least
+1024 tokens, in 128-token increments) and an estimated time to first token:
+--base-ttft-ms plus uncached tokens at --prefill-tokens-per-second. Tool
+schemas precede the messages and are counted as part of the prefix. Token
+counts use tiktoken, or ~4 characters per token when its encoding cannot be
+loaded (offline, without a TIKTOKEN_CACHE_DIR holding it).
+
+Usage (from backend/):
+    python -m benchmarks.bench_prompt_layout --turns 20 --prefill-tokens-per-second 4000
+"""
+import argparse
+import json
+import statistics
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.context import MESSAGE_OVERHEAD, build_context, count_tokens, format_plan
+from core.llm import SYSTEM_PROMPT, TOOLS
+from core.providers import MOCK_RESPONSE, MOCK_STEPS
+
+CACHE_MIN_TOKENS = 1024
+CACHE_INCREMENT = 128
+
+
+def legacy_context(plan, history):
+    system = SYSTEM_PROMPT + f"\n\nCURRENT PLAN CONTENT:\n{json.dumps(plan, indent=2)}\n"
+    with patch("core.context.CONDENSE_STEP", 1):  # the recap used to slide by one message per turn
+        messages, _ = build_context(system, "", history, budget=10 ** 6)
+    return messages
+
+
+def current_context(plan, history):
+    messages, _ = build_context(SYSTEM_PROMPT, format_plan(plan), history, budget=10 ** 6)
+    return messages
+
+
+def serialize(messages):
+    """Prompt text in the order the provider sees it: tools, then messages."""
+    return json.dumps(TOOLS) + "".join(f"<|{m['role']}|>{m['content']}<|end|>" for m in messages)
+
+
+def prompt_tokens(messages):
+    return count_tokens(json.dumps(TOOLS)) + sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD for m in messages)
+
+
+def cached_tokens(previous, current):
+    """Tokens of the shared prefix a provider cache could reuse."""
+    if previous is None:
+        return 0
+    a, b = serialize(previous), serialize(current)
+    shared = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        shared += 1
+    tokens = count_tokens(a[:shared])
+    if tokens < CACHE_MIN_TOKENS:
+        return 0
+    return CACHE_MIN_TOKENS + (tokens - CACHE_MIN_TOKENS) // CACHE_INCREMENT * CACHE_INCREMENT
+
+
+def conversation(turns):
+    """(plan, history) before each turn: one step added or completed per turn."""
+    plan = {"title": "Motion for Summary Judgment Strategy", "steps": []}
+    history = []
+    for turn in range(turns):
+        history = history + [{"role": "user", "content": f"Turn {turn}: what should we do next on the motion?"}]
+        yield json.loads(json.dumps(plan)), history
+        history = history + [{"role": "assistant", "content": MOCK_RESPONSE}]
+        if turn % 3 == 2 and plan["steps"]:
+            plan["steps"][turn % len(plan["steps"])]["status"] = "done"
+        else:
+            title, description = MOCK_STEPS[len(plan["steps"]) % len(MOCK_STEPS)]
+            plan["steps"].append({
+                "id": str(len(plan["steps"]) + 1),
+                "title": title,
+                "description": description,
+                "status": "pending",
+            })
+
+
+def measure(layout, turns, base_ttft_ms, prefill_tps):
+    rows = []
+    previous = None
+    for plan, history in conversation(turns):
+        messages = layout(plan, history)
+        total = prompt_tokens(messages)
+        cached = min(cached_tokens(previous, messages), total)
+        uncached = total - cached
+        rows.append({
+            "prompt": total,
+            "cached": cached,
+            "uncached": uncached,
+            "ttft_ms": base_ttft_ms + uncached / prefill_tps * 1000,
+        })
+        previous = messages
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--base-ttft-ms", type=float, default=250.0, help="Time to first token with a fully cached prompt")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=4000.0, help="Prompt processing rate for uncached tokens")
+    args = parser.parse_args()
+
+    results = {
+        name: measure(layout, args.turns, args.base_ttft_ms, args.prefill_tokens_per_second)
+        for name, layout in (("legacy", legacy_context), ("current", current_context))
+    }
+
+    header = f"{'layout':>8} | {'prompt tok/turn':>15} | {'cached tok/turn':>15} | {'uncached tok/turn':>17} | {'est. TTFT ms':>12}"
+    print(header)
+    print("-" * len(header))
+    for name, rows in results.items():
+        print(
+            f"{name:>8} | {statistics.mean(r['prompt'] for r in rows):>15.0f} | "
+            f"{statistics.mean(r['cached'] for r in rows):>15.0f} | "
+            f"{statistics.mean(r['uncached'] for r in rows):>17.0f} | "
+            f"{statistics.mean(r['ttft_ms'] for r in rows):>12.0f}"
+        )
+
+    legacy, current = results["legacy"], results["current"]
+    saved_tokens = statistics.mean(l["uncached"] - c["uncached"] for l, c in zip(legacy, current))
+    saved_ms = statistics.mean(l["ttft_ms"] - c["ttft_ms"] for l, c in zip(legacy, current))
+    print(f"\nper turn: {saved_tokens:.0f} fewer uncached prompt tokens, ~{saved_ms:.0f} ms earlier first token")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark: per-chunk overhead of the chat stream pipeline on long responses.
+
+Compares the previous string pipeline (stream_chat json.dumps each delta,
+save_and_stream json.loads it back and concatenates strings) with typed
+events (one object per delta, list-join accumulation, a single encode at the
+HTTP edge). Upstream chunks are pre-built so only our own overhead is timed.
+
+Usage (from backend/):
+    python -m benchmarks.bench_stream_events --chunks 500,5000,20000
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.events import TextDelta, ToolCallDelta, TurnAccumulator, encode_stream
+from core.providers import MockProvider, split_fragments, split_tokens
+
+
+def make_deltas(n_chunks):
+    """Roughly 80% text tokens followed by manage_plan argument fragments."""
+    n_text = int(n_chunks * 0.8)
+    tokens = split_tokens("Serve opposing counsel and calendar the opposition deadline. " * (n_text // 8 + 1))[:n_text]
+    arguments = json.dumps(MockProvider().build_plan([{"role": "user", "content": "Motion to dismiss"}]))
+    fragments = (split_fragments(arguments) * (n_chunks // 10 + 1))[:n_chunks - n_text]
+    return [("text", t) for t in tokens] + [("tool", f) for f in fragments]
+
+
+async def legacy_pipeline(deltas):
+    async def producer():
+        for kind, content in deltas:
+            if kind == "tool":
+                yield json.dumps({"type": "tool_chunk", "content": content}) + "\n"
+            else:
+                yield json.dumps({"type": "text", "content": content}) + "\n"
+
+    ai_content = ""
+    tool_call_args = ""
+
+    async def accumulate():
+        nonlocal ai_content, tool_call_args
+        async for chunk_str in producer():
+            yield chunk_str
+            try:
+                chunk = json.loads(chunk_str)
+                if chunk["type"] == "text":
+                    ai_content += chunk["content"]
+                elif chunk["type"] == "tool_chunk":
+                    tool_call_args += chunk["content"]
+            except Exception:
+                pass
+
+    sent = 0
+    async for line in accumulate():
+        sent += len(line.encode())
+    return sent, len(ai_content) + len(tool_call_args)
+
+
+async def event_pipeline(deltas):
+    async def producer():
+        for kind, content in deltas:
+            yield ToolCallDelta(content) if kind == "tool" else TextDelta(content)
+
+    turn = TurnAccumulator()
+
+    async def accumulate():
+        async for event in producer():
+            yield event
+            turn.add(event)
+
+    sent = 0
+    async for line in encode_stream(accumulate()):
+        sent += len(line)
+    return sent, len(turn.text) + sum(len(call.arguments) for call in turn.calls)
+
+
+async def best_of(pipeline, deltas, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        await pipeline(deltas)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+async def run(sizes, repeats):
+    print(f"{'chunks':>7} | {'strings us/chunk':>16} | {'events us/chunk':>15} | {'speedup':>7}")
+    print("-" * 56)
+    for n in sizes:
+        deltas = make_deltas(n)
+        legacy = await best_of(legacy_pipeline, deltas, repeats)
+        typed = await best_of(event_pipeline, deltas, repeats)
+        print(f"{n:>7} | {legacy / n * 1e6:>16.2f} | {typed / n * 1e6:>15.2f} | {legacy / typed:>6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", default="500,5000,20000", help="Comma-separated response lengths in chunks")
+    parser.add_argument("--repeats", type=int, default=5, help="Runs per measurement (best is reported)")
+    args = parser.parse_args()
+    asyncio.run(run([int(n) for n in args.chunks.split(",")], args.repeats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark: /api/auth/me and /api/plans/ latency with and without the user cache.
+
+Every authenticated request resolves the JWT subject to a User. With the
+cache enabled that lookup is served in-process after the first request.
+Requires MONGODB_URL; uses a throwaway database.
+
+Usage (from backend/):
+    python -m benchmarks.bench_user_cache --requests 200
+"""
+import argparse
+import asyncio
+import time
+
+from httpx import AsyncClient, ASGITransport
+
+from benchmarks.common import bench_database, summarize_ms
+from core.cache import user_cache
+from main import app
+
+
+async def measure(client, path, headers, requests):
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = await client.get(path, headers=headers)
+        samples.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+    return summarize_ms(samples)
+
+
+async def run(requests):
+    async with bench_database():
+        # The lifespan would connect to the configured database; the bench DB is already initialised.
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+            credentials = {"email": "bench@example.com", "password": "password123"}
+            await client.post("/api/auth/register", json=credentials)
+            token = (await client.post("/api/auth/token", data={
+                "username": credentials["email"], "password": credentials["password"]
+            })).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+
+            ttl = user_cache.ttl
+            print(f"{'endpoint':<14} | {'cache':<5} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8}")
+            print("-" * 56)
+            for path in ("/api/auth/me", "/api/plans/"):
+                for enabled in (False, True):
+                    user_cache.clear()
+                    user_cache.ttl = ttl if enabled else 0
+                    stats = await measure(client, path, headers, requests)
+                    label = "on" if enabled else "off"
+                    print(f"{path:<14} | {label:<5} | {stats['p50']:>8.2f} | {stats['p95']:>8.2f} | {stats['p99']:>8.2f}")
+            user_cache.ttl = ttl
+            print(f"\ncache stats: {user_cache.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per measurement")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests))
+
+
+if __name__ == "__main__":
+    main()
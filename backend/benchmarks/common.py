@@ -0,0 +1,51 @@
+"""Shared helpers for benchmark scripts."""
+import os
+import statistics
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import certifi
+from beanie import init_beanie
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from models import User, Plan, ChatSession, ChatMessage
+
+BENCH_DB = "legal_lens_bench"
+
+
+@asynccontextmanager
+async def bench_database():
+    """Initialise Beanie on a throwaway database (MONGODB_URL) and drop it afterwards."""
+    load_dotenv()
+    mongodb_url = os.getenv("MONGODB_URL")
+    if not mongodb_url:
+        sys.exit("MONGODB_URL is not set")
+
+    client = AsyncIOMotorClient(mongodb_url.strip().strip('"').strip("'"), tlsCAFile=certifi.where())
+    await init_beanie(database=client.get_database(BENCH_DB), document_models=[User, Plan, ChatSession, ChatMessage])
+    try:
+        yield client
+    finally:
+        await client.drop_database(BENCH_DB)
+        client.close()
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize_ms(samples):
+    return {
+        "p50": statistics.median(samples),
+        "p95": percentile(samples, 95),
+        "p99": percentile(samples, 99),
+    }
@@ -0,0 +1,54 @@
+"""
+Run the API against local stand-ins for load tests.
+
+The LLM is the MockProvider (LLM_PROVIDER=mock, paced by
+MOCK_LLM_TOKENS_PER_SECOND and MOCK_LLM_TTFT_MS). Storage is the in-memory
+backend (STORAGE_BACKEND=memory), or MongoDB when MONGODB_URL is set, using
+the throwaway database legal_lens_load (emptied on startup).
+
+Auth rate limits are lifted because every simulated user shares one client
+address; password hashing admission (HASH_MAX_IN_FLIGHT) stays as configured.
+
+Usage (from backend/; started by bench_load unless it is given --base-url):
+    python -m benchmarks.load_server --port 8765
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+LOAD_DB = "legal_lens_load"
+
+os.environ.setdefault("LLM_PROVIDER", "mock")
+os.environ.setdefault("AUTH_RATE_LIMIT_IP", "1000000/1")
+os.environ.setdefault("AUTH_RATE_LIMIT_ACCOUNT", "1000000/1")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ["DATABASE_NAME"] = LOAD_DB
+os.environ.setdefault("STORAGE_BACKEND", "mongo" if os.getenv("MONGODB_URL") else "memory")
+
+import uvicorn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    import main as app_module
+    connect = app_module.init_db
+
+    async def init_db():
+        client = await connect()
+        await client.drop_database(LOAD_DB)
+        return client
+
+    # With STORAGE_BACKEND=mongo, main's lifespan connects through init_db; start from an empty database
+    app_module.init_db = init_db
+    uvicorn.run(app_module.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,8 +11,8 @@ load_dotenv(os.path.join(os.getcwd(), "backend", ".env"))
 
 async def verify():
     try:
-        from core.database import init_db
-        from models import User, Plan
+        from core.database import init_db, DATABASE_NAME
+        from models import User, Plan, ChatSession, ChatMessage
         print("Imports successful.")
         
         print("Attempting to connect to MongoDB...")
@@ -25,7 +25,7 @@ async def verify():
         
         # Initialize Beanie (optional for this check but good practice)
         from beanie import init_beanie
-        await init_beanie(database=client.get_database("legal_lens"), document_models=[User, Plan])
+        await init_beanie(database=client.get_database(DATABASE_NAME), document_models=[User, Plan, ChatSession, ChatMessage])
         print("Beanie initialization successful.")
         
     except ImportError as e:
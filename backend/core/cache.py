@@ -0,0 +1,140 @@
+"""
+Small in-process caches.
+
+TTLCache is a bounded LRU map whose entries also expire after a fixed time
+to live. It is not shared between worker processes, so the TTL bounds how
+stale an entry can get when another worker changes the underlying data.
+Besides an entry count, it can bound the total weight of its entries (e.g.
+their size in bytes) when values vary a lot in size.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from core.metrics import CounterFunction
+
+
+class TTLCache:
+    """Bounded LRU cache with per-entry expiry and hit/miss counters."""
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+        max_weight: float = 0,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.max_weight = max_weight  # 0 = bounded by entry count only
+        self.weight = 0.0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at, _ = entry
+        if expires_at <= self.clock():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, weight: float = 1) -> None:
+        if not self.enabled:
+            return
+        # Drop the old value even when the new one is too large to keep, so it is never served stale
+        self._remove(key)
+        if self.max_weight and weight > self.max_weight:
+            return
+        self._data[key] = (value, self.clock() + self.ttl, weight)
+        self.weight += weight
+        while len(self._data) > self.maxsize or (self.max_weight and self.weight > self.max_weight):
+            _, (_, _, evicted_weight) = self._data.popitem(last=False)
+            self.weight -= evicted_weight
+            self.evictions += 1
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.weight -= entry[2]
+
+    def invalidate(self, key: Hashable) -> None:
+        self._remove(key)
+
+    def invalidate_values(self, predicate: Callable[[Any], bool]) -> None:
+        for key in [k for k, (value, _, _) in self._data.items() if predicate(value)]:
+            self._remove(key)
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.weight = 0.0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "weight": self.weight,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Authenticated users keyed by token subject (email); see api.auth.get_current_user.
+# USER_CACHE_TTL_SECONDS=0 disables it.
+user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_MAX_ENTRIES", "1024")),
+    ttl=float(os.getenv("USER_CACHE_TTL_SECONDS", "60")),
+)
+
+
+# Complete chat turns keyed by prompt (see core.llm.response_cache_key), weighed in bytes.
+# LLM_RESPONSE_CACHE_TTL_SECONDS=0 disables it.
+response_cache = TTLCache(
+    maxsize=int(os.getenv("LLM_RESPONSE_CACHE_MAX_ENTRIES", "10000")),
+    ttl=float(os.getenv("LLM_RESPONSE_CACHE_TTL_SECONDS", "3600")),
+    max_weight=int(os.getenv("LLM_RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+)
+
+
+_caches = {"user": user_cache, "response": response_cache}
+
+cache_lookups = CounterFunction(
+    "cache_lookups_total",
+    "In-process cache lookups by cache and result (hit or miss)",
+    lambda: [
+        sample
+        for name, cache in _caches.items()
+        for sample in (({"cache": name, "result": "hit"}, cache.hits), ({"cache": name, "result": "miss"}, cache.misses))
+    ],
+)
+
+cache_evictions = CounterFunction(
+    "cache_evictions_total",
+    "Entries evicted from in-process caches to stay within their size bounds",
+    lambda: [({"cache": name}, cache.evictions) for name, cache in _caches.items()],
+)
+
+
+def invalidate_user(user) -> None:
+    """Drop a user from the cache, including entries cached under a previous email."""
+    user_cache.invalidate(user.email)
+    user_cache.invalidate_values(lambda cached: cached.id == user.id)
@@ -0,0 +1,169 @@
+"""
+Chat history stored as one ChatMessage document per message.
+
+Messages are keyed by (session_id, seq). ChatSession.message_count is the
+sequence allocator: appends $inc it and insert the message under the new
+value, so history reads are index range scans instead of loading one
+ever-growing document.
+
+Sessions created before this store keep their history in the embedded
+ChatSession.messages array. migrate_session moves it over; it runs lazily
+whenever a session is loaded and in bulk via migrations/migrate_chat_messages.py.
+
+store_messages is the batch path used by write-behind storage: messages arrive
+with their seq already allocated and are inserted in one bulk write.
+"""
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from beanie import PydanticObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from models import ChatMessage, ChatSession
+
+# Messages returned with a plan and per history page
+HISTORY_PAGE_SIZE = int(os.getenv("CHAT_HISTORY_PAGE_SIZE", "50"))
+# Newest messages loaded to build the prompt (older turns are condensed anyway)
+PROMPT_HISTORY_MESSAGES = int(os.getenv("LLM_HISTORY_MESSAGES", "100"))
+
+MESSAGE_FIELDS = {"seq", "role", "content", "tool_calls", "truncated", "timestamp"}
+
+
+class ChatSessionGone(LookupError):
+    """The session was deleted (with its plan) before a message could be appended."""
+
+
+def to_dict(message: ChatMessage) -> Dict[str, Any]:
+    return message.model_dump(include=MESSAGE_FIELDS, exclude_none=True)
+
+
+async def migrate_session(chat_session: ChatSession) -> int:
+    """Move a session's embedded messages into chat_messages. Returns how many were moved."""
+    legacy = chat_session.messages
+    if not legacy:
+        return 0
+
+    collection = ChatSession.get_motor_collection()
+    # Reserve seq 1..n first so concurrent appends land after the legacy history
+    await collection.update_one({"_id": chat_session.id}, {"$max": {"message_count": len(legacy)}})
+
+    documents = [
+        ChatMessage(
+            session_id=chat_session.id,
+            plan_id=chat_session.plan_id,
+            seq=seq,
+            role=m.get("role"),
+            content=m.get("content") or "",
+            tool_calls=m.get("tool_calls"),
+            timestamp=m.get("timestamp") or chat_session.created_at.isoformat(),
+        )
+        for seq, m in enumerate(legacy, start=1)
+    ]
+    try:
+        await ChatMessage.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        # Another request (or an interrupted run) already moved some of them
+        if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+            raise
+
+    await collection.update_one({"_id": chat_session.id}, {"$unset": {"messages": ""}})
+    chat_session.message_count = max(chat_session.message_count, len(legacy))
+    chat_session.messages = []
+    return len(legacy)
+
+
+async def next_seq(session_id: PydanticObjectId, updated_at: datetime) -> int:
+    """Allocate the session's next message seq. Raises ChatSessionGone if it was deleted."""
+    result = await ChatSession.get_motor_collection().find_one_and_update(
+        {"_id": session_id},
+        {"$inc": {"message_count": 1}, "$set": {"updated_at": updated_at}},
+        projection={"message_count": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if result is None:
+        raise ChatSessionGone(f"Chat session {session_id} no longer exists")
+    return result["message_count"]
+
+
+async def append_message(chat_session: ChatSession, message: Dict[str, Any]) -> ChatMessage:
+    """Allocate the next seq for the session and store the message under it."""
+    chat_session.updated_at = datetime.utcnow()
+    chat_session.message_count = await next_seq(chat_session.id, chat_session.updated_at)
+
+    stored = ChatMessage(
+        session_id=chat_session.id,
+        plan_id=chat_session.plan_id,
+        seq=chat_session.message_count,
+        **{k: v for k, v in message.items() if k in MESSAGE_FIELDS - {"seq"}},
+    )
+    await stored.insert()
+    return stored
+
+
+async def get_messages(
+    session_id: PydanticObjectId,
+    limit: int = HISTORY_PAGE_SIZE,
+    before: Optional[int] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    Return up to `limit` messages older than seq `before` (newest page when
+    omitted), oldest first, plus the cursor for the next older page.
+    """
+    query = {"session_id": session_id}
+    if before is not None:
+        query["seq"] = {"$lt": before}
+
+    page = await ChatMessage.find(query).sort("-seq").limit(limit + 1).to_list()
+    has_more = len(page) > limit
+    page = page[:limit]
+    page.reverse()
+
+    next_cursor = page[0].seq if has_more and page else None
+    return [to_dict(m) for m in page], next_cursor
+
+
+async def _is_stored(message: ChatMessage) -> bool:
+    return await ChatMessage.get_motor_collection().count_documents({"_id": message.id}, limit=1) > 0
+
+
+async def store_messages(messages: List[ChatMessage]) -> None:
+    """
+    Insert messages that already carry a seq, in one bulk insert, and raise
+    each session's message_count to cover them. Messages whose _id is
+    already stored are skipped, so a failed batch can be retried. A message
+    whose seq was taken in the meantime (another worker appended to the
+    same session) is stored under a newly allocated seq instead.
+    """
+    if not messages:
+        return
+    now = datetime.utcnow()
+    highest: Dict[PydanticObjectId, int] = {}
+    for m in messages:
+        highest[m.session_id] = max(highest.get(m.session_id, 0), m.seq)
+    await ChatSession.get_motor_collection().bulk_write(
+        [
+            UpdateOne({"_id": session_id}, {"$max": {"message_count": seq}, "$set": {"updated_at": now}})
+            for session_id, seq in highest.items()
+        ],
+        ordered=False,
+    )
+
+    try:
+        await ChatMessage.insert_many(messages, ordered=False)
+        return
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != 11000 for err in errors):
+            raise
+        conflicts = [messages[err["index"]] for err in errors]
+
+    # Duplicates are rare: either an earlier attempt stored the message, or its seq was taken
+    for message in conflicts:
+        while not await _is_stored(message):
+            message.seq = await next_seq(message.session_id, now)
+            try:
+                await message.insert()
+            except DuplicateKeyError:
+                continue
@@ -0,0 +1,211 @@
+"""
+Token-budgeted prompt assembly for stream_chat.
+
+The system prompt and current plan are always sent. The most recent turns
+are kept verbatim; older turns are condensed into a short recap, and the
+oldest recap lines are dropped once the per-model budget is exhausted.
+
+Messages are laid out for provider prefix caching: the static system prompt
+comes first and never changes, the history only grows, and the plan (which
+changes on most turns) goes last, just before the newest message. The plan
+is sent in a compact line format rather than indented JSON.
+
+Token counts use tiktoken. Its BPE files are downloaded on first use (and
+cached under TIKTOKEN_CACHE_DIR), so main.py loads the encoding at startup
+off the event loop; where it cannot be loaded, e.g. offline, counts fall back
+to an estimate of ~4 characters per token.
+"""
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# Prompt token budgets per model. These are cost/latency budgets, well below
+# the hard context windows, and can be overridden with LLM_CONTEXT_BUDGET.
+MODEL_CONTEXT_BUDGETS = {
+    "gpt-4o": 16000,
+    "gpt-4o-mini": 16000,
+    "mock-gpt": 8000,
+}
+DEFAULT_CONTEXT_BUDGET = 8000
+
+# Most recent messages sent verbatim (budget permitting); older ones are condensed.
+RECENT_MESSAGES = int(os.getenv("LLM_CONTEXT_RECENT_MESSAGES", "10"))
+# Messages are condensed this many at a time, so the recap (and the cacheable
+# prompt prefix) stays the same for several turns instead of changing on every one.
+CONDENSE_STEP = int(os.getenv("LLM_CONTEXT_CONDENSE_STEP", "6"))
+
+# Per-message framing tokens added by the chat format.
+MESSAGE_OVERHEAD = 4
+CONDENSED_CHARS = 160
+
+# By encoding name; None once loading failed, so a worker tries (and logs) only once
+_encodings: Dict[str, Any] = {}
+
+
+def _encoding(model: str):
+    try:
+        name = tiktoken.encoding_name_for_model(model)
+    except KeyError:
+        name = "o200k_base"
+    if name not in _encodings:
+        try:
+            _encodings[name] = tiktoken.get_encoding(name)
+        except Exception:
+            logger.warning("Could not load tiktoken encoding %s; estimating ~4 characters per token", name, exc_info=True)
+            _encodings[name] = None
+    return _encodings[name]
+
+
+async def load_encoding(model: str) -> None:
+    """Load the model's encoding in a thread, since tiktoken may download it."""
+    await asyncio.to_thread(_encoding, model)
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """Count tokens with the model's tiktoken encoding (o200k_base for unknown models)."""
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+def message_tokens(message: Dict[str, Any], model: str = "gpt-4o") -> int:
+    return count_tokens(message.get("content") or "", model) + MESSAGE_OVERHEAD
+
+
+def context_budget(model: str) -> int:
+    override = os.getenv("LLM_CONTEXT_BUDGET")
+    if override:
+        return int(override)
+    return MODEL_CONTEXT_BUDGETS.get(model, DEFAULT_CONTEXT_BUDGET)
+
+
+@dataclass
+class ContextStats:
+    """Token accounting for one assembled prompt."""
+    budget: int
+    prompt_tokens: int
+    original_tokens: int
+    messages_kept: int
+    messages_condensed: int
+    messages_dropped: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(self.original_tokens - self.prompt_tokens, 0)
+
+    def to_dict(self) -> Dict[str, int]:
+        data = asdict(self)
+        data["tokens_saved"] = self.tokens_saved
+        return data
+
+
+def condense(message: Dict[str, Any]) -> str:
+    """One-line recap of an older message."""
+    content = " ".join((message.get("content") or "").split())
+    if len(content) > CONDENSED_CHARS:
+        content = content[:CONDENSED_CHARS].rstrip() + "..."
+    return f"- {message.get('role')}: {content}"
+
+
+def _one_line(value: Any) -> str:
+    return " ".join(str(value or "").split())
+
+
+def format_plan(plan: Dict[str, Any]) -> str:
+    """Compact, token-efficient rendering of a plan: one `id | status | title: description` line per step."""
+    lines = [f"Title: {_one_line(plan.get('title'))}"]
+    steps = plan.get("steps") or []
+    if not steps:
+        lines.append("(no steps yet)")
+    for step in steps:
+        line = f"{_one_line(step.get('id'))} | {_one_line(step.get('status'))} | {_one_line(step.get('title'))}"
+        description = _one_line(step.get("description"))
+        if description:
+            line += f": {description}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def build_context(
+    system_prompt: str,
+    plan_context: str,
+    messages: List[Dict[str, Any]],
+    model: str = "gpt-4o",
+    budget: Optional[int] = None,
+) -> Tuple[List[Dict[str, str]], ContextStats]:
+    """Assemble the messages sent upstream within the model's token budget."""
+    budget = budget or context_budget(model)
+
+    # The system prompt is the cacheable prefix; the plan is its own message near the end
+    system_message = {"role": "system", "content": system_prompt}
+    plan_message = None
+    if plan_context:
+        plan_message = {
+            "role": "system",
+            "content": f"CURRENT PLAN CONTENT (step lines are id | status | title: description):\n{plan_context}",
+        }
+
+    # Filter messages to only include role and content (remove timestamp, etc)
+    history = [{"role": m.get("role"), "content": m.get("content")} for m in messages]
+    costs = [message_tokens(m, model) for m in history]
+
+    used = message_tokens(system_message, model)
+    if plan_message:
+        used += message_tokens(plan_message, model)
+    original = used + sum(costs)
+
+    # Walk backwards through the recent window keeping turns verbatim while
+    # they fit. The newest message is always kept. The window start only
+    # moves in CONDENSE_STEP increments.
+    window_start = max(len(history) - RECENT_MESSAGES, 0)
+    window_start -= window_start % max(CONDENSE_STEP, 1)
+    kept_from = len(history)
+    for i in range(len(history) - 1, window_start - 1, -1):
+        if i < len(history) - 1 and used + costs[i] > budget:
+            break
+        used += costs[i]
+        kept_from = i
+
+    recap_message = None
+    older = history[:kept_from]
+    lines = [condense(m) for m in older]
+    if lines:
+        header = "Summary of earlier conversation (older turns condensed):"
+        line_costs = [count_tokens(line, model) + 1 for line in lines]
+        cost = count_tokens(header, model) + MESSAGE_OVERHEAD + sum(line_costs)
+        # Drop the oldest recap lines until the recap fits what is left.
+        start = 0
+        while start < len(lines) and used + cost > budget:
+            cost -= line_costs[start]
+            start += 1
+        lines = lines[start:]
+        if lines:
+            recap_message = {"role": "system", "content": "\n".join([header] + lines)}
+            used += cost
+
+    full_messages = [system_message]
+    if recap_message:
+        full_messages.append(recap_message)
+    full_messages.extend(history[kept_from:])
+    if plan_message:
+        # Before the newest message, so everything up to it is shared with the previous turn's prompt
+        full_messages.insert(max(len(full_messages) - 1, 1), plan_message)
+
+    stats = ContextStats(
+        budget=budget,
+        prompt_tokens=used,
+        original_tokens=original,
+        messages_kept=len(history) - kept_from,
+        messages_condensed=len(lines),
+        messages_dropped=len(older) - len(lines),
+    )
+    return full_messages, stats
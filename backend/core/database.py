@@ -1,27 +1,231 @@
+"""
+MongoDB client configuration.
+
+init_db builds the Motor client from MONGODB_URL plus optional driver
+settings; unset ones keep the driver defaults (or what the URL sets):
+
+    MONGO_MAX_POOL_SIZE           connections per server per worker (driver default 100)
+    MONGO_MIN_POOL_SIZE           connections kept open when idle (default 0)
+    MONGO_MAX_IDLE_TIME_MS        close pooled connections idle this long
+    MONGO_MAX_CONNECTING          connections being established at once (default 2)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS   fail a checkout after waiting this long for a free connection
+    MONGO_COMPRESSORS             wire compression in order of preference, e.g. "zstd,snappy,zlib";
+                                  zstd needs `zstandard`, snappy `python-snappy` installed
+    MONGO_READ_PREFERENCE         client default, e.g. "primary" (default) or "primaryPreferred"
+    MONGO_READ_PREFERENCES        per operation, e.g. "list_user_plans=secondaryPreferred"
+    MONGO_MAX_STALENESS_SECONDS   bound on secondary lag for non-primary reads (at least 90)
+
+Operations that look up read_preference() by name:
+    list_user_plans   the history sidebar; a lagging secondary shows a recent
+                      title or order change a moment late
+
+check_unique_emails runs before Beanie builds the unique users.email index,
+so a database holding duplicate accounts fails at startup with the emails
+involved (see migrations/dedupe_user_emails.py) rather than a bare
+DuplicateKeyError.
+
+Driver command and connection pool events feed core.metrics; the pool
+metrics (checkout wait time, connections open and in use, waiting
+checkouts) are what MONGO_MAX_POOL_SIZE should be sized against.
+"""
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
 import os
+import threading
+from typing import Any, Dict, List, Mapping, Optional
 from dotenv import load_dotenv
 import certifi
 
+from core.metrics import (
+    mongo_command_duration, mongo_pool_checkout_duration, mongo_pool_checkouts_waiting,
+    mongo_pool_connections_in_use, mongo_pool_connections_open, mongo_pool_max_size,
+)
+
 load_dotenv()
 
-async def init_db():
+DATABASE_NAME = os.getenv("DATABASE_NAME", "legal_lens")
+
+_READ_PREFERENCE_MODES = {
+    "primary": Primary,
+    "primarypreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondarypreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+# MONGO_* setting -> driver option
+_CLIENT_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MONGO_MIN_POOL_SIZE": ("minPoolSize", int),
+    "MONGO_MAX_IDLE_TIME_MS": ("maxIdleTimeMS", int),
+    "MONGO_MAX_CONNECTING": ("maxConnecting", int),
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "MONGO_COMPRESSORS": ("compressors", str),
+    "MONGO_READ_PREFERENCE": ("readPreference", str),
+    "MONGO_MAX_STALENESS_SECONDS": ("maxStalenessSeconds", int),
+}
+
+
+def client_options(env: Mapping[str, str] = os.environ) -> Dict[str, Any]:
+    """Driver keyword arguments for the MONGO_* settings that are set."""
+    options = {}
+    for setting, (option, convert) in _CLIENT_OPTIONS.items():
+        value = env.get(setting, "").strip()
+        if value:
+            options[option] = convert(value)
+    # The driver rejects max staleness with primary reads; it only bounds secondary reads
+    if options.get("readPreference", "primary").lower() == "primary":
+        options.pop("maxStalenessSeconds", None)
+    return options
+
+
+def parse_read_preferences(value: str, max_staleness: int = -1) -> Dict[str, Any]:
+    """
+    Parse "operation=mode,..." into pymongo read preferences by operation.
+    max_staleness applies to the non-primary modes only. Raises ValueError
+    naming the entry that is not of the form operation=mode.
+    """
+    preferences = {}
+    for entry in filter(None, (e.strip() for e in value.split(","))):
+        parts = [part.strip() for part in entry.split("=")]
+        if len(parts) != 2 or not all(parts):
+            raise ValueError(f"Invalid MONGO_READ_PREFERENCES entry '{entry}': expected operation=mode")
+        operation, mode = parts
+        mode_class = _READ_PREFERENCE_MODES.get(mode.lower())
+        if mode_class is None:
+            raise ValueError(f"Unknown read preference '{mode}' for {operation} in MONGO_READ_PREFERENCES")
+        preferences[operation] = mode_class() if mode_class is Primary else mode_class(max_staleness=max_staleness)
+    return preferences
+
+
+READ_PREFERENCES = parse_read_preferences(
+    os.getenv("MONGO_READ_PREFERENCES", ""),
+    int(os.getenv("MONGO_MAX_STALENESS_SECONDS") or -1),
+)
+
+
+def read_preference(operation: str):
+    """The read preference configured for an operation, or None for the client default."""
+    return READ_PREFERENCES.get(operation)
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Records the round trip of every MongoDB command in mongo_command_duration."""
+
+    def __init__(self):
+        # Motor calls listeners from its worker threads
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        with self._lock:
+            mongo_command_duration.observe(event.duration_micros / 1e6, command=event.command_name)
+
+    def failed(self, event):
+        with self._lock:
+            mongo_command_duration.observe(event.duration_micros / 1e6, command=event.command_name)
+
+
+def _address(event) -> str:
+    host, port = event.address
+    return f"{host}:{port}"
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Tracks connection pool checkouts and sizes per server in the mongo_pool_* metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def pool_created(self, event):
+        max_size = event.options.get("maxPoolSize")
+        if max_size:
+            with self._lock:
+                mongo_pool_max_size.set(max_size, address=_address(event))
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            mongo_pool_connections_open.inc(address=_address(event))
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            mongo_pool_connections_open.dec(address=_address(event))
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            mongo_pool_checkouts_waiting.inc(address=_address(event))
+
+    def connection_checked_out(self, event):
+        address = _address(event)
+        with self._lock:
+            mongo_pool_checkouts_waiting.dec(address=address)
+            mongo_pool_connections_in_use.inc(address=address)
+            if event.duration is not None:
+                mongo_pool_checkout_duration.observe(event.duration, result="ok")
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            mongo_pool_checkouts_waiting.dec(address=_address(event))
+            if event.duration is not None:
+                mongo_pool_checkout_duration.observe(event.duration, result=event.reason)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            mongo_pool_connections_in_use.dec(address=_address(event))
+
+
+async def init_db(options: Optional[Dict[str, Any]] = None):
+    """Create the Motor client; main.py initializes Beanie on client[DATABASE_NAME]."""
     # Retrieve the MongoDB connection string from environment variables
     mongodb_url = os.getenv("MONGODB_URL")
-    
+
     # Strip whitespace and quotes just in case
     mongodb_url = mongodb_url.strip().strip('"').strip("'")
 
     if not mongodb_url.startswith("mongodb"):
         print(f"CRITICAL: Invalid MONGODB_URL. Starts with: '{mongodb_url[:8]}...' Check your Render Dashboard.")
 
-    client = AsyncIOMotorClient(mongodb_url, tlsCAFile=certifi.where())
-    database = client.get_database("legal_lens")
-    
-    # Import models locally to avoid circular imports if necessary, 
-    # or ensure they are imported before init_beanie is called in main.py.
-    # We will pass the model classes to init_beanie in main.py or here.
-    # For better structure, we can just return the client/db here or do the init here if we import models.
-    # Let's rely on main.py to pass the models to verify everything is loaded.
-    
-    return client
+    return AsyncIOMotorClient(
+        mongodb_url,
+        tlsCAFile=certifi.where(),
+        event_listeners=[CommandMetrics(), PoolMetrics()],
+        **(client_options() if options is None else options),
+    )
+
+
+async def duplicate_emails(database) -> Dict[str, List[Any]]:
+    """User ids by email, for every email held by more than one user (oldest id first)."""
+    pipeline = [
+        {"$sort": {"_id": 1}},
+        {"$group": {"_id": "$email", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]
+    return {group["_id"]: group["ids"] async for group in database["users"].aggregate(pipeline)}
+
+
+async def check_unique_emails(database) -> None:
+    """Raise RuntimeError naming duplicate emails that would stop the unique email index from building."""
+    indexes = await database["users"].index_information()
+    if any(index.get("unique") and index["key"] == [("email", 1)] for index in indexes.values()):
+        return
+    duplicates = await duplicate_emails(database)
+    if duplicates:
+        raise RuntimeError(
+            f"users.email must be unique, but these emails have several accounts: "
+            f"{', '.join(sorted(duplicates))}. Run `python -m migrations.dedupe_user_emails` from backend/."
+        )
@@ -0,0 +1,171 @@
+"""
+Typed events for the chat stream.
+
+stream_chat and save_and_stream pass these objects around in-process; they
+are serialized exactly once, as NDJSON lines, at the HTTP edge. The wire
+format is the "type" field plus each event's payload; events replayed from
+a turn buffer (core.turns) also carry their "seq" number:
+
+    {"type": "meta", "plan_id": "...", "turn_id": "..."}
+    {"type": "text", "content": "..."}
+    {"type": "tool_chunk", "content": "...", "index": 0, "name": "manage_plan"}
+    {"type": "usage", "prompt_tokens": 123, ...}
+    {"type": "plan_step", "index": 0, "step": {...}, "title": "..."}
+    {"type": "plan", "plan": {"title": "...", "steps": [...]}}
+    {"type": "error", "content": "..."}
+"""
+import json
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, ClassVar, Dict, List, Optional, Tuple
+
+
+@dataclass
+class StreamEvent(ABC):
+    type: ClassVar[str] = ""
+
+    @abstractmethod
+    def to_dict(self) -> Dict[str, Any]:
+        """The event's wire form: its "type" plus payload."""
+
+
+@dataclass
+class Meta(StreamEvent):
+    plan_id: str
+    turn_id: Optional[str] = None
+    type: ClassVar[str] = "meta"
+
+    def to_dict(self):
+        event = {"type": self.type, "plan_id": self.plan_id}
+        if self.turn_id:
+            event["turn_id"] = self.turn_id
+        return event
+
+
+@dataclass
+class TextDelta(StreamEvent):
+    content: str
+    type: ClassVar[str] = "text"
+
+    def to_dict(self):
+        return {"type": self.type, "content": self.content}
+
+
+@dataclass
+class ToolCallDelta(StreamEvent):
+    """
+    A fragment of a tool call's JSON arguments. ``index`` identifies the call
+    when the model makes several in one turn; the name arrives with its first
+    fragment.
+    """
+    content: str
+    name: Optional[str] = None
+    index: int = 0
+    type: ClassVar[str] = "tool_chunk"
+
+    def to_dict(self):
+        event = {"type": self.type, "content": self.content, "index": self.index}
+        if self.name:
+            event["name"] = self.name
+        return event
+
+
+@dataclass
+class Usage(StreamEvent):
+    stats: Dict[str, Any]
+    type: ClassVar[str] = "usage"
+
+    def to_dict(self):
+        return {"type": self.type, **self.stats}
+
+
+@dataclass
+class PlanStep(StreamEvent):
+    """A step parsed from a manage_plan call that is still streaming (see core.plan_stream)."""
+    index: int
+    step: Dict[str, Any]
+    title: Optional[str] = None
+    type: ClassVar[str] = "plan_step"
+
+    def to_dict(self):
+        event = {"type": self.type, "index": self.index, "step": self.step}
+        if self.title is not None:
+            event["title"] = self.title
+        return event
+
+
+@dataclass
+class PlanUpdate(StreamEvent):
+    plan: Dict[str, Any]
+    type: ClassVar[str] = "plan"
+
+    def to_dict(self):
+        return {"type": self.type, "plan": self.plan}
+
+
+@dataclass
+class StreamError(StreamEvent):
+    content: str
+    type: ClassVar[str] = "error"
+
+    def to_dict(self):
+        return {"type": self.type, "content": self.content}
+
+
+def encode_event(event: StreamEvent, seq: Optional[int] = None) -> bytes:
+    """Serialize one event as an NDJSON line."""
+    data = event.to_dict()
+    if seq is not None:
+        data["seq"] = seq
+    return (json.dumps(data) + "\n").encode()
+
+
+async def encode_stream(events: AsyncIterator[StreamEvent]) -> AsyncIterator[bytes]:
+    """Serialize an event stream for a StreamingResponse."""
+    async for event in events:
+        yield encode_event(event)
+
+
+async def encode_sequenced(events: AsyncIterator[Tuple[int, StreamEvent]]) -> AsyncIterator[bytes]:
+    """Serialize (seq, event) pairs, e.g. from TurnBuffer.follow."""
+    async for seq, event in events:
+        yield encode_event(event, seq)
+
+
+@dataclass
+class ToolCall:
+    """A tool call assembled from the deltas sharing its index."""
+    index: int
+    name: str = ""
+    parts: List[str] = field(default_factory=list)
+
+    @property
+    def arguments(self) -> str:
+        return "".join(self.parts)
+
+
+@dataclass
+class TurnAccumulator:
+    """Collects the assistant's text and tool calls from a turn's events."""
+    text_parts: List[str] = field(default_factory=list)
+    tool_calls: Dict[int, ToolCall] = field(default_factory=dict)
+
+    def add(self, event: StreamEvent) -> None:
+        if isinstance(event, TextDelta):
+            self.text_parts.append(event.content)
+        elif isinstance(event, ToolCallDelta):
+            call = self.tool_calls.get(event.index)
+            if call is None:
+                call = self.tool_calls[event.index] = ToolCall(event.index)
+            call.parts.append(event.content)
+            if event.name:
+                call.name = event.name
+
+    @property
+    def text(self) -> str:
+        return "".join(self.text_parts)
+
+    @property
+    def calls(self) -> List[ToolCall]:
+        """Tool calls in the order the model issued them."""
+        return [self.tool_calls[i] for i in sorted(self.tool_calls)]
@@ -1,9 +1,29 @@
-from openai import OpenAI
+import asyncio
+import hashlib
 import os
-from typing import List, Dict, Any
+import time
+from contextlib import aclosing
+from typing import AsyncIterator, List, Dict, Any
 import json
+import logging
 
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+from core.cache import response_cache
+from core.context import build_context, count_tokens
+from core.events import StreamEvent, TextDelta, ToolCallDelta, Usage
+from core.metrics import response_cache_lookups, streams_in_flight, time_to_first_token, tokens_per_second
+from core.providers import get_provider
+from core.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on upstream completions streamed at once by this worker.
+# Chats beyond the cap wait for a free slot instead of opening another connection.
+MAX_CONCURRENT_STREAMS = int(os.getenv("LLM_MAX_CONCURRENT_STREAMS", "32"))
+_stream_slots = asyncio.Semaphore(MAX_CONCURRENT_STREAMS)
+
+# Approximate bytes a cached event adds beyond its text: the object and its JSON framing on replay.
+# Cache weights are estimated from the collected text instead of encoding every event again.
+CACHED_EVENT_OVERHEAD = 64
 
 SYSTEM_PROMPT = """You are LegalLens, an expert AI legal strategist companion. Your role is to assist lawyers and legal professionals in drafting precise, actionable litigation and project roadmaps.
 
@@ -13,11 +33,13 @@ Context:
 
 Your Capabilities:
 1. **Analyze Strategy**: Understand complex legal goals (e.g., "Motion for Summary Judgment in NY Supreme Court").
-2. **Structure Plans**: Use the `manage_plan` tool to visualize the roadmap.
+2. **Structure Plans**: Use the `manage_plan` tool to create or restructure the roadmap, and `patch_plan` for targeted edits (status changes, adding, removing or reordering a few steps).
 3. **Jurisdiction Aware**: If jurisdiction is unknown, ASK. Procedural steps vary wildly by location.
 
 Operational Rules:
 - **Use 'manage_plan' aggressively**: The user wants to *see* the plan. Update it frequently.
+- **Prefer 'patch_plan' for small changes**: Do not rewrite the whole plan to change a few steps; reference existing steps by their id.
+- **Batch edits in one turn**: You may issue several tool calls in a single response; they are applied in order.
 - **Phase-Based Thinking**: Organize steps logically (e.g., 'Research', 'Drafting', 'Filing', 'Service').
 - **Precise Terminology**: Use specific verbs (e.g., "Depose", "Subpoena", "File", "Serve") rather than generic ones.
 - **Relative Deadlines**: In step descriptions, suggest standard timelines where applicable (e.g., "Due 30 days after service").
@@ -60,44 +82,136 @@ TOOLS = [
                 "required": ["title", "steps"]
             }
         }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "patch_plan",
+            "description": "Edit specific steps of the current plan by id without rewriting the whole plan.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "title": {
+                        "type": "string",
+                        "description": "New plan title. Omit to keep the current title."
+                    },
+                    "operations": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "op": {"type": "string", "enum": ["add", "update", "remove", "reorder"]},
+                                "id": {"type": "string", "description": "Step id to update or remove"},
+                                "step": {
+                                    "type": "object",
+                                    "description": "Full step for 'add'; only the changed fields for 'update'",
+                                    "properties": {
+                                        "id": {"type": "string"},
+                                        "title": {"type": "string"},
+                                        "description": {"type": "string"},
+                                        "status": {"type": "string", "enum": ["pending", "in-progress", "done"]}
+                                    }
+                                },
+                                "after": {"type": "string", "description": "For 'add': insert after this step id (omit to append)"},
+                                "order": {"type": "array", "items": {"type": "string"}, "description": "For 'reorder': every step id in the new order"}
+                            },
+                            "required": ["op"]
+                        }
+                    }
+                },
+                "required": ["operations"]
+            }
+        }
     }
 ]
 
-async def stream_chat(messages: List[Dict[str, str]], plan_context: str = ""):
-    # Add system prompt with context
-    final_system_prompt = SYSTEM_PROMPT
-    if plan_context:
-        final_system_prompt += f"\n\nCURRENT PLAN CONTENT:\n{plan_context}\n"
-    
-    full_messages = [{"role": "system", "content": final_system_prompt}]
-    
-    # Filter messages to only include role and content (remove timestamp, etc)
-    for m in messages:
-        full_messages.append({
-            "role": m.get("role"),
-            "content": m.get("content")
-        })
-
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=full_messages,
-        tools=TOOLS,
-        stream=True
-    )
-
-    for chunk in response:
-        delta = chunk.choices[0].delta
-        
-        # Check for tool calls
-        if delta.tool_calls:
-            for tool_call in delta.tool_calls:
-                # We yield a special marker for tool calls to handle locally or on frontend
-                # For MVP, we might just buffer the tool call arguments and yield correctly
-                # But to keep it simple, we'll try to reconstruct the tool call.
-                # However, streaming tool calls is tricky. 
-                # Let's yield partial JSON or a custom event format.
-                if tool_call.function.arguments:
-                     yield json.dumps({"type": "tool_chunk", "content": tool_call.function.arguments}) + "\n"
-        
-        elif delta.content:
-            yield json.dumps({"type": "text", "content": delta.content}) + "\n"
+def response_cache_key(model: str, full_messages: List[Dict[str, str]], tools: List[Dict[str, Any]] = TOOLS) -> str:
+    """
+    Hash of everything that determines a completion: model, tools and the
+    assembled prompt (system prompt, plan context and history). Message text
+    is whitespace-normalized so trivially different prompts share an entry.
+    """
+    normalized = {
+        "model": model,
+        "tools": tools,
+        "messages": [[m["role"], " ".join((m.get("content") or "").split())] for m in full_messages],
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+
+async def stream_chat(
+    messages: List[Dict[str, str]],
+    plan_context: str = "",
+    use_cache: bool = True,
+) -> AsyncIterator[StreamEvent]:
+    provider = get_provider()
+
+    # System prompt, plan and as much history as the model's budget allows
+    full_messages, stats = build_context(SYSTEM_PROMPT, plan_context, messages, provider.model)
+
+    # Identical prompts (e.g. the sample strategies on an empty plan) replay a stored turn
+    cache_key = response_cache_key(provider.model, full_messages) if response_cache.enabled else None
+    if cache_key and use_cache:
+        cached = response_cache.get(cache_key)
+        response_cache_lookups.inc(result="hit" if cached is not None else "miss")
+        if cached is not None:
+            span("llm.cache_hit").end()
+            for event in cached:
+                yield event
+            return
+    elif cache_key:
+        response_cache_lookups.inc(result="bypass")
+
+    completion_parts = []
+    recorded: List[StreamEvent] = []
+    started = time.perf_counter()
+    first_chunk_at = None
+
+    streams_in_flight.inc()
+    upstream = span("llm.stream", model=provider.model)
+    first_token = span("llm.first_token")
+    try:
+        async with _stream_slots, aclosing(provider.stream(full_messages, TOOLS)) as stream:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if first_chunk_at is None and (delta.content or delta.tool_calls):
+                    first_chunk_at = time.perf_counter()
+                    time_to_first_token.observe(first_chunk_at - started)
+                    first_token.end()
+
+                # Tool call arguments stream as JSON fragments keyed by call index; the name comes with the first one
+                if delta.tool_calls:
+                    for tool_call in delta.tool_calls:
+                        arguments = tool_call.function.arguments or ""
+                        if arguments:
+                            completion_parts.append(arguments)
+                        if arguments or tool_call.function.name:
+                            event = ToolCallDelta(arguments, tool_call.function.name, tool_call.index)
+                            recorded.append(event)
+                            yield event
+
+                elif delta.content:
+                    completion_parts.append(delta.content)
+                    event = TextDelta(delta.content)
+                    recorded.append(event)
+                    yield event
+    finally:
+        streams_in_flight.dec()
+        upstream.end()
+
+    usage = stats.to_dict()
+    usage["completion_tokens"] = count_tokens("".join(completion_parts), provider.model)
+    if first_chunk_at is not None:
+        generation_seconds = time.perf_counter() - first_chunk_at
+        if generation_seconds > 0 and usage["completion_tokens"]:
+            tokens_per_second.observe(usage["completion_tokens"] / generation_seconds)
+    logger.info("chat turn tokens: %s", usage)
+    yield Usage(usage)
+
+    if cache_key:
+        # Replays report the original usage, flagged as served from cache
+        recorded.append(Usage({**usage, "cached": True}))
+        weight = sum(len(part) for part in completion_parts) + CACHED_EVENT_OVERHEAD * len(recorded)
+        response_cache.set(cache_key, tuple(recorded), weight=weight)
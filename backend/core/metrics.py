@@ -0,0 +1,312 @@
+"""
+In-process metrics.
+
+Metrics are module-level objects registered in REGISTRY when created and
+updated from the code paths they describe. Values are per worker process;
+render() produces the Prometheus text format served at /metrics.
+
+Recording is a dict lookup and an addition (plus a bisect for histograms),
+so it is cheap enough for per-chunk and per-query paths. The driver's
+monitoring listeners record from its own threads, so each metric guards its
+values with a lock and samples() copies them under it.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, LabelKey, float]
+
+# Default histogram buckets in seconds, from sub-millisecond queries to long answers
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def samples(self) -> Iterable[Sample]:
+        """(sample name, labels, value) for every series, read at render time."""
+        return ()
+
+
+class Counter(Metric):
+    """A monotonically increasing count, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        super().__init__(name, help)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    """A value that goes up and down, optionally read from `function` at render time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, function: Optional[Callable[[], float]] = None):
+        super().__init__(name, help)
+        self.function = function
+        self._values: Dict[LabelKey, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels: str) -> float:
+        if self.function is not None and not labels:
+            return self.function()
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self) -> Iterable[Sample]:
+        if self.function is not None:
+            return [(self.name, (), self.function())]
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class CounterFunction(Metric):
+    """Counters kept elsewhere (e.g. cache hit counts), read from `function` as {labels: value} at render time."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, function: Callable[[], Iterable[Tuple[Dict[str, str], float]]]):
+        super().__init__(name, help)
+        self.function = function
+
+    def samples(self) -> Iterable[Sample]:
+        return [(self.name, _label_key(labels), value) for labels, value in self.function()]
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: "Histogram", labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Histogram(Metric):
+    """Observations counted into cumulative buckets, with their sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[LabelKey, list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _label_key(labels) if labels else ()
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bucket] += 1
+            series[1] += value
+
+    def time(self, **labels: str) -> _Timer:
+        """Context manager observing the wall time of its block."""
+        return _Timer(self, labels)
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(_label_key(labels))
+        return sum(series[0]) if series else 0
+
+    def sum(self, **labels: str) -> float:
+        series = self._series.get(_label_key(labels))
+        return series[1] if series else 0.0
+
+    def samples(self) -> Iterable[Sample]:
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        samples: List[Sample] = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", key + (("le", _format_value(bound)),), cumulative))
+            samples.append((f"{self.name}_sum", key, total))
+            samples.append((f"{self.name}_count", key, cumulative))
+        return samples
+
+
+REGISTRY: List[Metric] = []
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str, quotes: bool = True) -> str:
+    value = value.replace("\\", "\\\\").replace("\n", "\\n")
+    return value.replace('"', '\\"') if quotes else value
+
+
+def render(metrics: Optional[Iterable[Metric]] = None) -> str:
+    """Prometheus text exposition (format 0.0.4) of every registered metric."""
+    lines: List[str] = []
+    for metric in REGISTRY if metrics is None else metrics:
+        lines.append(f"# HELP {metric.name} {_escape(metric.help, quotes=False)}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, key, value in metric.samples():
+            labels = ",".join(f'{k}="{_escape(v)}"' for k, v in key)
+            lines.append(f"{name}{{{labels}}} {_format_value(value)}" if labels else f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Chat turns ---
+
+turn_cancellations = Counter(
+    "chat_turn_cancellations_total",
+    "Chat turns whose upstream generation was cancelled because no client was listening",
+)
+
+turn_duration = Histogram(
+    "chat_turn_duration_seconds",
+    "Wall time of a chat turn from start to its last event (model, tools and saves), by outcome",
+)
+
+tool_call_parse_failures = Counter(
+    "chat_tool_call_parse_failures_total",
+    "Tool calls whose streamed arguments were not valid JSON, by tool",
+)
+
+
+# --- LLM ---
+
+response_cache_lookups = Counter(
+    "llm_response_cache_lookups_total",
+    "Response cache lookups by result: hit, miss or bypass (the request asked for a fresh answer)",
+)
+
+streams_in_flight = Gauge(
+    "llm_streams_in_flight",
+    "Upstream completions currently streaming (or waiting for a stream slot) in this worker",
+)
+
+time_to_first_token = Histogram(
+    "llm_time_to_first_token_seconds",
+    "Time from starting an upstream completion (including waiting for a slot) to its first text or tool-call chunk",
+)
+
+tokens_per_second = Histogram(
+    "llm_tokens_per_second",
+    "Completion tokens per second after the first text or tool-call chunk, per upstream completion",
+    buckets=(5, 10, 20, 30, 40, 50, 60, 80, 100, 150, 200, 400),
+)
+
+
+# --- Database ---
+
+mongo_command_duration = Histogram(
+    "mongo_command_duration_seconds",
+    "MongoDB command round trips as reported by the driver, by command",
+)
+
+mongo_pool_checkout_duration = Histogram(
+    "mongo_pool_checkout_wait_seconds",
+    "Time to check a connection out of the driver pool, by result: ok, timeout, poolClosed or connectionError",
+)
+
+mongo_pool_checkouts_waiting = Gauge(
+    "mongo_pool_checkouts_waiting",
+    "Operations waiting for a pooled connection, by server address",
+)
+
+mongo_pool_connections_in_use = Gauge(
+    "mongo_pool_connections_in_use",
+    "Pooled connections checked out by an operation, by server address",
+)
+
+mongo_pool_connections_open = Gauge(
+    "mongo_pool_connections_open",
+    "Open pooled connections (in use or idle), by server address",
+)
+
+mongo_pool_max_size = Gauge(
+    "mongo_pool_max_size",
+    "Configured maximum pool size (MONGO_MAX_POOL_SIZE), by server address",
+)
+
+write_behind_pending = Gauge(
+    "storage_write_behind_pending",
+    "Chat messages and plan updates queued by write-behind storage and not yet flushed",
+)
+
+write_behind_flush_duration = Histogram(
+    "storage_write_behind_flush_duration_seconds",
+    "Time to flush one write-behind batch, including retries",
+)
+
+write_behind_failures = Counter(
+    "storage_write_behind_flush_failures_total",
+    "Write-behind flush attempts that failed (each is retried until the retry limit)",
+)
+
+write_behind_dropped = Counter(
+    "storage_write_behind_dropped_total",
+    "Records dropped after a write-behind flush ran out of retries, by record: message or plan",
+)
+
+
+# --- Auth ---
+
+auth_duration = Histogram(
+    "auth_duration_seconds",
+    "Time spent authenticating, by operation: register, login or current_user",
+)
+
+password_hash_duration = Histogram(
+    "password_hash_duration_seconds",
+    "bcrypt time per hash or verification in the hash pool, excluding queueing",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0, 5.0),
+)
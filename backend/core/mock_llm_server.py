@@ -0,0 +1,29 @@
+"""
+Local OpenAI-compatible streaming server backed by MockProvider.
+
+Run it next to the API to exercise the real OpenAI client path offline:
+
+    uvicorn core.mock_llm_server:app --port 8001
+    LLM_PROVIDER=openai OPENAI_BASE_URL=http://localhost:8001/v1 OPENAI_API_KEY=mock uvicorn main:app
+
+Pacing is configured with MOCK_LLM_TOKENS_PER_SECOND and MOCK_LLM_TTFT_MS.
+"""
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from core.providers import create_provider
+
+app = FastAPI(title="LegalLens Mock LLM")
+provider = create_provider("mock")
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+
+    async def sse():
+        async for chunk in provider.stream(body.get("messages", []), body.get("tools") or []):
+            yield f"data: {chunk.model_dump_json(exclude_unset=True)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(sse(), media_type="text/event-stream")
@@ -0,0 +1,146 @@
+"""
+Incremental plan edits for the patch_plan tool.
+
+Operations address steps by id:
+
+    {"op": "add", "step": {...}, "after": "<id>"}   # omit "after" to append
+    {"op": "update", "id": "<id>", "step": {"status": "done"}}
+    {"op": "remove", "id": "<id>"}
+    {"op": "reorder", "order": ["<id>", ...]}
+
+apply_plan_patch validates a patch against the current steps and returns the
+new list; plan_patch_writes turns the same patch into targeted MongoDB updates
+so only the touched steps travel over the wire. MongoPlanRepository.patch uses
+them for updates and removes, which address steps by id; patches that add or
+reorder steps depend on the stored order and are written as one update
+conditional on the plan's updated_at instead.
+"""
+import copy
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from pymongo import UpdateOne
+
+STEP_FIELDS = {"id", "title", "description", "status"}
+STEP_STATUSES = {"pending", "in-progress", "done"}
+
+
+class PlanPatchError(ValueError):
+    """Raised when a patch does not apply to the current plan."""
+
+
+def _index(steps: List[Dict[str, Any]], step_id: str) -> int:
+    for i, step in enumerate(steps):
+        if step.get("id") == step_id:
+            return i
+    raise PlanPatchError(f"Unknown step id '{step_id}'")
+
+
+def check_unique_ids(steps: List[Dict[str, Any]]) -> None:
+    """Raise PlanPatchError if two steps share an id; patches address steps by id."""
+    if not isinstance(steps, list) or not all(isinstance(step, dict) for step in steps):
+        raise PlanPatchError("Steps must be a list of objects")
+    counts = Counter(step.get("id") for step in steps if step.get("id") is not None)
+    for step_id, count in counts.items():
+        if count > 1:
+            raise PlanPatchError(f"Duplicate step id '{step_id}'")
+
+
+def _clean_fields(fields: Dict[str, Any]) -> Dict[str, Any]:
+    if fields is None:
+        return {}
+    if not isinstance(fields, dict):
+        raise PlanPatchError("A step must be an object")
+    cleaned = {k: v for k, v in fields.items() if k in STEP_FIELDS}
+    if "status" in cleaned and cleaned["status"] not in STEP_STATUSES:
+        raise PlanPatchError(f"Invalid status '{cleaned['status']}'")
+    return cleaned
+
+
+def apply_plan_patch(steps: List[Dict[str, Any]], operations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Return the steps after applying operations in order. The input is not modified."""
+    # The operations come from the model; anything malformed is a PlanPatchError, never a crash
+    if not isinstance(operations, list):
+        raise PlanPatchError("Operations must be a list")
+    # An update or remove would touch only the first match here but every match in MongoDB
+    check_unique_ids(steps)
+    steps = copy.deepcopy(steps)
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise PlanPatchError("Each operation must be an object")
+        op = operation.get("op")
+        if op == "add":
+            step = _clean_fields(operation.get("step"))
+            if not isinstance(step.get("id"), str) or not step["id"] or not step.get("title"):
+                raise PlanPatchError("Added steps need an id and a title")
+            if any(s.get("id") == step["id"] for s in steps):
+                raise PlanPatchError(f"Duplicate step id '{step['id']}'")
+            step.setdefault("status", "pending")
+            after = operation.get("after")
+            position = _index(steps, after) + 1 if after else len(steps)
+            steps.insert(position, step)
+        elif op == "update":
+            i = _index(steps, operation.get("id"))
+            fields = _clean_fields(operation.get("step"))
+            fields.pop("id", None)
+            steps[i].update(fields)
+        elif op == "remove":
+            steps.pop(_index(steps, operation.get("id")))
+        elif op == "reorder":
+            order = operation.get("order") or []
+            if not isinstance(order, list) or not all(isinstance(step_id, str) for step_id in order):
+                raise PlanPatchError("Reorder needs a list of step ids")
+            if Counter(order) != Counter(s.get("id") for s in steps):
+                raise PlanPatchError("Reorder must list every step id exactly once")
+            by_id = {s["id"]: s for s in steps}
+            steps = [by_id[step_id] for step_id in order]
+        else:
+            raise PlanPatchError(f"Unknown operation '{op}'")
+    return steps
+
+
+def plan_patch_writes(
+    plan_filter: Dict[str, Any],
+    steps: List[Dict[str, Any]],
+    operations: List[Dict[str, Any]],
+    title: Optional[str] = None,
+    extra_set: Optional[Dict[str, Any]] = None,
+) -> List[UpdateOne]:
+    """
+    Translate a validated patch into ordered UpdateOne requests.
+
+    ``steps`` is the plan before the patch; it is only used to resolve
+    insert positions. Step updates use array filters on the step id so they
+    do not depend on array positions.
+    """
+    writes: List[UpdateOne] = []
+    current = copy.deepcopy(steps)
+    for operation in operations:
+        op = operation["op"]
+        if op == "add":
+            step = _clean_fields(operation["step"])
+            step.setdefault("status", "pending")
+            after = operation.get("after")
+            position = _index(current, after) + 1 if after else len(current)
+            writes.append(UpdateOne(plan_filter, {"$push": {"steps": {"$each": [step], "$position": position}}}))
+        elif op == "update":
+            fields = _clean_fields(operation.get("step"))
+            fields.pop("id", None)
+            if fields:
+                writes.append(UpdateOne(
+                    plan_filter,
+                    {"$set": {f"steps.$[s].{k}": v for k, v in fields.items()}},
+                    array_filters=[{"s.id": operation["id"]}],
+                ))
+        elif op == "remove":
+            writes.append(UpdateOne(plan_filter, {"$pull": {"steps": {"id": operation["id"]}}}))
+        current = apply_plan_patch(current, [operation])
+        if op == "reorder":
+            writes.append(UpdateOne(plan_filter, {"$set": {"steps": current}}))
+
+    fields = dict(extra_set or {})
+    if title:
+        fields["title"] = title
+    if fields:
+        writes.append(UpdateOne(plan_filter, {"$set": fields}))
+    return writes
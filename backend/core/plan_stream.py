@@ -0,0 +1,97 @@
+"""
+Incremental parsing of streamed manage_plan arguments.
+
+The model emits the tool call's JSON a few characters at a time. Rather than
+waiting for the whole document, PlanStepParser scans the fragments as they
+arrive and hands back each entry of the top-level "steps" array as soon as
+its closing brace is seen, so the plan pane can fill in while the call is
+still generating. The final json.loads in save_and_stream stays the source
+of truth for what is saved.
+"""
+import json
+from typing import List, Optional
+
+from core.events import PlanStep
+
+
+class PlanStepParser:
+    """Feed argument fragments in order; get back PlanStep events for completed steps."""
+
+    def __init__(self):
+        self.title: Optional[str] = None
+        self.steps_emitted = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key: Optional[str] = None
+        self._after_colon = False
+        self._in_steps = False
+        self._string: Optional[List[str]] = None  # characters of the current top-level string
+        self._step: Optional[List[str]] = None    # characters of the current step object
+
+    def feed(self, fragment: str) -> List[PlanStep]:
+        events: List[PlanStep] = []
+        for char in fragment:
+            if self._step is not None:
+                self._step.append(char)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._string is not None:
+                        self._end_top_level_string()
+                        continue
+                if self._string is not None:
+                    self._string.append(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string = [] if self._depth == 1 else None
+            elif self._depth == 1 and char == ":":
+                self._after_colon = True
+            elif self._depth == 1 and char == ",":
+                self._after_colon = False
+            elif char in "{[":
+                self._depth += 1
+                if char == "[" and self._depth == 2 and self._after_colon and self._key == "steps":
+                    self._in_steps = True
+                elif char == "{" and self._depth == 3 and self._in_steps:
+                    self._step = ["{"]
+            elif char in "}]":
+                self._depth -= 1
+                if char == "}" and self._depth == 2 and self._step is not None:
+                    event = self._end_step()
+                    if event:
+                        events.append(event)
+                elif char == "]" and self._depth == 1:
+                    self._in_steps = False
+        return events
+
+    def _end_top_level_string(self):
+        try:
+            text = json.loads('"' + "".join(self._string) + '"')
+        except json.JSONDecodeError:
+            text = None
+        self._string = None
+        if not self._after_colon:
+            self._key = text
+        elif self._key == "title":
+            self.title = text
+
+    def _end_step(self) -> Optional[PlanStep]:
+        raw = "".join(self._step)
+        self._step = None
+        try:
+            step = json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(step, dict):
+            return None
+        event = PlanStep(self.steps_emitted, step, self.title)
+        self.steps_emitted += 1
+        return event
@@ -0,0 +1,100 @@
+"""
+Opt-in sampling profiler.
+
+StackSampler runs a background thread that samples the event loop thread's
+Python stack every PROFILE_INTERVAL_MS and counts identical stacks. The
+result uses the "folded" format (`outer;inner;leaf count` per line) read by
+flamegraph.pl, speedscope and similar tools.
+
+The event loop serves every request, so a profile shows what the worker did
+while the profiled request ran, including other requests interleaved with
+it. Only one profile runs at a time, and the last PROFILE_KEEP profiles are
+kept in memory.
+"""
+import os
+import sys
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, Optional
+
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples one thread's stack at a fixed interval from a daemon thread."""
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = PROFILE_INTERVAL_MS / 1000):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()  # a sample is recorded entirely before or after stop()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling without joining: this runs on the event loop, which must not block."""
+        with self._lock:
+            self._stop.set()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            with self._lock:
+                if self._stop.is_set():
+                    return
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class Profiler:
+    """At most one running StackSampler plus the most recent finished profiles."""
+
+    def __init__(self, keep: int = PROFILE_KEEP):
+        self.keep = keep
+        self._running: Dict[str, StackSampler] = {}
+        self._finished: "OrderedDict[str, str]" = OrderedDict()
+
+    def start(self, profile_id: str) -> Optional[str]:
+        """Start sampling the calling (event loop) thread; None if a profile is already running."""
+        if self._running:
+            return None
+        sampler = StackSampler()
+        self._running[profile_id] = sampler
+        sampler.start()
+        return profile_id
+
+    def stop(self, profile_id: str) -> None:
+        sampler = self._running.pop(profile_id, None)
+        if sampler is None:
+            return
+        sampler.stop()
+        self._finished[profile_id] = sampler.folded()
+        while len(self._finished) > self.keep:
+            self._finished.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[str]:
+        return self._finished.get(profile_id)
+
+
+profiler = Profiler()
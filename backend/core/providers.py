@@ -0,0 +1,218 @@
+"""
+Chat completion providers behind core.llm.stream_chat.
+
+A provider turns a list of chat messages into an async stream of
+OpenAI-style ``ChatCompletionChunk`` objects. The active provider is chosen
+from the environment:
+
+    LLM_PROVIDER=openai   (default) real OpenAI API, honours OPENAI_BASE_URL
+    LLM_PROVIDER=mock     offline stand-in for load and capacity tests
+    LLM_MODEL=gpt-4o      model name passed to the provider
+"""
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletionChunk
+
+DEFAULT_MODEL = "gpt-4o"
+
+
+class LLMProvider(ABC):
+    """Base class for streaming chat completion backends."""
+
+    name = "base"
+
+    def __init__(self, model: str = DEFAULT_MODEL):
+        self.model = model
+
+    @abstractmethod
+    def stream(self, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]]) -> AsyncIterator[ChatCompletionChunk]:
+        """Stream completion chunks for `messages`, offering `tools`."""
+
+
+class OpenAIProvider(LLMProvider):
+    """Streams completions from the OpenAI API (or any compatible endpoint)."""
+
+    name = "openai"
+
+    def __init__(self, model: str = DEFAULT_MODEL, api_key: Optional[str] = None, base_url: Optional[str] = None):
+        super().__init__(model)
+        self.client = AsyncOpenAI(
+            api_key=api_key or os.environ.get("OPENAI_API_KEY"),
+            base_url=base_url or os.environ.get("OPENAI_BASE_URL") or None,
+        )
+
+    async def stream(self, messages, tools):
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            tools=tools,
+            stream=True
+        )
+        try:
+            async for chunk in response:
+                yield chunk
+        finally:
+            # Closing the HTTP response stops generation (and billing) when the turn is cancelled
+            await response.close()
+
+
+# --- Mock provider ---
+
+MOCK_RESPONSE = (
+    "Understood. Before we lock in deadlines, confirm the jurisdiction and the date of service, "
+    "since response windows vary by court. Here is a phased roadmap: we start with research on the "
+    "governing standard, then draft the moving papers and supporting declarations, file and serve "
+    "them, and finally prepare for oral argument. I've updated the plan on the right."
+)
+
+MOCK_STEPS = [
+    ("Research", "Research the governing standard and controlling precedent in the jurisdiction."),
+    ("Gather Evidence", "Collect declarations, exhibits and deposition excerpts supporting each element."),
+    ("Draft", "Draft the notice of motion, memorandum of law and statement of undisputed facts."),
+    ("File", "File the moving papers with the court; confirm local formatting rules."),
+    ("Serve", "Serve opposing counsel and calendar the opposition deadline (typically 14-21 days)."),
+    ("Prepare Argument", "Prepare an outline for oral argument and anticipate counterarguments."),
+]
+
+# Roughly how OpenAI tokenizers split English text: a word plus its leading space.
+_TOKEN_RE = re.compile(r"\s*\S+")
+
+
+def split_tokens(text: str) -> List[str]:
+    """Split text into token-sized pieces for simulated streaming."""
+    return _TOKEN_RE.findall(text)
+
+
+def split_fragments(text: str, size: int = 4) -> List[str]:
+    """Split serialized tool arguments into fragments like streamed argument deltas."""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class MockProvider(LLMProvider):
+    """
+    Offline stand-in that streams a realistic answer and a manage_plan call.
+
+    Pacing is controlled by ``ttft_ms`` (delay before the first chunk) and
+    ``tokens_per_second`` (delay between chunks; 0 disables pacing).
+    """
+
+    name = "mock"
+
+    def __init__(
+        self,
+        model: str = "mock-gpt",
+        tokens_per_second: float = 50.0,
+        ttft_ms: float = 300.0,
+        tool_calls: bool = True,
+        text: str = MOCK_RESPONSE,
+    ):
+        super().__init__(model)
+        self.tokens_per_second = tokens_per_second
+        self.ttft_ms = ttft_ms
+        self.tool_calls = tool_calls
+        self.text = text
+
+    def build_plan(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Derive a plausible manage_plan payload from the latest user message."""
+        last_user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        words = last_user.split()[:6]
+        title = " ".join(words).strip(" .?!") or "Untitled Strategy"
+        return {
+            "title": f"{title} Strategy" if words else title,
+            "steps": [
+                {"id": str(i), "title": step_title, "description": description, "status": "pending"}
+                for i, (step_title, description) in enumerate(MOCK_STEPS, start=1)
+            ],
+        }
+
+    def build_tool_call(self, messages: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+        """Name and arguments of the tool call emitted after the text."""
+        return "manage_plan", self.build_plan(messages)
+
+    def build_tool_calls(self, messages: List[Dict[str, Any]]) -> List[Tuple[str, Dict[str, Any]]]:
+        """Every tool call emitted after the text, in index order."""
+        return [self.build_tool_call(messages)]
+
+    def _chunk(self, completion_id: str, delta: Dict[str, Any], finish_reason: Optional[str] = None) -> ChatCompletionChunk:
+        return ChatCompletionChunk.model_validate({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": self.model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        })
+
+    async def stream(self, messages, tools):
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        interval = 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+        deltas: List[Dict[str, Any]] = [{"role": "assistant", "content": ""}]
+        deltas += [{"content": token} for token in split_tokens(self.text)]
+
+        tool_names = {t.get("function", {}).get("name") for t in tools or []}
+        calls = self.build_tool_calls(messages) if self.tool_calls else []
+        calls = [(name, args) for name, args in calls if name in tool_names]
+        use_tool = bool(calls)
+        for index, (tool_name, tool_args) in enumerate(calls):
+            arguments = json.dumps(tool_args)
+            call_id = f"call_mock_{uuid.uuid4().hex[:12]}"
+            for i, fragment in enumerate(split_fragments(arguments)):
+                tool_call: Dict[str, Any] = {"index": index, "function": {"arguments": fragment}}
+                if i == 0:
+                    tool_call.update({"id": call_id, "type": "function"})
+                    tool_call["function"]["name"] = tool_name
+                deltas.append({"tool_calls": [tool_call]})
+
+        if self.ttft_ms > 0:
+            await asyncio.sleep(self.ttft_ms / 1000)
+
+        for i, delta in enumerate(deltas):
+            if i > 0 and interval:
+                await asyncio.sleep(interval)
+            yield self._chunk(completion_id, delta)
+
+        yield self._chunk(completion_id, {}, finish_reason="tool_calls" if use_tool else "stop")
+
+
+# --- Selection ---
+
+_provider: Optional[LLMProvider] = None
+
+
+def create_provider(name: Optional[str] = None) -> LLMProvider:
+    """Build a provider from configuration."""
+    name = (name or os.getenv("LLM_PROVIDER", "openai")).strip().lower()
+    model = os.getenv("LLM_MODEL")
+
+    if name == "openai":
+        return OpenAIProvider(model=model or DEFAULT_MODEL)
+    if name == "mock":
+        return MockProvider(
+            model=model or "mock-gpt",
+            tokens_per_second=float(os.getenv("MOCK_LLM_TOKENS_PER_SECOND", "50")),
+            ttft_ms=float(os.getenv("MOCK_LLM_TTFT_MS", "300")),
+            tool_calls=os.getenv("MOCK_LLM_TOOL_CALLS", "true").lower() in ("1", "true", "yes"),
+        )
+    raise ValueError(f"Unknown LLM_PROVIDER '{name}' (expected 'openai' or 'mock')")
+
+
+def get_provider() -> LLMProvider:
+    """Return the process-wide provider, creating it on first use."""
+    global _provider
+    if _provider is None:
+        _provider = create_provider()
+    return _provider
+
+
+def set_provider(provider: Optional[LLMProvider]) -> None:
+    """Replace the process-wide provider (None resets to configuration on next use)."""
+    global _provider
+    _provider = provider
@@ -0,0 +1,121 @@
+"""
+Admission control: token-bucket rate limits and in-flight caps.
+
+Bucket state lives in a RateLimitStore. The default InMemoryRateLimitStore
+is per process; a shared store (e.g. Redis) can be plugged in with
+set_rate_limit_store by implementing ``acquire``.
+
+Rejections raise RateLimitExceeded, which main.py turns into a 429 with a
+Retry-After header.
+"""
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request must be rejected; retry_after is in seconds."""
+
+    def __init__(self, retry_after: float, detail: str = "Too many requests"):
+        super().__init__(detail)
+        self.retry_after = retry_after
+        self.detail = detail
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+def parse_rate(value: str) -> Tuple[float, float]:
+    """Parse "<requests>/<seconds>" into (capacity, refill tokens per second)."""
+    requests, seconds = value.split("/")
+    capacity = float(requests)
+    return capacity, capacity / float(seconds)
+
+
+class RateLimitStore(ABC):
+    """Holds token buckets. Implementations must make acquire atomic per key."""
+
+    @abstractmethod
+    async def acquire(self, key: str, capacity: float, refill_rate: float, cost: float = 1.0) -> float:
+        """Take `cost` tokens from the bucket. Returns 0 when allowed, else seconds until it would be."""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Drop every bucket."""
+
+
+class InMemoryRateLimitStore(RateLimitStore):
+    """Process-local buckets; the least recently used keys are dropped past max_keys."""
+
+    def __init__(self, max_keys: int = 100_000, clock: Callable[[], float] = time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def acquire(self, key, capacity, refill_rate, cost=1.0):
+        now = self.clock()
+        tokens, updated = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill_rate)
+
+        if tokens >= cost:
+            tokens -= cost
+            retry_after = 0.0
+        else:
+            retry_after = (cost - tokens) / refill_rate if refill_rate > 0 else math.inf
+
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    def clear(self):
+        self._buckets.clear()
+
+
+_store: RateLimitStore = InMemoryRateLimitStore()
+
+
+def get_rate_limit_store() -> RateLimitStore:
+    return _store
+
+
+def set_rate_limit_store(store: RateLimitStore) -> None:
+    global _store
+    _store = store
+
+
+class RateLimit:
+    """A named token-bucket policy, e.g. RateLimit("login-ip", "20/60")."""
+
+    def __init__(self, name: str, rate: str):
+        self.name = name
+        self.capacity, self.refill_rate = parse_rate(rate)
+
+    async def hit(self, key: str, store: Optional[RateLimitStore] = None) -> None:
+        store = store or get_rate_limit_store()
+        retry_after = await store.acquire(f"{self.name}:{key}", self.capacity, self.refill_rate)
+        if retry_after > 0:
+            raise RateLimitExceeded(retry_after)
+
+
+class InFlightLimit:
+    """Caps concurrent operations; callers beyond the cap fail fast instead of queueing."""
+
+    def __init__(self, limit: int, retry_after: float = 1.0):
+        self.limit = limit
+        self.retry_after = retry_after
+        self.in_flight = 0
+
+    async def __aenter__(self):
+        if self.in_flight >= self.limit:
+            raise RateLimitExceeded(self.retry_after, "Server busy, try again shortly")
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.in_flight -= 1
+        return False
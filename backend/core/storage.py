@@ -0,0 +1,487 @@
+"""
+Repositories for users, plans and chat sessions.
+
+The API reads and writes through the process-wide Storage instead of calling
+Beanie documents directly. The backend is chosen from the environment:
+
+    STORAGE_BACKEND=mongo    (default) Beanie/MongoDB, initialized in main's lifespan
+    STORAGE_BACKEND=memory   process-local dicts; nothing is persisted. For tests,
+                             benchmarks and local runs without a database.
+    STORAGE_WRITE_BEHIND=true  queue chat turn writes and flush them in batches
+                               (core.write_behind)
+
+Both backends hand out the same Beanie document classes (User, Plan,
+ChatSession, ChatMessage), so responses serialize identically. The memory
+backend builds them with model_construct, which needs no initialized
+collection, and stores copies, so changing a returned object only takes effect
+through a repository call, as with MongoDB.
+"""
+import os
+from abc import ABC, abstractmethod
+from copy import deepcopy
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from beanie import PydanticObjectId
+from pymongo import DESCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from core import chat_store
+from core.cache import invalidate_user
+from core.database import read_preference
+from core.plan_patch import PlanPatchError, apply_plan_patch, plan_patch_writes
+from models import ChatMessage, ChatSession, Plan, PlanSummary, User
+
+# (updated_at, _id) of the last plan on the previous page
+PlanCursor = Tuple[datetime, PydanticObjectId]
+
+# Times a positional patch is recomputed when another write changed the plan first
+PATCH_ATTEMPTS = 5
+
+
+class UserRepository(ABC):
+    """Accounts, unique by email."""
+
+    @abstractmethod
+    async def get_by_email(self, email: str) -> Optional[User]:
+        ...
+
+    @abstractmethod
+    async def create(self, email: str, hashed_password: str) -> User:
+        """Insert a user; raises pymongo's DuplicateKeyError if the email is taken."""
+
+    @abstractmethod
+    async def set_password(self, user: User, hashed_password: str) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, user: User) -> None:
+        ...
+
+
+class PlanRepository(ABC):
+    """Plans, always looked up together with their owner."""
+
+    @abstractmethod
+    async def get(self, plan_id: PydanticObjectId, user_id: PydanticObjectId) -> Optional[Plan]:
+        ...
+
+    @abstractmethod
+    async def create(self, user_id: PydanticObjectId, title: str, **fields: Any) -> Plan:
+        ...
+
+    @abstractmethod
+    async def list_summaries(
+        self, user_id: PydanticObjectId, limit: int, after: Optional[PlanCursor] = None
+    ) -> List[PlanSummary]:
+        """Up to `limit` plans newest first by (updated_at, _id), strictly after `after`."""
+
+    @abstractmethod
+    async def save(self, plan: Plan) -> None:
+        """Store the whole plan (manage_plan rewrites)."""
+
+    @abstractmethod
+    async def save_many(self, plans: List[Plan]) -> None:
+        """Store the title, steps and updated_at of existing plans, in one batch where possible."""
+
+    @abstractmethod
+    async def patch(self, plan: Plan, operations: List[Dict[str, Any]], title: Optional[str] = None) -> None:
+        """
+        Apply patch_plan operations to the stored plan, as it is now, and
+        copy the result to `plan` with its new updated_at. Raises
+        PlanPatchError before writing anything if the operations do not apply
+        or the plan no longer exists.
+        """
+
+    @abstractmethod
+    async def delete(self, plan: Plan) -> None:
+        ...
+
+
+class ChatRepository(ABC):
+    """Chat sessions (one per plan) and their messages."""
+
+    @abstractmethod
+    async def get_session(self, plan_id: PydanticObjectId) -> Optional[ChatSession]:
+        ...
+
+    @abstractmethod
+    async def create_session(self, plan_id: PydanticObjectId, user_id: PydanticObjectId) -> ChatSession:
+        ...
+
+    @abstractmethod
+    async def append_message(self, chat_session: ChatSession, message: Dict[str, Any]) -> ChatMessage:
+        """Store the message under the session's next seq; raises chat_store.ChatSessionGone once it is deleted."""
+
+    @abstractmethod
+    async def store_messages(self, messages: List[ChatMessage]) -> None:
+        """Same contract as core.chat_store.store_messages (messages already carry their seq)."""
+
+    @abstractmethod
+    async def get_messages(
+        self,
+        session_id: PydanticObjectId,
+        limit: int = chat_store.HISTORY_PAGE_SIZE,
+        before: Optional[int] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Same contract as core.chat_store.get_messages."""
+
+    @abstractmethod
+    async def delete_for_plan(self, plan_id: PydanticObjectId) -> None:
+        """Delete the plan's session and all of its messages."""
+
+
+class Storage:
+    """The repositories of one backend."""
+
+    name = "base"
+    users: UserRepository
+    plans: PlanRepository
+    chats: ChatRepository
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+# --- MongoDB ---
+
+class MongoUserRepository(UserRepository):
+    async def get_by_email(self, email):
+        return await User.find_one(User.email == email)
+
+    async def create(self, email, hashed_password):
+        user = User(email=email, hashed_password=hashed_password)
+        await user.insert()
+        return user
+
+    async def set_password(self, user, hashed_password):
+        await user.set({User.hashed_password: hashed_password})
+
+    async def delete(self, user):
+        await user.delete()
+
+
+class MongoPlanRepository(PlanRepository):
+    async def get(self, plan_id, user_id):
+        return await Plan.find_one(Plan.id == plan_id, Plan.user_id == user_id)
+
+    async def create(self, user_id, title, **fields):
+        plan = Plan(title=title, user_id=user_id, **fields)
+        await plan.insert()
+        return plan
+
+    async def list_summaries(self, user_id, limit, after=None):
+        query = {"user_id": user_id}
+        if after:
+            updated_at, plan_id = after
+            query["$or"] = [
+                {"updated_at": {"$lt": updated_at}},
+                {"updated_at": updated_at, "_id": {"$lt": plan_id}},
+            ]
+        collection = Plan.get_motor_collection()
+        preference = read_preference("list_user_plans")
+        if preference:
+            # Beanie queries always use the client default
+            collection = collection.with_options(read_preference=preference)
+        cursor = collection.find(query, projection=PlanSummary.Settings.projection)
+        cursor = cursor.sort([("updated_at", DESCENDING), ("_id", DESCENDING)]).limit(limit)
+        return [PlanSummary.model_validate(doc) async for doc in cursor]
+
+    async def save(self, plan):
+        await plan.save()
+
+    async def save_many(self, plans):
+        if not plans:
+            return
+        await Plan.get_motor_collection().bulk_write(
+            [
+                UpdateOne({"_id": p.id}, {"$set": {"title": p.title, "steps": p.steps, "updated_at": p.updated_at}})
+                for p in plans
+            ],
+            ordered=False,
+        )
+
+    async def patch(self, plan, operations, title=None):
+        collection = Plan.get_motor_collection()
+        # add and reorder place steps by position in the stored order, so they only apply to the
+        # version they were computed from; update and remove address steps by id and apply to any
+        positional = isinstance(operations, list) and any(
+            isinstance(operation, dict) and operation.get("op") in ("add", "reorder") for operation in operations
+        )
+        for _ in range(PATCH_ATTEMPTS):
+            stored = await collection.find_one({"_id": plan.id}, projection={"steps": 1, "updated_at": 1})
+            if stored is None:
+                raise PlanPatchError("The plan no longer exists")
+            steps = stored.get("steps") or []
+            new_steps = apply_plan_patch(steps, operations)
+            read_at = stored.get("updated_at")
+            # Stored times have millisecond precision; every write must change the version
+            updated_at = max(datetime.utcnow(), read_at + timedelta(milliseconds=1)) if read_at else datetime.utcnow()
+
+            if positional:
+                fields = {"steps": new_steps, "updated_at": updated_at}
+                if title:
+                    fields["title"] = title
+                result = await collection.update_one({"_id": plan.id, "updated_at": read_at}, {"$set": fields})
+                if not result.matched_count:
+                    continue  # another write got in first; reapply to what it stored
+            else:
+                # Send only the touched steps instead of rewriting the document
+                writes = plan_patch_writes(
+                    {"_id": plan.id}, steps, operations,
+                    title=title, extra_set={"updated_at": updated_at}
+                )
+                await collection.bulk_write(writes, ordered=True)
+
+            plan.steps = new_steps
+            plan.title = title or plan.title
+            plan.updated_at = updated_at
+            return
+        raise PlanPatchError("The plan kept changing while the patch was applied; try again")
+
+    async def delete(self, plan):
+        await plan.delete()
+
+
+class MongoChatRepository(ChatRepository):
+    async def get_session(self, plan_id):
+        chat_session = await ChatSession.find_one(ChatSession.plan_id == plan_id)
+        if chat_session:
+            await chat_store.migrate_session(chat_session)
+        return chat_session
+
+    async def create_session(self, plan_id, user_id):
+        chat_session = ChatSession(plan_id=plan_id, user_id=user_id)
+        await chat_session.insert()
+        return chat_session
+
+    async def append_message(self, chat_session, message):
+        return await chat_store.append_message(chat_session, message)
+
+    async def store_messages(self, messages):
+        await chat_store.store_messages(messages)
+
+    async def get_messages(self, session_id, limit=chat_store.HISTORY_PAGE_SIZE, before=None):
+        return await chat_store.get_messages(session_id, limit=limit, before=before)
+
+    async def delete_for_plan(self, plan_id):
+        await ChatMessage.find_many(ChatMessage.plan_id == plan_id).delete()
+        await ChatSession.find_many(ChatSession.plan_id == plan_id).delete()
+
+
+class MongoStorage(Storage):
+    """Beanie documents; main's lifespan connects and runs init_beanie."""
+
+    name = "mongo"
+
+    def __init__(self):
+        self.users = MongoUserRepository()
+        self.plans = MongoPlanRepository()
+        self.chats = MongoChatRepository()
+
+
+# --- In-memory ---
+# Each method runs without awaiting anything, so it is atomic on the event loop.
+
+def new_document(document_class, **fields):
+    """Build a document with its id assigned, without needing an initialized collection."""
+    # model_construct skips Document.__init__, which requires one
+    fields.setdefault("id", PydanticObjectId())
+    return document_class.model_construct(**fields)
+
+
+def _copy(document):
+    return document.model_copy(deep=True)
+
+
+class MemoryUserRepository(UserRepository):
+    def __init__(self):
+        self._by_email: Dict[str, User] = {}
+
+    async def get_by_email(self, email):
+        user = self._by_email.get(email)
+        return _copy(user) if user else None
+
+    async def create(self, email, hashed_password):
+        if email in self._by_email:
+            raise DuplicateKeyError(f"E11000 duplicate key error collection: users index: email_1 dup key: {email}")
+        user = new_document(User, email=email, hashed_password=hashed_password)
+        self._by_email[email] = _copy(user)
+        return user
+
+    async def set_password(self, user, hashed_password):
+        user.hashed_password = hashed_password
+        stored = self._by_email.get(user.email)
+        if stored and stored.id == user.id:
+            stored.hashed_password = hashed_password
+        invalidate_user(user)
+
+    async def delete(self, user):
+        stored = self._by_email.get(user.email)
+        if stored and stored.id == user.id:
+            del self._by_email[user.email]
+        invalidate_user(user)
+
+
+class MemoryPlanRepository(PlanRepository):
+    def __init__(self):
+        self._plans: Dict[PydanticObjectId, Plan] = {}
+
+    async def get(self, plan_id, user_id):
+        plan = self._plans.get(plan_id)
+        return _copy(plan) if plan and plan.user_id == user_id else None
+
+    async def create(self, user_id, title, **fields):
+        now = datetime.utcnow()
+        fields.setdefault("created_at", now)
+        fields.setdefault("updated_at", now)
+        plan = new_document(Plan, title=title, user_id=user_id, **fields)
+        self._plans[plan.id] = _copy(plan)
+        return plan
+
+    async def list_summaries(self, user_id, limit, after=None):
+        plans = [p for p in self._plans.values() if p.user_id == user_id]
+        if after:
+            plans = [p for p in plans if (p.updated_at, p.id) < after]
+        plans.sort(key=lambda p: (p.updated_at, p.id), reverse=True)
+        return [PlanSummary(id=p.id, title=p.title, updated_at=p.updated_at) for p in plans[:limit]]
+
+    async def save(self, plan):
+        self._plans[plan.id] = _copy(plan)
+
+    async def save_many(self, plans):
+        for plan in plans:
+            stored = self._plans.get(plan.id)
+            if stored:
+                stored.title, stored.steps, stored.updated_at = plan.title, deepcopy(plan.steps), plan.updated_at
+
+    async def patch(self, plan, operations, title=None):
+        stored = self._plans.get(plan.id)
+        if stored is None:
+            raise PlanPatchError("The plan no longer exists")
+        stored.steps = apply_plan_patch(stored.steps, operations)
+        stored.title = title or stored.title
+        stored.updated_at = datetime.utcnow()
+        plan.steps = deepcopy(stored.steps)
+        plan.title = stored.title
+        plan.updated_at = stored.updated_at
+
+    async def delete(self, plan):
+        self._plans.pop(plan.id, None)
+
+
+class MemoryChatRepository(ChatRepository):
+    def __init__(self):
+        self._sessions: Dict[PydanticObjectId, ChatSession] = {}  # by plan_id
+        self._messages: Dict[PydanticObjectId, List[ChatMessage]] = {}  # by session_id, in seq order
+
+    async def get_session(self, plan_id):
+        chat_session = self._sessions.get(plan_id)
+        return _copy(chat_session) if chat_session else None
+
+    async def create_session(self, plan_id, user_id):
+        now = datetime.utcnow()
+        chat_session = new_document(ChatSession, plan_id=plan_id, user_id=user_id, created_at=now, updated_at=now)
+        self._sessions[plan_id] = _copy(chat_session)
+        self._messages[chat_session.id] = []
+        return chat_session
+
+    async def append_message(self, chat_session, message):
+        chat_session.updated_at = datetime.utcnow()
+        stored_session = self._sessions.get(chat_session.plan_id)
+        if not stored_session or stored_session.id != chat_session.id:
+            raise chat_store.ChatSessionGone(f"Chat session {chat_session.id} no longer exists")
+        stored_session.message_count += 1
+        stored_session.updated_at = chat_session.updated_at
+        chat_session.message_count = stored_session.message_count
+
+        fields = {k: v for k, v in message.items() if k in chat_store.MESSAGE_FIELDS - {"seq"}}
+        stored = new_document(
+            ChatMessage,
+            session_id=chat_session.id,
+            plan_id=chat_session.plan_id,
+            seq=chat_session.message_count,
+            **fields,
+        )
+        self._messages.setdefault(chat_session.id, []).append(_copy(stored))
+        return stored
+
+    async def store_messages(self, messages):
+        for message in messages:
+            stored = self._messages.setdefault(message.session_id, [])
+            if any(m.id == message.id for m in stored):
+                continue
+            chat_session = self._sessions.get(message.plan_id)
+            count = chat_session.message_count if chat_session else 0
+            if any(m.seq == message.seq for m in stored):
+                message.seq = count + 1
+            if chat_session:
+                chat_session.message_count = max(count, message.seq)
+                chat_session.updated_at = datetime.utcnow()
+            stored.append(_copy(message))
+            stored.sort(key=lambda m: m.seq)
+
+    async def get_messages(self, session_id, limit=chat_store.HISTORY_PAGE_SIZE, before=None):
+        messages = self._messages.get(session_id, [])
+        if before is not None:
+            messages = [m for m in messages if m.seq < before]
+        page = messages[-(limit + 1):]
+        has_more = len(page) > limit
+        page = page[-limit:]
+
+        next_cursor = page[0].seq if has_more and page else None
+        return [chat_store.to_dict(m) for m in page], next_cursor
+
+    async def delete_for_plan(self, plan_id):
+        chat_session = self._sessions.pop(plan_id, None)
+        if chat_session:
+            self._messages.pop(chat_session.id, None)
+
+
+class MemoryStorage(Storage):
+    """Process-local storage; everything is lost on restart."""
+
+    name = "memory"
+
+    def __init__(self):
+        self.users = MemoryUserRepository()
+        self.plans = MemoryPlanRepository()
+        self.chats = MemoryChatRepository()
+
+
+# --- Selection ---
+
+_storage: Optional[Storage] = None
+
+
+def create_storage(name: Optional[str] = None) -> Storage:
+    """Build a storage backend from configuration."""
+    name = (name or os.getenv("STORAGE_BACKEND", "mongo")).strip().lower()
+    if name == "mongo":
+        storage = MongoStorage()
+    elif name == "memory":
+        storage = MemoryStorage()
+    else:
+        raise ValueError(f"Unknown STORAGE_BACKEND '{name}' (expected 'mongo' or 'memory')")
+
+    if os.getenv("STORAGE_WRITE_BEHIND", "false").lower() in ("1", "true", "yes"):
+        from core.write_behind import WriteBehindStorage
+        storage = WriteBehindStorage(storage)
+    return storage
+
+
+def get_storage() -> Storage:
+    """Return the process-wide storage, creating it on first use."""
+    global _storage
+    if _storage is None:
+        _storage = create_storage()
+    return _storage
+
+
+def set_storage(storage: Optional[Storage]) -> None:
+    """Replace the process-wide storage (None resets to configuration on next use)."""
+    global _storage
+    _storage = storage
@@ -0,0 +1,32 @@
+"""
+Running the tool calls of one model turn.
+
+A turn can contain several tool calls. Calls that touch the same resource
+(e.g. the same plan) run one after another in the order the model issued
+them, so later edits see earlier ones; calls on different resources run
+concurrently.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Sequence, TypeVar
+
+T = TypeVar("T")
+
+
+async def dispatch_tool_calls(
+    calls: Sequence[T],
+    execute: Callable[[T], Awaitable[Any]],
+    resource_of: Callable[[T], Hashable],
+) -> List[Any]:
+    """Run execute(call) for every call and return the results in call order."""
+    groups: Dict[Hashable, List[int]] = {}
+    for position, call in enumerate(calls):
+        groups.setdefault(resource_of(call), []).append(position)
+
+    results: List[Any] = [None] * len(calls)
+
+    async def run_in_order(positions: List[int]):
+        for position in positions:
+            results[position] = await execute(calls[position])
+
+    await asyncio.gather(*(run_in_order(positions) for positions in groups.values()))
+    return results
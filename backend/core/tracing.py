@@ -0,0 +1,185 @@
+"""
+Per-request tracing spans.
+
+TracingMiddleware starts a Trace for every HTTP request. Code on the request
+path times its stages with `span("db.plan")`; spans opened in tasks started
+by the request (such as chat turns) land in the same trace, because tasks
+copy the context they were created in. Outside a request, span() does
+nothing.
+
+Each request reports its spans twice:
+  - a Server-Timing header with the spans finished before the response
+    started (auth, lookups); stages that run while a response streams
+    cannot be in the header,
+  - one structured log line (logger "legal_lens.trace", JSON) once the
+    response body is complete, with every span and its offset.
+
+Requests that send `X-Profile: <PROFILING_TOKEN>` are also sampled by
+core.profiling.StackSampler. The folded stacks are stored under the returned
+X-Profile-Id and served by GET /debug/profiles/{profile_id}.
+"""
+import json
+import logging
+import os
+import secrets
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from core.profiling import profiler
+
+logger = logging.getLogger("legal_lens.trace")
+
+# Requests faster than this are not logged (0 logs every request)
+TRACE_LOG_MIN_MS = float(os.getenv("TRACE_LOG_MIN_MS", "0"))
+# Enables the per-request profiler for requests that send it in X-Profile
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+
+
+class Span:
+    """One timed stage of a request."""
+
+    __slots__ = ("trace", "name", "attributes", "start", "duration")
+
+    def __init__(self, trace: "Trace", name: str, attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def end(self) -> None:
+        if self.duration is None:
+            self.duration = time.perf_counter() - self.start
+            self.trace.spans.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.end()
+
+
+class _NoSpan:
+    """Stand-in when no trace is active; every method is a no-op."""
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Trace:
+    """Finished spans of one request."""
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.start = time.perf_counter()
+        self.spans: List[Span] = []
+
+    def server_timing(self) -> str:
+        """Server-Timing header value; repeated span names are summed."""
+        totals: Dict[str, float] = {}
+        for s in self.spans:
+            totals[s.name] = totals.get(s.name, 0.0) + s.duration
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(entries)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "spans": [
+                {
+                    "name": s.name,
+                    "start_ms": round((s.start - self.start) * 1000, 2),
+                    "duration_ms": round(s.duration * 1000, 2),
+                    **s.attributes,
+                }
+                for s in sorted(self.spans, key=lambda s: s.start)
+            ],
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def span(name: str, **attributes: Any):
+    """Time a stage of the current request: `with span("db.plan"):` or `s = span(...)` ... `s.end()`."""
+    trace = _current.get()
+    if trace is None:
+        return _NO_SPAN
+    return Span(trace, name, attributes)
+
+
+class TracingMiddleware:
+    """ASGI middleware that traces each HTTP request (see module docstring)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        trace = Trace()
+        token = _current.set(trace)
+        headers = dict(scope.get("headers") or [])
+        profile_id = None
+        if PROFILING_TOKEN and secrets.compare_digest(headers.get(b"x-profile", b""), PROFILING_TOKEN.encode()):
+            profile_id = profiler.start(trace.trace_id)
+        status = 500
+
+        async def traced_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                extra = [
+                    (b"server-timing", trace.server_timing().encode()),
+                    (b"x-trace-id", trace.trace_id.encode()),
+                ]
+                if profile_id:
+                    extra.append((b"x-profile-id", profile_id.encode()))
+                message = {**message, "headers": list(message.get("headers", [])) + extra}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, traced_send)
+        finally:
+            _current.reset(token)
+            if profile_id:
+                profiler.stop(profile_id)
+            self._log(trace, scope, status)
+
+    @staticmethod
+    def _log(trace: Trace, scope, status: int):
+        duration_ms = (time.perf_counter() - trace.start) * 1000
+        if duration_ms < TRACE_LOG_MIN_MS or not logger.isEnabledFor(logging.INFO):
+            return
+        record = {
+            "method": scope.get("method"),
+            "path": scope.get("path"),
+            "status": status,
+            "duration_ms": round(duration_ms, 2),
+            **trace.to_dict(),
+        }
+        logger.info(json.dumps(record, default=str))
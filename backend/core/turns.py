@@ -0,0 +1,187 @@
+"""
+Chat turns that outlive the HTTP connection.
+
+/api/chat starts each turn as a server-side task that writes its events into
+a TurnBuffer, numbering them from 0. Responses only follow the buffer, so a
+client that drops mid-answer can reconnect with the last sequence number it
+saw and get the missed events replayed. The turn itself (LLM call, plan
+update, saved messages) runs exactly once either way.
+
+Buffers are per process: reconnects have to reach the worker that started
+the turn (sticky sessions when running several workers). Finished turns are
+kept for TURN_RETENTION_SECONDS so late reconnects can still replay them.
+
+A turn that loses its last follower gets TURN_ABANDON_GRACE_SECONDS to be
+picked up again (a reload or a flaky network). After that it is cancelled so
+we stop pulling tokens from the provider; save_and_stream stores the partial
+answer marked as truncated.
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from core.events import StreamError, StreamEvent, Usage
+from core.metrics import Gauge, turn_cancellations, turn_duration
+
+logger = logging.getLogger(__name__)
+
+TURN_RETENTION_SECONDS = float(os.getenv("TURN_RETENTION_SECONDS", "300"))
+TURN_ABANDON_GRACE_SECONDS = float(os.getenv("TURN_ABANDON_GRACE_SECONDS", "15"))
+
+
+class TurnBuffer:
+    """Events of one turn, appended by its task and replayed to any number of followers."""
+
+    def __init__(self, turn_id: str, owner_id: str):
+        self.turn_id = turn_id
+        self.owner_id = owner_id
+        self.events: List[StreamEvent] = []
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self.followers = 0
+        self.generated = False  # upstream generation has finished (usage was reported)
+        self.cancelled = False
+        self.on_abandoned: Optional[Callable[["TurnBuffer"], None]] = None
+        self.abandon_timer: Optional[asyncio.TimerHandle] = None  # pending cancel while nobody follows
+        self._changed = asyncio.Event()
+
+    def append(self, event: StreamEvent) -> None:
+        self.events.append(event)
+        self._notify()
+
+    def finish(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self._cancel_abandon_timer()
+        self.done = True
+        self.finished_at = clock()
+        self._notify()
+
+    def _cancel_abandon_timer(self):
+        if self.abandon_timer is not None:
+            self.abandon_timer.cancel()
+            self.abandon_timer = None
+
+    def _notify(self):
+        # Wake current followers; later waits use a fresh event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self, after: int = -1) -> AsyncIterator[Tuple[int, StreamEvent]]:
+        """Yield (seq, event) for every event after seq `after`, then wait for more until the turn ends."""
+        seq = after + 1
+        self.followers += 1
+        self._cancel_abandon_timer()  # picked up again within the grace period
+        try:
+            while True:
+                while seq < len(self.events):
+                    yield seq, self.events[seq]
+                    seq += 1
+                if self.done:
+                    return
+                await self._changed.wait()
+        finally:
+            self.followers -= 1
+            if self.followers == 0 and not self.done and self.on_abandoned:
+                self.on_abandoned(self)
+
+
+class TurnRegistry:
+    """Running and recently finished turns of this process."""
+
+    def __init__(
+        self,
+        retention: float = TURN_RETENTION_SECONDS,
+        abandon_grace: float = TURN_ABANDON_GRACE_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.retention = retention
+        self.abandon_grace = abandon_grace
+        self.clock = clock
+        self._turns: Dict[str, TurnBuffer] = {}
+
+    def new_turn_id(self) -> str:
+        return uuid.uuid4().hex
+
+    def start(self, turn_id: str, owner_id: str, events: AsyncIterator[StreamEvent]) -> TurnBuffer:
+        """Run `events` to completion in the background, buffering everything it yields."""
+        self._expire()
+        buffer = TurnBuffer(turn_id, owner_id)
+        buffer.on_abandoned = self._schedule_cancel
+        self._turns[turn_id] = buffer
+        buffer.task = asyncio.create_task(self._run(buffer, events))
+        return buffer
+
+    async def _run(self, buffer: TurnBuffer, events: AsyncIterator[StreamEvent]):
+        started = time.perf_counter()
+        outcome = "completed"
+        try:
+            async for event in events:
+                buffer.append(event)
+                if isinstance(event, Usage):
+                    buffer.generated = True
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            if not buffer.cancelled:
+                raise
+            buffer.append(StreamError("The answer was stopped because no client was connected."))
+        except Exception:
+            outcome = "failed"
+            logger.exception("chat turn %s failed", buffer.turn_id)
+            buffer.append(StreamError("The answer could not be completed. Please try again."))
+        finally:
+            turn_duration.observe(time.perf_counter() - started, outcome=outcome)
+            buffer.finish(self.clock)
+
+    def _schedule_cancel(self, buffer: TurnBuffer):
+        # Each abandon gets the full grace period; an earlier timer must not cut it short
+        buffer._cancel_abandon_timer()
+        buffer.abandon_timer = asyncio.get_running_loop().call_later(
+            self.abandon_grace, self._cancel_if_abandoned, buffer
+        )
+
+    def _cancel_if_abandoned(self, buffer: TurnBuffer):
+        buffer.abandon_timer = None
+        # Once the model has finished, the remaining plan update and saves are cheap; let them complete
+        if buffer.followers or buffer.done or buffer.generated or buffer.cancelled or not buffer.task:
+            return
+        logger.info("cancelling chat turn %s: no client listening", buffer.turn_id)
+        buffer.cancelled = True
+        turn_cancellations.inc()
+        buffer.task.cancel()
+
+    def get(self, turn_id: str, owner_id: str) -> Optional[TurnBuffer]:
+        """The turn's buffer, if it exists, belongs to `owner_id` and has not expired."""
+        self._expire()
+        buffer = self._turns.get(turn_id)
+        if buffer is None or buffer.owner_id != owner_id:
+            return None
+        return buffer
+
+    def _expire(self):
+        cutoff = self.clock() - self.retention
+        for turn_id in [t for t, b in self._turns.items() if b.done and b.finished_at <= cutoff]:
+            del self._turns[turn_id]
+
+    def running(self) -> List[TurnBuffer]:
+        return [b for b in self._turns.values() if not b.done]
+
+    async def drain(self, timeout: float) -> None:
+        """Give running turns up to `timeout` seconds to finish (used on shutdown)."""
+        tasks = [b.task for b in self.running() if b.task]
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+
+turns = TurnRegistry()
+
+turns_running = Gauge(
+    "chat_turns_running",
+    "Chat turns currently running in this worker, with or without a connected client",
+    function=lambda: len(turns.running()),
+)
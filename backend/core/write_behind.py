@@ -0,0 +1,343 @@
+"""
+Write-behind persistence for chat turns.
+
+WriteBehindStorage wraps another Storage (STORAGE_WRITE_BEHIND=true). The
+writes a chat turn makes (its user and assistant messages and plan updates)
+are queued in memory and return at once. A background task flushes the
+queue in batches: one bulk message insert and one bulk plan update per
+flush, instead of one round trip per write.
+
+  - Durability bound: a queued record is flushed at most
+    WRITE_BEHIND_MAX_DELAY_MS after it was queued, or as soon as
+    WRITE_BEHIND_BATCH_SIZE records are waiting. A crash loses at most the
+    records of that window (longer while a flush is being retried).
+  - Backpressure: past WRITE_BEHIND_MAX_PENDING queued records, writers
+    flush inline until the queue drains.
+  - Retries: a failed flush is retried WRITE_BEHIND_MAX_RETRIES times with
+    exponential backoff; after that its records are dropped and logged.
+    Retrying is safe: messages carry their _id and seq from the start, and
+    plan updates write the plan's latest title and steps.
+  - Shutdown: close() flushes everything still queued.
+  - Read-through overlay: reads merge queued records over the stored ones,
+    so a plan or message is visible in this worker as soon as it is queued.
+    Other workers see it once it is flushed.
+
+Message seqs are allocated locally, from the highest seq this worker has seen
+for the session. If another worker stored a message under the same seq in the
+meantime, the flush stores ours under the next free seq instead.
+
+Plan and session creation, user writes and deletes are not queued. Deletes
+flush first, so a queued write cannot land after its plan is gone. The ids of
+recently deleted plans are remembered: later writes for them (from a turn that
+was still running) are dropped, and appending to their chat session raises
+chat_store.ChatSessionGone as the other backends do.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from beanie import PydanticObjectId
+
+from core import chat_store
+from core.metrics import write_behind_dropped, write_behind_failures, write_behind_flush_duration, write_behind_pending
+from core.plan_patch import apply_plan_patch
+from core.storage import ChatRepository, PlanRepository, Storage, new_document
+from models import ChatMessage, ChatSession, Plan, PlanSummary
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_MAX_DELAY_MS = float(os.getenv("WRITE_BEHIND_MAX_DELAY_MS", "250"))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "5000"))
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", "5"))
+# Deleted plan ids remembered to drop writes from turns still running; only recent ones matter
+DELETED_PLANS_KEPT = 10_000
+
+
+class WriteBehindPlanRepository(PlanRepository):
+    def __init__(self, storage: "WriteBehindStorage"):
+        self.storage = storage
+        self.inner = storage.inner.plans
+
+    async def get(self, plan_id, user_id):
+        pending = self.storage.pending_plan(plan_id)
+        if pending is not None:
+            return pending.model_copy(deep=True) if pending.user_id == user_id else None
+        return await self.inner.get(plan_id, user_id)
+
+    async def create(self, user_id, title, **fields):
+        return await self.inner.create(user_id, title, **fields)
+
+    async def list_summaries(self, user_id, limit, after=None):
+        pending = self.storage.pending_plans(user_id)
+        # Stored rows of queued plans are stale; ask for extra rows to make up for dropping them
+        summaries = [s for s in await self.inner.list_summaries(user_id, limit + len(pending), after=after) if s.id not in pending]
+        summaries += [
+            PlanSummary(id=p.id, title=p.title, updated_at=p.updated_at)
+            for p in pending.values()
+            if after is None or (p.updated_at, p.id) < after
+        ]
+        summaries.sort(key=lambda s: (s.updated_at, s.id), reverse=True)
+        return summaries[:limit]
+
+    async def save(self, plan):
+        await self.storage.admit()
+        self.storage.queue_plan(plan)
+
+    async def save_many(self, plans):
+        for plan in plans:
+            await self.save(plan)
+
+    async def patch(self, plan, operations, title=None):
+        new_steps = apply_plan_patch(plan.steps, operations)
+        await self.storage.admit()
+        plan.steps = new_steps
+        plan.title = title or plan.title
+        plan.updated_at = datetime.utcnow()
+        self.storage.queue_plan(plan)
+
+    async def delete(self, plan):
+        self.storage.mark_deleted(plan.id)
+        await self.storage.flush()
+        await self.inner.delete(plan)
+
+
+class WriteBehindChatRepository(ChatRepository):
+    def __init__(self, storage: "WriteBehindStorage"):
+        self.storage = storage
+        self.inner = storage.inner.chats
+
+    async def get_session(self, plan_id):
+        chat_session = await self.inner.get_session(plan_id)
+        if chat_session:
+            chat_session.message_count = max(chat_session.message_count, self.storage.last_seq(chat_session.id))
+        return chat_session
+
+    async def create_session(self, plan_id, user_id):
+        return await self.inner.create_session(plan_id, user_id)
+
+    async def append_message(self, chat_session, message):
+        if self.storage.is_deleted(chat_session.plan_id):
+            raise chat_store.ChatSessionGone(f"Chat session {chat_session.id} no longer exists")
+        await self.storage.admit()
+        chat_session.updated_at = datetime.utcnow()
+        chat_session.message_count = self.storage.allocate_seq(chat_session)
+        stored = new_document(
+            ChatMessage,
+            session_id=chat_session.id,
+            plan_id=chat_session.plan_id,
+            seq=chat_session.message_count,
+            **{k: v for k, v in message.items() if k in chat_store.MESSAGE_FIELDS - {"seq"}},
+        )
+        self.storage.queue_message(stored)
+        return stored
+
+    async def store_messages(self, messages):
+        for message in messages:
+            await self.storage.admit()
+            self.storage.queue_message(message)
+
+    async def get_messages(self, session_id, limit=chat_store.HISTORY_PAGE_SIZE, before=None):
+        page, cursor = await self.inner.get_messages(session_id, limit=limit, before=before)
+        pending = [
+            chat_store.to_dict(m) for m in self.storage.pending_messages(session_id)
+            if before is None or m.seq < before
+        ]
+        if not pending:
+            return page, cursor
+
+        pending_seqs = {m["seq"] for m in pending}
+        merged = sorted([m for m in page if m["seq"] not in pending_seqs] + pending, key=lambda m: m["seq"])
+        has_more = cursor is not None or len(merged) > limit
+        merged = merged[-limit:]
+        return merged, merged[0]["seq"] if has_more and merged else None
+
+    async def delete_for_plan(self, plan_id):
+        self.storage.mark_deleted(plan_id)
+        await self.storage.flush()
+        await self.inner.delete_for_plan(plan_id)
+
+
+class WriteBehindStorage(Storage):
+    """Queues chat turn writes in front of `inner` and flushes them in batches (see module docstring)."""
+
+    def __init__(
+        self,
+        inner: Storage,
+        max_delay: float = WRITE_BEHIND_MAX_DELAY_MS / 1000,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        max_pending: int = WRITE_BEHIND_MAX_PENDING,
+        max_retries: int = WRITE_BEHIND_MAX_RETRIES,
+        retry_backoff: float = 0.1,
+    ):
+        self.inner = inner
+        self.name = inner.name
+        self.max_delay = max_delay
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self.users = inner.users
+        self.plans = WriteBehindPlanRepository(self)
+        self.chats = WriteBehindChatRepository(self)
+
+        self._plans: Dict[PydanticObjectId, Plan] = {}  # latest queued state per plan
+        self._messages: Dict[PydanticObjectId, List[ChatMessage]] = {}  # queued messages per session
+        self._seq: Dict[PydanticObjectId, int] = {}  # highest seq handed out per session with queued messages
+        self._deleted: Dict[PydanticObjectId, None] = {}  # recently deleted plan ids, oldest first
+        self._pending_since: Optional[float] = None
+        self._wake = asyncio.Event()  # something is queued
+        self._full = asyncio.Event()  # a batch is ready; flush without waiting out the delay
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    # --- Queue and overlay ---
+
+    def pending(self) -> int:
+        return len(self._plans) + sum(len(queued) for queued in self._messages.values())
+
+    def pending_plan(self, plan_id: PydanticObjectId) -> Optional[Plan]:
+        return self._plans.get(plan_id)
+
+    def pending_plans(self, user_id: PydanticObjectId) -> Dict[PydanticObjectId, Plan]:
+        return {plan_id: p for plan_id, p in self._plans.items() if p.user_id == user_id}
+
+    def pending_messages(self, session_id: PydanticObjectId) -> List[ChatMessage]:
+        return self._messages.get(session_id, [])
+
+    def last_seq(self, session_id: PydanticObjectId) -> int:
+        return self._seq.get(session_id, 0)
+
+    def allocate_seq(self, chat_session: ChatSession) -> int:
+        seq = max(self._seq.get(chat_session.id, 0), chat_session.message_count) + 1
+        self._seq[chat_session.id] = seq
+        return seq
+
+    def mark_deleted(self, plan_id: PydanticObjectId) -> None:
+        """Drop the plan's queued and future writes; its session and messages go with it."""
+        self._deleted[plan_id] = None
+        while len(self._deleted) > DELETED_PLANS_KEPT:
+            del self._deleted[next(iter(self._deleted))]
+
+    def is_deleted(self, plan_id: PydanticObjectId) -> bool:
+        return plan_id in self._deleted
+
+    def queue_plan(self, plan: Plan) -> None:
+        if plan.id in self._deleted:
+            return
+        self._plans[plan.id] = plan.model_copy(deep=True)
+        self._queued()
+
+    def queue_message(self, message: ChatMessage) -> None:
+        if message.plan_id in self._deleted:
+            return
+        self._messages.setdefault(message.session_id, []).append(message)
+        self._seq[message.session_id] = max(self._seq.get(message.session_id, 0), message.seq)
+        self._queued()
+
+    def _queued(self) -> None:
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+        pending = self.pending()
+        write_behind_pending.set(pending)
+        self._wake.set()
+        if pending >= self.batch_size:
+            self._full.set()
+
+    async def admit(self) -> None:
+        """Backpressure: with max_pending records queued, the writer flushes inline."""
+        if self.pending() >= self.max_pending:
+            await self.flush()
+
+    # --- Flushing ---
+
+    async def start(self) -> None:
+        await self.inner.start()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            # Wait out a flush in progress, then stop the loop while it is idle
+            async with self._flush_lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        await self.inner.close()
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            if self._pending_since is not None and not self._full.is_set():
+                delay = self._pending_since + self.max_delay - time.monotonic()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self._full.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write everything queued so far; records queued meanwhile wait for the next flush."""
+        async with self._flush_lock:
+            plans = list(self._plans.values())
+            messages = [m for queued in self._messages.values() for m in queued]
+            self._wake.clear()
+            self._full.clear()
+            if not plans and not messages:
+                self._pending_since = None
+                return
+
+            started = time.monotonic()
+            with write_behind_flush_duration.time():
+                await self._write(plans, messages)
+
+            # Written (or dropped) records leave the overlay; newer ones queued during the flush stay
+            for plan in plans:
+                if self._plans.get(plan.id) is plan:
+                    del self._plans[plan.id]
+            done = {m.id for m in messages}
+            for session_id in list(self._messages):
+                remaining = [m for m in self._messages[session_id] if m.id not in done]
+                if remaining:
+                    self._messages[session_id] = remaining
+                else:
+                    # The stored message_count covers this session's seqs again
+                    del self._messages[session_id]
+                    self._seq.pop(session_id, None)
+
+            pending = self.pending()
+            write_behind_pending.set(pending)
+            if pending:
+                self._pending_since = started
+                self._wake.set()
+            else:
+                self._pending_since = None
+
+    async def _write(self, plans: List[Plan], messages: List[ChatMessage]) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.inner.plans.save_many(plans)
+                await self.inner.chats.store_messages(messages)
+                return
+            except Exception as e:
+                error = e
+                write_behind_failures.inc()
+                if attempt == self.max_retries:
+                    break
+                logger.warning("Write-behind flush failed (attempt %d), retrying", attempt + 1, exc_info=True)
+                await asyncio.sleep(min(self.retry_backoff * 2 ** attempt, 5.0))
+
+        logger.error(
+            "Write-behind flush failed %d times; dropping %d plan updates and %d messages",
+            self.max_retries + 1, len(plans), len(messages), exc_info=error,
+        )
+        write_behind_dropped.inc(len(plans), record="plan")
+        write_behind_dropped.inc(len(messages), record="message")
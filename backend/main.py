@@ -1,8 +1,12 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
 import uvicorn
+import logging
 import os
+import secrets
+import sys
 from dotenv import load_dotenv
 from pathlib import Path
 from beanie import init_beanie
@@ -14,24 +18,58 @@ load_dotenv()
 
 api_key = os.environ.get("OPENAI_API_KEY")
 
+# Request traces (legal_lens.trace) and other app logs are INFO
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
 from api.endpoints import router as chat_router
 from api.auth import router as auth_router
 from api.plans import router as plans_router
-from core.database import init_db
-from models import User, Plan, ChatSession
+from core.context import load_encoding
+from core.database import check_unique_emails, init_db, DATABASE_NAME
+from core.metrics import render as render_metrics
+from core.profiling import profiler
+from core.providers import DEFAULT_MODEL
+from core.tracing import TracingMiddleware, PROFILING_TOKEN
+from core.ratelimit import RateLimitExceeded
+from core.storage import get_storage
+from core.turns import turns
+from models import User, Plan, ChatSession, ChatMessage
+
+logger = logging.getLogger("legal_lens")
+
+def warn_if_proxy_unconfigured():
+    # Behind a platform proxy (e.g. Render) the default 127.0.0.1 never matches the peer, so every
+    # client shares the proxy's address and the per-IP auth limit becomes one global limit
+    if "--proxy-headers" in sys.argv and not os.getenv("FORWARDED_ALLOW_IPS"):
+        logger.warning(
+            "--proxy-headers is on but FORWARDED_ALLOW_IPS is not set; X-Forwarded-For is trusted only "
+            "from 127.0.0.1 and all clients behind another proxy share one auth rate limit"
+        )
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: Initialize MongoDB
-    client = await init_db()
-    db_name = os.getenv("DATABASE_NAME", "legal_lens")
-    # Initialize Beanie with all models
-    await init_beanie(database=client.get_database(db_name), document_models=[User, Plan, ChatSession])
+    warn_if_proxy_unconfigured()
+    # tiktoken downloads its encoding on first use; do that now rather than on the loop in the first chat
+    await load_encoding(os.getenv("LLM_MODEL") or DEFAULT_MODEL)
+    # Startup: STORAGE_BACKEND picks MongoDB (default) or in-memory storage
+    storage = get_storage()
+    if storage.name == "mongo":
+        client = await init_db()
+        # Registrations used to race, so older databases can hold duplicate emails
+        await check_unique_emails(client.get_database(DATABASE_NAME))
+        # Initialize Beanie with all models
+        await init_beanie(database=client.get_database(DATABASE_NAME), document_models=[User, Plan, ChatSession, ChatMessage])
+    await storage.start()
     yield
-    # Shutdown: (Optional) Close connection if needed, though Motor handles this well.
+    # Shutdown: let in-flight chat turns finish saving before the process exits,
+    # then flush writes still queued by write-behind storage
+    await turns.drain(timeout=float(os.getenv("TURN_SHUTDOWN_GRACE_SECONDS", "30")))
+    await storage.close()
 
 app = FastAPI(title="LegalLens API", lifespan=lifespan)
 
+app.add_middleware(TracingMiddleware)
+
 # Configure CORS
 origins = [origin.strip() for origin in os.getenv("ALLOWED_ORIGINS", "http://localhost:5173,http://localhost:3000").split(",")]
 
@@ -41,8 +79,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Turn-Id", "X-Trace-Id", "Server-Timing"],
 )
 
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": exc.detail},
+        headers={"Retry-After": exc.retry_after_header},
+    )
+
 app.include_router(auth_router, prefix="/api/auth", tags=["Auth"])
 app.include_router(chat_router, prefix="/api", tags=["Chat"])
 app.include_router(plans_router, prefix="/api/plans", tags=["Plans"])
@@ -52,5 +99,25 @@ app.include_router(plans_router, prefix="/api/plans", tags=["Plans"])
 async def root():
     return {"message": "LegalLens API is running"}
 
+# Optional bearer token for /metrics; unset leaves it open (e.g. only reachable on a private network)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """Prometheus scrape endpoint; values are per worker process."""
+    if METRICS_TOKEN and not secrets.compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        return PlainTextResponse("Unauthorized", status_code=401)
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/debug/profiles/{profile_id}", include_in_schema=False)
+async def get_profile(profile_id: str, request: Request):
+    """Folded stacks of a request profiled with `X-Profile: <PROFILING_TOKEN>`."""
+    if not PROFILING_TOKEN or not secrets.compare_digest(request.headers.get("X-Profile", ""), PROFILING_TOKEN):
+        raise HTTPException(status_code=404, detail="Not found")
+    folded = profiler.get(profile_id)
+    if folded is None:
+        raise HTTPException(status_code=404, detail="Profile not found or still running")
+    return PlainTextResponse(folded)
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
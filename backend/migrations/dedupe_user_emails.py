@@ -0,0 +1,55 @@
+"""
+Merge users that share an email so the unique users.email index can build.
+
+Registration used to check for an existing email and then insert, so two
+concurrent sign-ups could both succeed. For every duplicated email this
+keeps the oldest account (and its password), moves the other accounts'
+plans and chat sessions to it, and deletes the others. It works on the raw
+collections because Beanie cannot initialize until the duplicates are gone.
+It is safe to re-run.
+
+Usage (from backend/):
+    python -m migrations.dedupe_user_emails [--dry-run]
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.database import init_db, duplicate_emails, DATABASE_NAME
+
+
+async def dedupe(database, dry_run: bool = False) -> int:
+    """Merge each duplicated email into its oldest account; returns the accounts removed."""
+    duplicates = await duplicate_emails(database)
+    removed = 0
+    for email, (kept, *extra) in duplicates.items():
+        print(f"{email}: keeping {kept}, merging {', '.join(map(str, extra))}")
+        removed += len(extra)
+        if dry_run:
+            continue
+        for collection in ("plans", "chat_sessions"):
+            await database[collection].update_many({"user_id": {"$in": extra}}, {"$set": {"user_id": kept}})
+        await database["users"].delete_many({"_id": {"$in": extra}})
+
+    verb = "Would merge" if dry_run else "Merged"
+    print(f"{verb} {removed} duplicate accounts for {len(duplicates)} emails.")
+    return removed
+
+
+async def run(dry_run: bool = False):
+    client = await init_db()
+    await dedupe(client.get_database(DATABASE_NAME), dry_run)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="List the duplicates without writing")
+    args = parser.parse_args()
+    asyncio.run(run(args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Move embedded ChatSession.messages arrays into the chat_messages collection.
+
+Sessions are also migrated lazily the first time they are opened, so this
+can run while the API is serving traffic. It is safe to re-run.
+
+Usage (from backend/):
+    python -m migrations.migrate_chat_messages [--dry-run]
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+from beanie import init_beanie
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.database import init_db, DATABASE_NAME
+from core.chat_store import migrate_session
+from models import User, Plan, ChatSession, ChatMessage
+
+
+async def migrate(dry_run: bool = False):
+    client = await init_db()
+    await init_beanie(database=client.get_database(DATABASE_NAME), document_models=[User, Plan, ChatSession, ChatMessage])
+
+    pending = ChatSession.find({"messages.0": {"$exists": True}})
+    sessions = moved = 0
+    async for chat_session in pending:
+        sessions += 1
+        if dry_run:
+            moved += len(chat_session.messages)
+            continue
+        moved += await migrate_session(chat_session)
+
+    verb = "Would move" if dry_run else "Moved"
+    print(f"{verb} {moved} messages from {sessions} sessions.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Count what would be moved without writing")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,78 @@
 from typing import List, Dict, Optional
 from datetime import datetime
 from pydantic import BaseModel, Field
-from beanie import Document, Link, PydanticObjectId
+from beanie import Document, Link, PydanticObjectId, after_event, Replace, Save, SaveChanges, Update, Delete
+from pymongo import IndexModel, ASCENDING, DESCENDING
+
+from core.cache import invalidate_user
 
 # --- Pydantic Models (Schemas for API) ---
 class ChatRequest(BaseModel):
-    messages: List[Dict]
+    messages: List[Dict] = [] # Legacy: full history sent by the client
+    message: Optional[str] = None # New user message; history is read from the stored ChatSession
     plan_id: Optional[str] = None # Optional: ID of existing plan to continue
 
+class PlanSummary(BaseModel):
+    """Sidebar projection of a Plan: no steps."""
+    id: PydanticObjectId = Field(alias="_id")
+    title: str
+    updated_at: datetime
+
+    class Settings:
+        projection = {"_id": 1, "title": 1, "updated_at": 1}
+
+    class Config:
+        populate_by_name = True
+
 # --- Beanie Documents (MongoDB Collections) ---
 
 class User(Document):
-    email: str = Field(unique=True, index=True)
+    email: str
     hashed_password: str
     
     class Settings:
         name = "users"
+        indexes = [
+            IndexModel([("email", ASCENDING)], unique=True), # get_current_user / login lookups
+        ]
+
+    @after_event(Replace, Save, SaveChanges, Update, Delete)
+    def drop_cached_user(self):
+        # Keep api.auth.get_current_user from serving a stale or deleted user.
+        # Query-level writes (User.find(...).update/delete) bypass this hook;
+        # call core.cache.invalidate_user for those.
+        invalidate_user(self)
 
 class ChatSession(Document):
     plan_id: PydanticObjectId # One-to-one with Plan usually
     user_id: PydanticObjectId
-    messages: List[Dict] = [] # [{"role": "user", "content": "...", "timestamp": "..."}]
+    messages: List[Dict] = [] # Legacy embedded history; moved to chat_messages by core.chat_store.migrate_session
+    message_count: int = 0 # Last allocated ChatMessage.seq
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
     class Settings:
         name = "chat_sessions"
+        indexes = [
+            IndexModel([("plan_id", ASCENDING)]), # session lookup on every plan open and chat turn
+        ]
+
+class ChatMessage(Document):
+    session_id: PydanticObjectId
+    plan_id: PydanticObjectId
+    seq: int # 1-based position within the session
+    role: str
+    content: str = ""
+    tool_calls: Optional[List[Dict]] = None
+    truncated: Optional[bool] = None # set when generation stopped before the answer was complete
+    timestamp: str = Field(default_factory=lambda: datetime.utcnow().isoformat())
+
+    class Settings:
+        name = "chat_messages"
+        indexes = [
+            IndexModel([("session_id", ASCENDING), ("seq", ASCENDING)], unique=True), # history pages
+            IndexModel([("plan_id", ASCENDING)]), # cascade delete with the plan
+        ]
 
 class Plan(Document):
     title: str
@@ -37,3 +84,7 @@ class Plan(Document):
     
     class Settings:
         name = "plans"
+        indexes = [
+            # Sidebar listing: filter by user, keyset-sorted by (updated_at, _id) descending
+            IndexModel([("user_id", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)]),
+        ]
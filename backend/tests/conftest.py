@@ -12,10 +12,20 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from main import app
-from models import User, Plan, ChatSession
+from models import User, Plan, ChatSession, ChatMessage
+from core.cache import user_cache, response_cache
+from core.ratelimit import get_rate_limit_store
+from core.storage import MemoryStorage, MongoStorage, set_storage
 
 import asyncio
 
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    # Tests reuse prompts; a cached turn would hide the provider under test
+    response_cache.clear()
+    yield
+    response_cache.clear()
+
 @pytest.fixture(scope="function")
 async def db_client(monkeypatch):
     # Set test database name
@@ -28,16 +38,34 @@ async def db_client(monkeypatch):
     client = AsyncIOMotorClient(mongodb_url)
     
     # Initialize beanie with test DB
-    await init_beanie(database=client.get_database("legal_lens_test"), document_models=[User, Plan, ChatSession])
+    await init_beanie(database=client.get_database("legal_lens_test"), document_models=[User, Plan, ChatSession, ChatMessage])
     
     yield client
     
     # Cleanup after test
+    user_cache.clear()
+    get_rate_limit_store().clear()
     await client.drop_database("legal_lens_test")
     client.close()
 
+@pytest.fixture(scope="function", params=["memory", "mongo"])
+def storage(request):
+    # Tests that use this (or `client`) run once per storage backend; mongo needs MONGODB_URL
+    if request.param == "mongo":
+        request.getfixturevalue("db_client")
+        backend = MongoStorage()
+    else:
+        backend = MemoryStorage()
+    set_storage(backend)
+
+    yield backend
+
+    set_storage(None)
+    user_cache.clear()
+    get_rate_limit_store().clear()
+
 @pytest.fixture(scope="function")
-async def client(db_client):
+async def client(storage):
     from main import app
     from unittest.mock import MagicMock, patch
     
@@ -45,7 +73,7 @@ async def client(db_client):
     # We want the app to skip init_db and init_beanie because db_client fixture already did it
     
     async def mock_startup():
-        return db_client
+        return MagicMock()
         
     async def mock_init_beanie(*args, **kwargs):
         pass
@@ -55,5 +83,5 @@ async def client(db_client):
          patch("main.init_beanie", side_effect=mock_init_beanie):
          
         async with LifespanManager(app):
-            async with AsyncClient(transport=HTTPX_TRANSPORT(app=app), base_url="http://test") as ac:
+            async with AsyncClient(transport=HTTPX_TRANSPORT(app=app), base_url="http://test", follow_redirects=True) as ac:
                 yield ac
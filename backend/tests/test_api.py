@@ -11,13 +11,15 @@ async def test_register_user(client: AsyncClient):
         "password": "password123"
     })
     assert response.status_code == 200
-    assert "access_token" in response.json()
+    assert response.json()["email"] == "test@example.com"
 
 @pytest.mark.asyncio
 async def test_login_user(client: AsyncClient):
-    # First ensure user exists (if running independently, but flow implies register first)
-    # We rely on order or previous test, but better to be isolated or re-register.
-    # Beanie test DB persists across session due to scope="session" fixture, so user from test_register_user exists.
+    # Every test starts with empty storage, so register first (400 if it already exists)
+    await client.post("/api/auth/register", json={
+        "email": "test@example.com",
+        "password": "password123"
+    })
     
     response = await client.post("/api/auth/token", data={
         "username": "test@example.com",
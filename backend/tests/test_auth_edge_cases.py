@@ -1,6 +1,7 @@
 """
 Edge case tests for authentication API endpoints.
 """
+import asyncio
 import pytest
 from httpx import AsyncClient
 
@@ -23,6 +24,16 @@ async def test_register_duplicate_email(client: AsyncClient):
     assert "already registered" in response.json()["detail"].lower()
 
 
+@pytest.mark.asyncio
+async def test_register_same_email_concurrently(client: AsyncClient):
+    """When both requests pass the existence check, the unique index decides and the loser gets a 400."""
+    user_data = {"email": "race@example.com", "password": "password123"}
+    responses = await asyncio.gather(*[client.post("/api/auth/register", json=user_data) for _ in range(2)])
+
+    assert sorted(r.status_code for r in responses) == [200, 400]
+    assert "already registered" in max(responses, key=lambda r: r.status_code).json()["detail"].lower()
+
+
 @pytest.mark.asyncio
 async def test_login_wrong_password(client: AsyncClient):
     """Login with wrong password should return 401."""
@@ -99,3 +110,25 @@ async def test_register_empty_password(client: AsyncClient):
     # This may succeed since there's no password validation
     # but login will fail with empty password
     assert response.status_code in [200, 400, 422]
+
+
+@pytest.mark.asyncio
+async def test_login_rehashes_when_cost_changes(client: AsyncClient, monkeypatch):
+    """Logging in upgrades a hash made with a different BCRYPT_ROUNDS."""
+    import api.auth
+    from core.storage import get_storage
+
+    monkeypatch.setattr(api.auth, "BCRYPT_ROUNDS", 4)
+    await client.post("/api/auth/register", json={
+        "email": "rehash@example.com",
+        "password": "password123"
+    })
+    assert (await get_storage().users.get_by_email("rehash@example.com")).hashed_password.startswith("$2b$04$")
+
+    monkeypatch.setattr(api.auth, "BCRYPT_ROUNDS", 5)
+    response = await client.post("/api/auth/token", data={
+        "username": "rehash@example.com",
+        "password": "password123"
+    })
+    assert response.status_code == 200
+    assert (await get_storage().users.get_by_email("rehash@example.com")).hashed_password.startswith("$2b$05$")
@@ -99,3 +99,63 @@ class TestAccessToken:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         assert payload["sub"] == "user@example.com"
         assert payload["role"] == "admin"
+
+
+class TestHashPool:
+    """Tests for bcrypt offloading and cost upgrades."""
+
+    @pytest.mark.asyncio
+    async def test_async_hash_and_verify_round_trip(self):
+        from api.auth import get_password_hash_async, verify_password_async
+
+        hashed = await get_password_hash_async("pooledpassword")
+        assert await verify_password_async("pooledpassword", hashed) is True
+        assert await verify_password_async("wrong", hashed) is False
+
+    def test_hash_uses_configured_rounds(self, monkeypatch):
+        import api.auth
+        monkeypatch.setattr(api.auth, "BCRYPT_ROUNDS", 5)
+        assert get_password_hash("pw").startswith("$2b$05$")
+
+    def test_needs_rehash_when_cost_changes(self, monkeypatch):
+        import api.auth
+        from api.auth import needs_rehash
+
+        monkeypatch.setattr(api.auth, "BCRYPT_ROUNDS", 5)
+        hashed = get_password_hash("pw")
+        assert needs_rehash(hashed) is False
+        monkeypatch.setattr(api.auth, "BCRYPT_ROUNDS", 6)
+        assert needs_rehash(hashed) is True
+        assert needs_rehash("not-a-bcrypt-hash") is True
+
+    @pytest.mark.asyncio
+    async def test_login_burst_does_not_block_event_loop(self, monkeypatch):
+        """Concurrent verifications run on the pool while the loop keeps serving other work."""
+        import asyncio
+        import api.auth
+        from api.auth import verify_password_async
+
+        monkeypatch.setattr(api.auth, "BCRYPT_ROUNDS", 6)
+        hashed = get_password_hash("burstpassword")
+        pending = 0
+
+        async def verify():
+            nonlocal pending
+            pending += 1
+            try:
+                return await verify_password_async("burstpassword", hashed)
+            finally:
+                pending -= 1
+
+        async def probe():
+            # Each tick is one pass of the loop; a blocking verify would finish before the first
+            seen = []
+            for _ in range(10):
+                await asyncio.sleep(0)
+                seen.append(pending)
+            return seen
+
+        *results, seen = await asyncio.gather(*[verify() for _ in range(6)], probe())
+        assert all(results)
+        assert len(seen) == 10
+        assert min(seen) > 0
@@ -0,0 +1,77 @@
+"""
+Concurrency tests for the streaming chat endpoint against a single app instance.
+"""
+import pytest
+import asyncio
+from httpx import AsyncClient
+from unittest.mock import patch
+
+from core.providers import MockProvider
+
+
+class CountingProvider(MockProvider):
+    """Mock provider that records how many streams are running at once."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.active = 0
+        self.peak = 0
+
+    async def stream(self, messages, tools):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            async for chunk in super().stream(messages, tools):
+                yield chunk
+        finally:
+            self.active -= 1
+
+
+async def get_auth_token(client: AsyncClient, email: str, password: str) -> str:
+    """Helper to register a user and get an auth token."""
+    await client.post("/api/auth/register", json={
+        "email": email,
+        "password": password
+    })
+    response = await client.post("/api/auth/token", data={
+        "username": email,
+        "password": password
+    })
+    return response.json()["access_token"]
+
+
+@pytest.mark.asyncio
+async def test_plans_stay_responsive_while_chats_stream(client: AsyncClient):
+    """Dozens of in-flight chat streams should not stall /api/plans on the same worker."""
+    token = await get_auth_token(client, "concurrent@example.com", "password123")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    # Each chat streams its answer and a manage_plan call at 100 tokens/s.
+    provider = CountingProvider(tokens_per_second=100, ttft_ms=100)
+
+    async def chat():
+        async with client.stream("POST", "/api/chat", json={
+            "messages": [{"role": "user", "content": "Plan a deposition"}]
+        }, headers=headers) as response:
+            assert response.status_code == 200
+            async for _ in response.aiter_text():
+                pass
+
+    async def list_plans():
+        active_when_answered = []
+        await asyncio.sleep(0.2)  # let the chats get going
+        for _ in range(5):
+            response = await client.get("/api/plans/", headers=headers)
+            active_when_answered.append(provider.active)
+            assert response.status_code == 200
+            await asyncio.sleep(0.05)
+        return active_when_answered
+
+    with patch("core.llm.get_provider", return_value=provider):
+        *_, active_when_answered = await asyncio.gather(*[chat() for _ in range(30)], list_plans())
+
+    response = await client.get("/api/plans/", headers=headers)
+    assert len(response.json()) == 30
+    # The streams overlapped, and every listing was answered while they were still running
+    assert provider.peak == 30
+    assert min(active_when_answered) > 0
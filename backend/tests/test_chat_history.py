@@ -0,0 +1,268 @@
+"""
+Tests for server-authoritative chat history on /api/chat.
+"""
+import pytest
+import json
+from httpx import AsyncClient
+from unittest.mock import patch
+
+from core.providers import MockProvider
+
+
+class RecordingProvider(MockProvider):
+    """Mock provider that remembers the prompts it was sent."""
+    def __init__(self):
+        super().__init__(tokens_per_second=0, ttft_ms=0)
+        self.prompts = []
+
+    def stream(self, messages, tools):
+        self.prompts.append(messages)
+        return super().stream(messages, tools)
+
+
+async def get_auth_token(client: AsyncClient, email: str, password: str) -> str:
+    """Helper to register a user and get an auth token."""
+    await client.post("/api/auth/register", json={
+        "email": email,
+        "password": password
+    })
+    response = await client.post("/api/auth/token", data={
+        "username": email,
+        "password": password
+    })
+    return response.json()["access_token"]
+
+
+async def send(client: AsyncClient, token: str, payload: dict) -> list:
+    async with client.stream("POST", "/api/chat", json=payload, headers={"Authorization": f"Bearer {token}"}) as response:
+        assert response.status_code == 200
+        body = "".join([chunk async for chunk in response.aiter_text()])
+    return [json.loads(line) for line in body.splitlines() if line.strip()]
+
+
+@pytest.mark.asyncio
+async def test_chat_turn_completes_without_network(client: AsyncClient, monkeypatch, tmp_path):
+    """tiktoken downloads its encoding on first use; offline, token budgets are estimated instead."""
+    import socket
+    import tiktoken.registry
+    import core.context
+
+    def offline(*args, **kwargs):
+        raise socket.gaierror("network unavailable")
+
+    monkeypatch.setenv("TIKTOKEN_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(tiktoken.registry, "ENCODINGS", {})
+    monkeypatch.setattr(core.context, "_encodings", {})
+    monkeypatch.setattr(socket, "getaddrinfo", offline)
+    token = await get_auth_token(client, "offline@example.com", "password123")
+
+    with patch("core.llm.get_provider", return_value=RecordingProvider()):
+        events = await send(client, token, {"message": "Plan a motion to compel"})
+
+    types = [e["type"] for e in events]
+    assert "error" not in types
+    assert "plan" in types
+    usage = next(e for e in events if e["type"] == "usage")
+    assert usage["prompt_tokens"] > 0 and usage["completion_tokens"] > 0
+    assert core.context._encodings == {"o200k_base": None}
+
+
+@pytest.mark.asyncio
+async def test_chat_builds_prompt_from_stored_history(client: AsyncClient):
+    """Sending only the new message should replay the stored conversation upstream."""
+    token = await get_auth_token(client, "history@example.com", "password123")
+    provider = RecordingProvider()
+
+    with patch("core.llm.get_provider", return_value=provider):
+        events = await send(client, token, {"message": "Plan a motion to compel"})
+        plan_id = events[0]["plan_id"]
+        await send(client, token, {"message": "The case is in Texas", "plan_id": plan_id})
+
+    second_prompt = provider.prompts[-1]
+    assert second_prompt[-2]["content"].startswith("CURRENT PLAN CONTENT")
+    conversation = [(m["role"], m["content"]) for m in second_prompt[1:-2] + second_prompt[-1:]]
+    assert conversation[0] == ("user", "Plan a motion to compel")
+    assert conversation[1][0] == "assistant"
+    assert conversation[2] == ("user", "The case is in Texas")
+
+    response = await client.get(f"/api/plans/{plan_id}", headers={"Authorization": f"Bearer {token}"})
+    history = response.json()["chat_history"]
+    assert [m["role"] for m in history] == ["user", "assistant", "user", "assistant"]
+
+
+@pytest.mark.asyncio
+async def test_chat_requires_a_message(client: AsyncClient):
+    """A request with neither 'message' nor 'messages' is rejected."""
+    token = await get_auth_token(client, "nomessage@example.com", "password123")
+    response = await client.post("/api/chat", json={}, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 422
+
+
+class PatchingProvider(MockProvider):
+    """Mock provider that answers with a patch_plan call."""
+    def __init__(self, operations):
+        super().__init__(tokens_per_second=0, ttft_ms=0)
+        self.operations = operations
+
+    def build_tool_call(self, messages):
+        return "patch_plan", {"operations": self.operations}
+
+
+@pytest.mark.asyncio
+async def test_chat_applies_plan_patch(client: AsyncClient):
+    """A patch_plan call edits the stored steps in place."""
+    token = await get_auth_token(client, "patch@example.com", "password123")
+
+    with patch("core.llm.get_provider", return_value=RecordingProvider()):
+        events = await send(client, token, {"message": "Plan a motion to compel"})
+    plan_id = events[0]["plan_id"]
+
+    operations = [
+        {"op": "update", "id": "2", "step": {"status": "done"}},
+        {"op": "remove", "id": "3"},
+        {"op": "add", "step": {"id": "7", "title": "Meet and confer"}, "after": "1"},
+    ]
+    with patch("core.llm.get_provider", return_value=PatchingProvider(operations)):
+        events = await send(client, token, {"message": "Evidence is gathered", "plan_id": plan_id})
+
+    saved = next(e["plan"] for e in events if e["type"] == "plan")
+    response = await client.get(f"/api/plans/{plan_id}", headers={"Authorization": f"Bearer {token}"})
+    steps = response.json()["plan"]["steps"]
+    assert steps == saved["steps"]
+    assert [s["id"] for s in steps] == ["1", "7", "2", "4", "5", "6"]
+    assert steps[2]["status"] == "done"
+
+
+@pytest.mark.asyncio
+async def test_malformed_plan_patch_is_rejected(client: AsyncClient):
+    """A malformed patch_plan call is reported as an error; the turn and the plan survive."""
+    token = await get_auth_token(client, "malformed@example.com", "password123")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    with patch("core.llm.get_provider", return_value=RecordingProvider()):
+        events = await send(client, token, {"message": "Plan a motion to compel"})
+    plan_id = events[0]["plan_id"]
+    before = (await client.get(f"/api/plans/{plan_id}", headers=headers)).json()["plan"]
+
+    operations = [{"op": "update", "id": "1", "step": {"status": "done"}}, {"op": "reorder", "order": ["1", None]}]
+    with patch("core.llm.get_provider", return_value=PatchingProvider(operations)):
+        events = await send(client, token, {"message": "Evidence is gathered", "plan_id": plan_id})
+
+    assert [e["type"] for e in events].count("error") == 1
+    assert "plan" not in [e["type"] for e in events]
+    body = (await client.get(f"/api/plans/{plan_id}", headers=headers)).json()
+    assert body["plan"]["steps"] == before["steps"]
+    assert body["plan"]["updated_at"] == before["updated_at"]
+    assert [m["role"] for m in body["chat_history"]] == ["user", "assistant", "user", "assistant"]
+
+
+@pytest.mark.asyncio
+async def test_plan_rewrite_with_duplicate_step_ids_is_rejected(client: AsyncClient):
+    """manage_plan cannot save steps that later patches could not address one at a time."""
+    token = await get_auth_token(client, "twins@example.com", "password123")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    with patch("core.llm.get_provider", return_value=RecordingProvider()):
+        events = await send(client, token, {"message": "Plan a motion to compel"})
+    plan_id = events[0]["plan_id"]
+    before = (await client.get(f"/api/plans/{plan_id}", headers=headers)).json()["plan"]
+
+    steps = [{"id": "1", "title": "Draft", "status": "pending"}, {"id": "1", "title": "File", "status": "pending"}]
+    with patch("core.llm.get_provider", return_value=MultiCallProvider([("manage_plan", {"title": "T", "steps": steps})])):
+        events = await send(client, token, {"message": "Rewrite it", "plan_id": plan_id})
+
+    errors = [e for e in events if e["type"] == "error"]
+    assert len(errors) == 1 and "Duplicate step id '1'" in errors[0]["content"]
+    assert "plan" not in [e["type"] for e in events]
+    body = (await client.get(f"/api/plans/{plan_id}", headers=headers)).json()
+    assert body["plan"]["steps"] == before["steps"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", ["rename_plan", ""])
+async def test_unknown_or_nameless_tool_call_is_rejected(client: AsyncClient, name):
+    """Only manage_plan and patch_plan change the plan; anything else is reported, not treated as a rewrite."""
+    token = await get_auth_token(client, f"tool{name}@example.com", "password123")
+    headers = {"Authorization": f"Bearer {token}"}
+
+    with patch("core.llm.get_provider", return_value=RecordingProvider()):
+        events = await send(client, token, {"message": "Plan a motion to compel"})
+    plan_id = events[0]["plan_id"]
+    before = (await client.get(f"/api/plans/{plan_id}", headers=headers)).json()["plan"]
+
+    args = {"title": "Renamed", "steps": []}
+    with patch("core.llm.get_provider", return_value=OffListProvider([(name, args)])):
+        events = await send(client, token, {"message": "Rename it", "plan_id": plan_id})
+
+    errors = [e for e in events if e["type"] == "error"]
+    assert len(errors) == 1 and f"Unknown tool '{name}'" in errors[0]["content"]
+    assert "plan" not in [e["type"] for e in events]
+    body = (await client.get(f"/api/plans/{plan_id}", headers=headers)).json()
+    assert body["plan"] == before
+
+
+class MultiCallProvider(MockProvider):
+    """Mock provider that answers with several tool calls in one turn."""
+    def __init__(self, calls):
+        super().__init__(tokens_per_second=0, ttft_ms=0)
+        self.calls = calls
+
+    def build_tool_calls(self, messages):
+        return self.calls
+
+
+class OffListProvider(MultiCallProvider):
+    """MultiCallProvider that also emits calls to tools the request did not offer."""
+    async def stream(self, messages, tools):
+        offered = list(tools or []) + [{"function": {"name": name}} for name, _ in self.calls]
+        async for chunk in super().stream(messages, offered):
+            yield chunk
+
+
+@pytest.mark.asyncio
+async def test_chat_applies_several_tool_calls_in_one_turn(client: AsyncClient):
+    """Each tool call is accumulated by index and applied in order; a bad one doesn't block the rest."""
+    token = await get_auth_token(client, "multicall@example.com", "password123")
+
+    calls = [
+        ("manage_plan", {"title": "Compel Strategy", "steps": [
+            {"id": "1", "title": "Meet and confer", "status": "pending"},
+            {"id": "2", "title": "Draft motion", "status": "pending"},
+        ]}),
+        ("patch_plan", {"operations": [{"op": "update", "id": "1", "step": {"status": "done"}}]}),
+        ("patch_plan", {"operations": [{"op": "remove", "id": "missing"}]}),
+        ("patch_plan", {"operations": [{"op": "add", "step": {"id": "3", "title": "File"}}]}),
+    ]
+    with patch("core.llm.get_provider", return_value=MultiCallProvider(calls)):
+        events = await send(client, token, {"message": "Plan a motion to compel"})
+    plan_id = events[0]["plan_id"]
+
+    assert {e["index"] for e in events if e["type"] == "tool_chunk"} == {0, 1, 2, 3}
+    assert [e["type"] for e in events].count("plan") == 1
+    errors = [e["content"] for e in events if e["type"] == "error"]
+    assert len(errors) == 1 and "missing" in errors[0]
+
+    response = await client.get(f"/api/plans/{plan_id}", headers={"Authorization": f"Bearer {token}"})
+    body = response.json()
+    assert body["plan"]["title"] == "Compel Strategy"
+    assert [(s["id"], s["status"]) for s in body["plan"]["steps"]] == [("1", "done"), ("2", "pending"), ("3", "pending")]
+    assert [c["function"]["name"] for c in body["chat_history"][-1]["tool_calls"]] == [name for name, _ in calls]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_appends_are_not_lost(storage):
+    """Appends from stale session copies must not overwrite each other."""
+    import asyncio
+    from beanie import PydanticObjectId
+
+    session = await storage.chats.create_session(PydanticObjectId(), PydanticObjectId())
+
+    copies = [await storage.chats.get_session(session.plan_id) for _ in range(20)]
+    await asyncio.gather(*[
+        storage.chats.append_message(copy, {"role": "user", "content": f"message {i}"})
+        for i, copy in enumerate(copies)
+    ])
+
+    stored, _ = await storage.chats.get_messages(session.id, limit=50)
+    assert [m["seq"] for m in stored] == list(range(1, 21))
+    assert sorted(m["content"] for m in stored) == sorted(f"message {i}" for i in range(20))
@@ -0,0 +1,104 @@
+"""
+Tests for the paginated chat message store and legacy migration.
+"""
+import pytest
+from httpx import AsyncClient
+from beanie import PydanticObjectId
+
+from models import ChatSession, ChatMessage
+from core.chat_store import ChatSessionGone, append_message, get_messages, migrate_session
+
+
+async def make_session(messages=None):
+    session = ChatSession(plan_id=PydanticObjectId(), user_id=PydanticObjectId(), messages=messages or [])
+    await session.insert()
+    return session
+
+
+@pytest.mark.asyncio
+async def test_get_messages_pages_backwards(db_client):
+    """Pages come back oldest-first with a cursor to the next older page."""
+    session = await make_session()
+    for i in range(1, 8):
+        await append_message(session, {"role": "user", "content": f"m{i}"})
+
+    page, cursor = await get_messages(session.id, limit=3)
+    assert [m["content"] for m in page] == ["m5", "m6", "m7"]
+    assert cursor == 5
+
+    page, cursor = await get_messages(session.id, limit=3, before=cursor)
+    assert [m["content"] for m in page] == ["m2", "m3", "m4"]
+
+    page, cursor = await get_messages(session.id, limit=3, before=cursor)
+    assert [m["content"] for m in page] == ["m1"]
+    assert cursor is None
+
+
+@pytest.mark.asyncio
+async def test_append_to_deleted_session_raises(db_client):
+    """A session deleted mid-turn is reported as gone instead of failing on a missing counter."""
+    session = await make_session()
+    await session.delete()
+
+    with pytest.raises(ChatSessionGone):
+        await append_message(session, {"role": "assistant", "content": "late"})
+    assert await ChatMessage.find(ChatMessage.session_id == session.id).count() == 0
+
+
+@pytest.mark.asyncio
+async def test_migrate_session_moves_embedded_history(db_client):
+    """Embedded messages move to chat_messages and new appends follow them."""
+    legacy = [
+        {"role": "user", "content": "first", "timestamp": "2024-01-01T00:00:00"},
+        {"role": "assistant", "content": "", "tool_calls": [{"function": {"name": "manage_plan", "arguments": "{}"}}]},
+    ]
+    session = await make_session(legacy)
+
+    assert await migrate_session(session) == 2
+    assert await migrate_session(session) == 0
+
+    # A stale copy loaded before the migration must not duplicate messages
+    stale = await make_session(legacy)
+    stale_copy = await ChatSession.get(stale.id)
+    await migrate_session(stale)
+    await migrate_session(stale_copy)
+    assert await ChatMessage.find(ChatMessage.session_id == stale.id).count() == 2
+
+    await append_message(session, {"role": "user", "content": "second"})
+    page, _ = await get_messages(session.id)
+    assert [(m["seq"], m["content"]) for m in page] == [(1, "first"), (2, ""), (3, "second")]
+    assert page[1]["tool_calls"][0]["function"]["name"] == "manage_plan"
+
+    stored = await ChatSession.get(session.id)
+    assert stored.messages == []
+    assert stored.message_count == 3
+
+
+@pytest.mark.asyncio
+async def test_plan_messages_endpoint(client: AsyncClient):
+    """GET /api/plans/{id}/messages pages through history with a cursor."""
+    from unittest.mock import patch
+    from core.providers import MockProvider
+
+    await client.post("/api/auth/register", json={"email": "pages@example.com", "password": "password123"})
+    token = (await client.post("/api/auth/token", data={"username": "pages@example.com", "password": "password123"})).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    plan_id = None
+    with patch("core.llm.get_provider", return_value=MockProvider(tokens_per_second=0, ttft_ms=0, tool_calls=False)):
+        for i in range(3):
+            payload = {"message": f"turn {i}"}
+            if plan_id:
+                payload["plan_id"] = plan_id
+            async with client.stream("POST", "/api/chat", json=payload, headers=headers) as response:
+                body = "".join([chunk async for chunk in response.aiter_text()])
+            plan_id = plan_id or body.split('"plan_id": "')[1].split('"')[0]
+
+    response = await client.get(f"/api/plans/{plan_id}/messages", params={"limit": 4}, headers=headers)
+    data = response.json()
+    assert [m["seq"] for m in data["messages"]] == [3, 4, 5, 6]
+    assert data["next_cursor"] == 3
+
+    response = await client.get(f"/api/plans/{plan_id}/messages", params={"before": 3}, headers=headers)
+    assert [m["content"] for m in response.json()["messages"]][0] == "turn 0"
+    assert response.json()["next_cursor"] is None
@@ -0,0 +1,134 @@
+"""
+Unit tests for the token-budgeted context builder.
+"""
+import pytest
+from unittest.mock import patch
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.context import build_context, count_tokens, context_budget, format_plan, MODEL_CONTEXT_BUDGETS
+
+
+def make_history(turns, words=30):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Question {i}: " + "discovery " * words, "timestamp": "t"})
+        history.append({"role": "assistant", "content": f"Answer {i}: " + "deadline " * words})
+    return history
+
+
+class TestBuildContext:
+    """Tests for build_context."""
+
+    def test_short_history_is_sent_verbatim(self):
+        """Conversations within the recent window and budget are untouched."""
+        history = make_history(2)
+        messages, stats = build_context("SYSTEM", "", history, budget=10000)
+
+        assert messages[0] == {"role": "system", "content": "SYSTEM"}
+        assert messages[1:] == [{"role": m["role"], "content": m["content"]} for m in history]
+        assert stats.tokens_saved == 0
+        assert stats.messages_kept == 4
+
+    def test_plan_context_is_always_included(self):
+        """The current plan is sent even under a tight budget."""
+        messages, _ = build_context("SYSTEM", "Title: Plan", make_history(20), budget=200)
+        assert messages[-2]["role"] == "system"
+        assert "CURRENT PLAN CONTENT" in messages[-2]["content"]
+        assert "Title: Plan" in messages[-2]["content"]
+
+    def test_prompt_prefix_is_stable_across_turns(self):
+        """The system prompt never carries the plan, and the previous prompt minus its plan is a prefix of the next."""
+        history = make_history(2)
+        first, _ = build_context("SYSTEM", "Title: A", history[:3], budget=10000)
+        second, _ = build_context("SYSTEM", "Title: B", history + [{"role": "user", "content": "Next?"}], budget=10000)
+
+        assert first[0] == second[0] == {"role": "system", "content": "SYSTEM"}
+        assert first[-2]["content"].endswith("Title: A")
+        assert first[:-2] + first[-1:] == second[:len(first) - 1]
+        assert second[-1]["content"] == "Next?"
+
+    def test_older_turns_are_condensed(self):
+        """Messages outside the recent window are folded into a recap."""
+        history = make_history(10)
+        with patch("core.context.RECENT_MESSAGES", 4), patch("core.context.CONDENSE_STEP", 1):
+            messages, stats = build_context("SYSTEM", "", history, budget=100000)
+
+        assert stats.messages_kept == 4
+        assert stats.messages_condensed == 16
+        assert messages[1]["role"] == "system"
+        assert messages[1]["content"].startswith("Summary of earlier conversation")
+        assert messages[-4:] == [{"role": m["role"], "content": m["content"]} for m in history[-4:]]
+        assert stats.tokens_saved > 0
+
+    def test_recap_only_changes_every_condense_step(self):
+        """Older turns are condensed in batches so the prompt prefix survives several turns."""
+        history = make_history(12)
+        with patch("core.context.RECENT_MESSAGES", 4), patch("core.context.CONDENSE_STEP", 6):
+            recaps = [build_context("SYSTEM", "", history[:n], budget=100000)[0][1]["content"] for n in range(16, 22)]
+            _, stats = build_context("SYSTEM", "", history[:16], budget=100000)
+
+        assert len(set(recaps)) == 1
+        assert stats.messages_condensed == 12
+        assert stats.messages_kept == 4
+
+    def test_budget_is_respected(self):
+        """Prompt tokens never exceed the budget when older turns can be dropped."""
+        history = make_history(50, words=200)
+        messages, stats = build_context("SYSTEM", "", history, budget=1500)
+
+        assert stats.prompt_tokens <= 1500
+        assert stats.messages_dropped > 0
+        assert messages[-1]["content"] == history[-1]["content"]
+        assert stats.to_dict()["tokens_saved"] == stats.original_tokens - stats.prompt_tokens
+
+    def test_latest_message_kept_even_if_over_budget(self):
+        """The newest message is never dropped."""
+        history = [{"role": "user", "content": "word " * 2000}]
+        messages, stats = build_context("SYSTEM", "", history, budget=100)
+        assert messages[-1]["content"] == history[0]["content"]
+        assert stats.messages_kept == 1
+
+
+class TestFormatPlan:
+    """Tests for the compact plan encoding."""
+
+    def test_one_line_per_step(self):
+        plan = {"title": "Motion  to Dismiss", "steps": [
+            {"id": "1", "title": "Research", "description": "Find the\nstandard.", "status": "done"},
+            {"id": "2", "title": "Draft", "status": "pending"},
+        ]}
+        assert format_plan(plan) == (
+            "Title: Motion to Dismiss\n"
+            "1 | done | Research: Find the standard.\n"
+            "2 | pending | Draft"
+        )
+
+    def test_empty_plan(self):
+        assert format_plan({"title": "Untitled Strategy", "steps": []}) == "Title: Untitled Strategy\n(no steps yet)"
+
+    def test_fewer_tokens_than_indented_json(self):
+        import json
+        plan = {"title": "Plan", "steps": [
+            {"id": str(i), "title": f"Step {i}", "description": "Serve opposing counsel.", "status": "pending"}
+            for i in range(20)
+        ]}
+        assert count_tokens(format_plan(plan)) < count_tokens(json.dumps(plan, indent=2)) / 2
+
+
+class TestBudgets:
+    """Tests for token counting and per-model budgets."""
+
+    def test_count_tokens_empty(self):
+        assert count_tokens("") == 0
+
+    def test_count_tokens_grows_with_text(self):
+        assert count_tokens("word " * 100) > count_tokens("word " * 10) > 0
+
+    def test_context_budget_per_model(self, monkeypatch):
+        monkeypatch.delenv("LLM_CONTEXT_BUDGET", raising=False)
+        assert context_budget("gpt-4o") == MODEL_CONTEXT_BUDGETS["gpt-4o"]
+        monkeypatch.setenv("LLM_CONTEXT_BUDGET", "1234")
+        assert context_budget("gpt-4o") == 1234
@@ -0,0 +1,121 @@
+"""
+Tests for MongoDB client settings, per-operation read preferences and pool metrics.
+"""
+import pytest
+from datetime import datetime
+from beanie import PydanticObjectId
+from pymongo import monitoring
+from pymongo.read_preferences import SecondaryPreferred
+from unittest.mock import patch
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.database import PoolMetrics, client_options, init_db, parse_read_preferences
+from core.metrics import (
+    mongo_pool_checkout_duration, mongo_pool_checkouts_waiting, mongo_pool_connections_in_use,
+    mongo_pool_connections_open, mongo_pool_max_size,
+)
+
+
+def test_only_set_options_are_passed_to_the_driver():
+    env = {
+        "MONGO_MAX_POOL_SIZE": "20",
+        "MONGO_MAX_IDLE_TIME_MS": "60000",
+        "MONGO_COMPRESSORS": "zstd,snappy,zlib",
+        "MONGO_MIN_POOL_SIZE": "",
+    }
+    assert client_options(env) == {"maxPoolSize": 20, "maxIdleTimeMS": 60000, "compressors": "zstd,snappy,zlib"}
+    assert client_options({}) == {}
+
+
+def test_max_staleness_only_bounds_secondary_reads():
+    assert client_options({"MONGO_MAX_STALENESS_SECONDS": "120"}) == {}
+    assert client_options({"MONGO_READ_PREFERENCE": "primary", "MONGO_MAX_STALENESS_SECONDS": "120"}) == {
+        "readPreference": "primary",
+    }
+    assert client_options({"MONGO_READ_PREFERENCE": "secondaryPreferred", "MONGO_MAX_STALENESS_SECONDS": "120"}) == {
+        "readPreference": "secondaryPreferred", "maxStalenessSeconds": 120,
+    }
+
+
+@pytest.mark.asyncio
+async def test_init_db_configures_the_client(monkeypatch):
+    monkeypatch.setenv("MONGODB_URL", "mongodb://127.0.0.1:1/?connect=false")
+    client = await init_db({"maxPoolSize": 7, "maxIdleTimeMS": 30000, "compressors": "zlib"})
+    try:
+        assert client.options.pool_options.max_pool_size == 7
+        assert client.options.pool_options.max_idle_time_seconds == 30
+        assert client.options.pool_options._compression_settings.compressors == ["zlib"]
+    finally:
+        client.close()
+
+
+def test_read_preferences_by_operation():
+    preferences = parse_read_preferences("list_user_plans=secondaryPreferred, other=primary", max_staleness=120)
+    assert preferences["list_user_plans"].mongos_mode == "secondaryPreferred"
+    assert preferences["list_user_plans"].max_staleness == 120
+    assert preferences["other"].mongos_mode == "primary"
+    assert parse_read_preferences("") == {}
+    with pytest.raises(ValueError):
+        parse_read_preferences("list_user_plans=anywhere")
+
+
+@pytest.mark.parametrize("entry", ["list_user_plans", "list_user_plans=secondary=nearest", "=secondary", "list_user_plans="])
+def test_malformed_read_preference_entries_are_named(entry):
+    with pytest.raises(ValueError, match=f"'{entry}'"):
+        parse_read_preferences(f"other=primary,{entry}")
+
+
+@pytest.mark.asyncio
+async def test_client_accepts_max_staleness_with_primary_reads(monkeypatch):
+    monkeypatch.setenv("MONGODB_URL", "mongodb://127.0.0.1:1/?connect=false")
+    preferences = parse_read_preferences("list_user_plans=secondaryPreferred,other=primary", max_staleness=120)
+    assert preferences["other"].max_staleness == -1
+
+    client = await init_db(client_options({"MONGO_MAX_STALENESS_SECONDS": "120"}))
+    try:
+        assert client.read_preference.mode == 0  # primary
+    finally:
+        client.close()
+
+
+def test_pool_metrics_track_checkouts():
+    listener = PoolMetrics()
+    address = ("db.example.com", 27017)
+    labels = {"address": "db.example.com:27017"}
+    checkouts = mongo_pool_checkout_duration.count(result="ok")
+
+    listener.pool_created(monitoring.PoolCreatedEvent(address, {"maxPoolSize": 20}))
+    listener.connection_created(monitoring.ConnectionCreatedEvent(address, 1))
+    listener.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(address))
+    listener.connection_check_out_started(monitoring.ConnectionCheckOutStartedEvent(address))
+    assert mongo_pool_checkouts_waiting.value(**labels) == 2
+
+    listener.connection_checked_out(monitoring.ConnectionCheckedOutEvent(address, 1, 0.004))
+    listener.connection_check_out_failed(monitoring.ConnectionCheckOutFailedEvent(address, "timeout", 1.0))
+    assert mongo_pool_checkouts_waiting.value(**labels) == 0
+    assert mongo_pool_connections_in_use.value(**labels) == 1
+    assert mongo_pool_checkout_duration.count(result="ok") == checkouts + 1
+    assert mongo_pool_checkout_duration.count(result="timeout") >= 1
+
+    listener.connection_checked_in(monitoring.ConnectionCheckedInEvent(address, 1))
+    listener.connection_closed(monitoring.ConnectionClosedEvent(address, 1, "idle"))
+    assert mongo_pool_connections_in_use.value(**labels) == 0
+    assert mongo_pool_connections_open.value(**labels) == 0
+    assert mongo_pool_max_size.value(**labels) == 20
+
+
+@pytest.mark.asyncio
+async def test_plan_listing_honours_its_read_preference(storage):
+    user_id = PydanticObjectId()
+    for i in range(3):
+        await storage.plans.create(user_id, f"Plan {i}", updated_at=datetime(2025, 1, 1, minute=i))
+
+    with patch("core.storage.read_preference", return_value=SecondaryPreferred()) as lookup:
+        summaries = await storage.plans.list_summaries(user_id, 2)
+
+    assert [s.title for s in summaries] == ["Plan 2", "Plan 1"]
+    if storage.name == "mongo":
+        lookup.assert_called_with("list_user_plans")
@@ -0,0 +1,87 @@
+"""
+Tests for the typed chat stream events.
+"""
+import json
+import pytest
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.events import (
+    StreamEvent, Meta, PlanStep, PlanUpdate, StreamError, TextDelta, ToolCallDelta, TurnAccumulator, Usage,
+    encode_event, encode_stream,
+)
+
+
+class TestEncoding:
+    """Events serialize to the NDJSON lines the frontend reads."""
+
+    def test_wire_format(self):
+        assert json.loads(encode_event(Meta("abc"))) == {"type": "meta", "plan_id": "abc"}
+        assert json.loads(encode_event(TextDelta("Hi"))) == {"type": "text", "content": "Hi"}
+        assert json.loads(encode_event(ToolCallDelta('{"ti'))) == {"type": "tool_chunk", "content": '{"ti', "index": 0}
+        assert json.loads(encode_event(ToolCallDelta("", "patch_plan")))["name"] == "patch_plan"
+        assert json.loads(encode_event(Usage({"prompt_tokens": 3}))) == {"type": "usage", "prompt_tokens": 3}
+        assert json.loads(encode_event(PlanStep(0, {"id": "1"}))) == {"type": "plan_step", "index": 0, "step": {"id": "1"}}
+        assert json.loads(encode_event(PlanStep(1, {"id": "2"}, "T")))["title"] == "T"
+        assert json.loads(encode_event(PlanUpdate({"title": "T", "steps": []})))["plan"]["title"] == "T"
+        assert json.loads(encode_event(StreamError("boom"))) == {"type": "error", "content": "boom"}
+
+    def test_events_must_define_their_wire_form(self):
+        class Untyped(StreamEvent):
+            pass
+
+        with pytest.raises(TypeError):
+            Untyped()
+
+    @pytest.mark.asyncio
+    async def test_encode_stream_emits_one_line_per_event(self):
+        async def events():
+            yield Meta("p1")
+            yield TextDelta("line\nbreak")
+
+        lines = [line async for line in encode_stream(events())]
+        assert len(lines) == 2
+        assert all(line.endswith(b"\n") and line.count(b"\n") == 1 for line in lines)
+
+
+class TestTurnAccumulator:
+    """The accumulator rebuilds the assistant message from events."""
+
+    def test_collects_text_and_tool_call(self):
+        turn = TurnAccumulator()
+        for event in [
+            Meta("p1"),
+            TextDelta("Hello, "),
+            TextDelta("world"),
+            ToolCallDelta('{"operations":', "patch_plan"),
+            ToolCallDelta(" []}"),
+            Usage({"prompt_tokens": 10}),
+        ]:
+            turn.add(event)
+
+        assert turn.text == "Hello, world"
+        [call] = turn.calls
+        assert call.name == "patch_plan"
+        assert json.loads(call.arguments) == {"operations": []}
+
+    def test_nameless_call_has_no_name(self):
+        turn = TurnAccumulator()
+        turn.add(ToolCallDelta("{}"))
+        assert turn.calls[0].name == ""
+        assert turn.text == ""
+
+    def test_interleaved_calls_are_kept_apart_by_index(self):
+        turn = TurnAccumulator()
+        for event in [
+            ToolCallDelta('{"operations"', "patch_plan", index=1),
+            ToolCallDelta('{"title": "T",', "manage_plan", index=0),
+            ToolCallDelta(': []}', index=1),
+            ToolCallDelta(' "steps": []}', index=0),
+        ]:
+            turn.add(event)
+
+        assert [(c.index, c.name) for c in turn.calls] == [(0, "manage_plan"), (1, "patch_plan")]
+        assert json.loads(turn.calls[0].arguments) == {"title": "T", "steps": []}
+        assert json.loads(turn.calls[1].arguments) == {"operations": []}
@@ -0,0 +1,94 @@
+"""
+Explain-plan checks: every hot query must be served by an index.
+
+Requires a real MongoDB (explain is not emulated by in-memory stand-ins).
+"""
+import pytest
+from datetime import datetime
+from beanie import PydanticObjectId
+
+from models import User, Plan, ChatSession, ChatMessage
+
+
+def collection_scans(node):
+    """Collect every COLLSCAN stage anywhere in an explain document."""
+    found = []
+    if isinstance(node, dict):
+        if node.get("stage") == "COLLSCAN":
+            found.append(node)
+        for value in node.values():
+            found.extend(collection_scans(value))
+    elif isinstance(node, list):
+        for item in node:
+            found.extend(collection_scans(item))
+    return found
+
+
+async def explain(document, query, sort=None):
+    cursor = document.get_motor_collection().find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    return await cursor.explain()
+
+
+@pytest.fixture
+async def seeded(db_client):
+    user = User(email="indexed@example.com", hashed_password="x")
+    await user.insert()
+    plan = Plan(title="Indexed", user_id=user.id)
+    await plan.insert()
+    session = ChatSession(plan_id=plan.id, user_id=user.id)
+    await session.insert()
+    await ChatMessage(session_id=session.id, plan_id=plan.id, seq=1, role="user", content="hi").insert()
+    return user, plan, session
+
+
+HOT_QUERIES = {
+    "get_current_user": lambda u, p, s: (User, {"email": u.email}, None),
+    "list_user_plans": lambda u, p, s: (Plan, {"user_id": u.id}, [("updated_at", -1), ("_id", -1)]),
+    "list_user_plans_page": lambda u, p, s: (Plan, {
+        "user_id": u.id,
+        "$or": [{"updated_at": {"$lt": datetime.utcnow()}}, {"updated_at": datetime.utcnow(), "_id": {"$lt": p.id}}],
+    }, [("updated_at", -1), ("_id", -1)]),
+    "open_plan": lambda u, p, s: (Plan, {"_id": p.id, "user_id": u.id}, None),
+    "find_session": lambda u, p, s: (ChatSession, {"plan_id": p.id}, None),
+    "history_page": lambda u, p, s: (ChatMessage, {"session_id": s.id, "seq": {"$lt": 10}}, [("seq", -1)]),
+    "delete_messages": lambda u, p, s: (ChatMessage, {"plan_id": p.id}, None),
+}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+async def test_hot_query_uses_index(seeded, name):
+    document, query, sort = HOT_QUERIES[name](*seeded)
+    plan = await explain(document, query, sort)
+    assert collection_scans(plan) == [], f"{name} falls back to a collection scan"
+
+
+@pytest.mark.asyncio
+async def test_duplicate_emails_are_reported_and_merged(db_client):
+    """Databases from before the unique index can hold duplicate emails; startup names them."""
+    from core.database import check_unique_emails
+    from migrations.dedupe_user_emails import dedupe
+
+    database = db_client.get_database("legal_lens_test")
+    users = database["users"]
+    await users.drop_indexes()
+    kept = (await users.insert_one({"email": "twice@example.com", "hashed_password": "a"})).inserted_id
+    extra = (await users.insert_one({"email": "twice@example.com", "hashed_password": "b"})).inserted_id
+    await database["plans"].insert_one({"title": "Orphan", "user_id": extra, "steps": []})
+
+    with pytest.raises(RuntimeError, match="twice@example.com"):
+        await check_unique_emails(database)
+
+    assert await dedupe(database) == 1
+    await check_unique_emails(database)
+    assert await users.count_documents({"email": "twice@example.com"}) == 1
+    assert (await database["plans"].find_one({"title": "Orphan"}))["user_id"] == kept
+
+
+def test_collection_scan_detection():
+    """The checker finds COLLSCAN stages nested anywhere in the plan."""
+    explain_doc = {"queryPlanner": {"winningPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}}}
+    assert len(collection_scans(explain_doc)) == 1
+    assert collection_scans({"queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}}}) == []
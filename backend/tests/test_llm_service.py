@@ -2,7 +2,9 @@
 Unit tests for LLM service with mocked OpenAI client.
 """
 import pytest
+import asyncio
 import json
+import time
 from unittest.mock import MagicMock, patch, AsyncMock
 import sys
 from pathlib import Path
@@ -31,9 +33,41 @@ class MockChunk:
 
 class MockToolCall:
     """Mock for OpenAI tool call."""
-    def __init__(self, arguments):
+    def __init__(self, arguments, name=None, index=0):
+        self.index = index
         self.function = MagicMock()
         self.function.arguments = arguments
+        self.function.name = name
+
+
+class MockAsyncStream:
+    """Mock for the AsyncOpenAI streaming response, optionally pacing chunks."""
+    def __init__(self, chunks, delay=0.0):
+        self.chunks = chunks
+        self.delay = delay
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            yield chunk
+
+
+def mock_create(chunks, delay=0.0):
+    """Build an awaitable replacement for client.chat.completions.create."""
+    return AsyncMock(side_effect=lambda **kwargs: MockAsyncStream(chunks, delay))
+
+
+def use_openai(create):
+    """Route stream_chat through an OpenAIProvider whose create() is replaced."""
+    from core.providers import OpenAIProvider
+    provider = OpenAIProvider(api_key="test-key")
+    provider.client.chat.completions.create = create
+    return patch("core.llm.get_provider", return_value=provider)
 
 
 def create_text_chunks(text_parts):
@@ -60,21 +94,20 @@ class TestStreamChat:
         text_parts = ["Hello", ", ", "world", "!"]
         mock_chunks = create_text_chunks(text_parts)
         
-        mock_response = MagicMock()
-        mock_response.__iter__ = lambda self: iter(mock_chunks)
-        
-        with patch("core.llm.client.chat.completions.create", return_value=mock_response):
+        with use_openai(mock_create(mock_chunks)):
             messages = [{"role": "user", "content": "Say hello"}]
             
             chunks = []
             async for chunk in stream_chat(messages):
                 chunks.append(chunk)
             
-            assert len(chunks) == 4
+            # Content chunks are followed by a single usage report
+            assert len(chunks) == 5
             
             # Parse and verify content
-            parsed = [json.loads(c) for c in chunks]
+            *parsed, usage = [c.to_dict() for c in chunks]
             assert all(p["type"] == "text" for p in parsed)
+            assert usage["type"] == "usage"
             assert "".join(p["content"] for p in parsed) == "Hello, world!"
 
     @pytest.mark.asyncio
@@ -86,20 +119,17 @@ class TestStreamChat:
         arg_parts = ['{"title":', '"Test Plan",', '"steps": []}']
         mock_chunks = create_tool_chunks(arg_parts)
         
-        mock_response = MagicMock()
-        mock_response.__iter__ = lambda self: iter(mock_chunks)
-        
-        with patch("core.llm.client.chat.completions.create", return_value=mock_response):
+        with use_openai(mock_create(mock_chunks)):
             messages = [{"role": "user", "content": "Create a plan"}]
             
             chunks = []
             async for chunk in stream_chat(messages):
                 chunks.append(chunk)
             
-            assert len(chunks) == 3
+            assert len(chunks) == 4
             
             # Parse and verify tool chunks
-            parsed = [json.loads(c) for c in chunks]
+            parsed = [c.to_dict() for c in chunks[:-1]]
             assert all(p["type"] == "tool_chunk" for p in parsed)
 
     @pytest.mark.asyncio
@@ -107,10 +137,8 @@ class TestStreamChat:
         """Verify system prompt is prepended to messages."""
         from core.llm import stream_chat, SYSTEM_PROMPT
         
-        mock_response = MagicMock()
-        mock_response.__iter__ = lambda self: iter([])
-        
-        with patch("core.llm.client.chat.completions.create", return_value=mock_response) as mock_create:
+        mocked_create = mock_create([])
+        with use_openai(mocked_create):
             messages = [{"role": "user", "content": "Hello"}]
             
             # Consume the generator
@@ -118,7 +146,7 @@ class TestStreamChat:
                 pass
             
             # Verify the call was made with system prompt
-            call_kwargs = mock_create.call_args.kwargs
+            call_kwargs = mocked_create.call_args.kwargs
             sent_messages = call_kwargs["messages"]
             
             assert sent_messages[0]["role"] == "system"
@@ -130,14 +158,12 @@ class TestStreamChat:
         """Verify correct model is used."""
         from core.llm import stream_chat
         
-        mock_response = MagicMock()
-        mock_response.__iter__ = lambda self: iter([])
-        
-        with patch("core.llm.client.chat.completions.create", return_value=mock_response) as mock_create:
+        mocked_create = mock_create([])
+        with use_openai(mocked_create):
             async for _ in stream_chat([{"role": "user", "content": "Hi"}]):
                 pass
             
-            call_kwargs = mock_create.call_args.kwargs
+            call_kwargs = mocked_create.call_args.kwargs
             assert call_kwargs["model"] == "gpt-4o"
             assert call_kwargs["stream"] is True
 
@@ -152,16 +178,207 @@ class TestStreamChat:
             MockChunk(MockDelta(tool_calls=[MockToolCall('{"title": "Plan"}')])),
         ]
         
-        mock_response = MagicMock()
-        mock_response.__iter__ = lambda self: iter(mock_chunks)
-        
-        with patch("core.llm.client.chat.completions.create", return_value=mock_response):
+        with use_openai(mock_create(mock_chunks)):
             messages = [{"role": "user", "content": "Make a plan"}]
             
             chunks = []
             async for chunk in stream_chat(messages):
-                chunks.append(json.loads(chunk))
+                chunks.append(chunk.to_dict())
             
-            assert len(chunks) == 2
+            assert len(chunks) == 3
             assert chunks[0]["type"] == "text"
             assert chunks[1]["type"] == "tool_chunk"
+            assert chunks[2]["type"] == "usage"
+
+    @pytest.mark.asyncio
+    async def test_stream_chat_keeps_tool_call_index(self):
+        """Interleaved deltas of parallel tool calls carry their call index."""
+        from core.llm import stream_chat
+
+        mock_chunks = [
+            MockChunk(MockDelta(tool_calls=[MockToolCall('{"title":', name="manage_plan", index=0)])),
+            MockChunk(MockDelta(tool_calls=[MockToolCall('{"operations":', name="patch_plan", index=1)])),
+            MockChunk(MockDelta(tool_calls=[MockToolCall(' "T", "steps": []}', index=0)])),
+            MockChunk(MockDelta(tool_calls=[MockToolCall(' []}', index=1)])),
+        ]
+
+        with use_openai(mock_create(mock_chunks)):
+            events = [e async for e in stream_chat([{"role": "user", "content": "Plan"}])]
+
+        deltas = [e for e in events if e.type == "tool_chunk"]
+        assert [d.index for d in deltas] == [0, 1, 0, 1]
+        assert json.loads("".join(d.content for d in deltas if d.index == 1)) == {"operations": []}
+
+    @pytest.mark.asyncio
+    async def test_stream_chat_reports_token_usage(self):
+        """Usage event should report prompt, completion and saved tokens."""
+        from core.llm import stream_chat
+
+        history = []
+        for i in range(30):
+            history.append({"role": "user", "content": f"Question {i} " + "about discovery " * 40})
+            history.append({"role": "assistant", "content": f"Answer {i} " + "on deadlines " * 40})
+
+        with use_openai(mock_create(create_text_chunks(["Noted."]))):
+            chunks = [c.to_dict() async for c in stream_chat(history)]
+
+        usage = chunks[-1]
+        assert usage["type"] == "usage"
+        assert usage["completion_tokens"] > 0
+        assert usage["prompt_tokens"] < usage["original_tokens"]
+        assert usage["tokens_saved"] == usage["original_tokens"] - usage["prompt_tokens"]
+        assert usage["messages_condensed"] + usage["messages_dropped"] > 0
+
+
+class TestStreamConcurrency:
+    """Tests that streaming chats share the event loop instead of blocking it."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_streams_do_not_block_event_loop(self):
+        """Dozens of slow streams should leave the loop free for other work."""
+        from core.llm import stream_chat
+
+        mock_chunks = create_text_chunks(["token "] * 20)
+        streaming = 0
+
+        async def consume():
+            nonlocal streaming
+            chunks = []
+            async for chunk in stream_chat([{"role": "user", "content": "Hi"}]):
+                if not chunks:
+                    streaming += 1
+                chunks.append(chunk)
+            streaming -= 1
+            return chunks
+
+        async def probe():
+            # Stand-in for unrelated requests: each tick records how many streams are mid-flight
+            in_flight = []
+            for _ in range(10):
+                await asyncio.sleep(0.01)
+                in_flight.append(streaming)
+            return in_flight
+
+        with use_openai(mock_create(mock_chunks, delay=0.01)):
+            *results, in_flight = await asyncio.gather(*[consume() for _ in range(40)], probe())
+
+        assert all(len(chunks) == 21 for chunks in results)
+        # A blocking stream would run to completion before the probe got a turn
+        assert len(in_flight) == 10
+        assert in_flight[0] > 1
+
+    @pytest.mark.asyncio
+    async def test_concurrent_streams_respect_cap(self):
+        """No more than MAX_CONCURRENT_STREAMS upstream calls should be open at once."""
+        import core.llm
+
+        open_streams = 0
+        peak = 0
+
+        class CountingStream(MockAsyncStream):
+            async def __aiter__(self):
+                nonlocal open_streams, peak
+                open_streams += 1
+                peak = max(peak, open_streams)
+                try:
+                    async for chunk in super().__aiter__():
+                        yield chunk
+                finally:
+                    open_streams -= 1
+
+        create = AsyncMock(side_effect=lambda **kwargs: CountingStream(create_text_chunks(["a", "b"]), 0.01))
+
+        async def consume():
+            async for _ in core.llm.stream_chat([{"role": "user", "content": "Hi"}]):
+                pass
+
+        with patch.object(core.llm, "_stream_slots", asyncio.Semaphore(3)), use_openai(create):
+            await asyncio.gather(*[consume() for _ in range(12)])
+
+        assert create.await_count == 12
+        assert peak == 3
+
+
+class TestUpstreamCancellation:
+    """Stopping a turn closes the upstream response."""
+
+    @pytest.mark.asyncio
+    async def test_cancelled_stream_closes_upstream_response(self):
+        from core.llm import stream_chat
+
+        upstream = MockAsyncStream(create_text_chunks(["token "] * 100), delay=0.01)
+
+        async def consume():
+            async for _ in stream_chat([{"role": "user", "content": "Hi"}]):
+                pass
+
+        with use_openai(AsyncMock(return_value=upstream)):
+            task = asyncio.create_task(consume())
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        assert upstream.closed
+
+
+class TestMockProvider:
+    """Tests for the offline mock provider."""
+
+    @pytest.mark.asyncio
+    async def test_mock_provider_streams_text_and_plan(self):
+        """Mock stream should yield text tokens followed by a valid manage_plan call."""
+        from core.llm import stream_chat
+        from core.providers import MockProvider
+
+        provider = MockProvider(tokens_per_second=0, ttft_ms=0)
+        with patch("core.llm.get_provider", return_value=provider):
+            chunks = [c.to_dict() async for c in stream_chat([{"role": "user", "content": "Motion to dismiss in NY"}])]
+
+        text = "".join(c["content"] for c in chunks if c["type"] == "text")
+        args = json.loads("".join(c["content"] for c in chunks if c["type"] == "tool_chunk"))
+        assert text.startswith("Understood.")
+        assert args["title"] == "Motion to dismiss in NY Strategy"
+        assert all({"id", "title", "status"} <= set(step) for step in args["steps"])
+
+    @pytest.mark.asyncio
+    async def test_mock_provider_paces_first_token(self):
+        """Time to first chunk should follow the configured ttft_ms."""
+        from core.providers import MockProvider
+
+        provider = MockProvider(tokens_per_second=0, ttft_ms=50, tool_calls=False)
+        start = time.perf_counter()
+        stream = provider.stream([{"role": "user", "content": "Hi"}], [])
+        await stream.__anext__()
+        assert time.perf_counter() - start >= 0.05
+        await stream.aclose()
+
+    def test_create_provider_from_env(self, monkeypatch):
+        """LLM_PROVIDER and LLM_MODEL should select and configure the provider."""
+        from core.providers import create_provider, MockProvider, OpenAIProvider
+
+        monkeypatch.setenv("LLM_PROVIDER", "mock")
+        monkeypatch.setenv("MOCK_LLM_TOKENS_PER_SECOND", "20")
+        provider = create_provider()
+        assert isinstance(provider, MockProvider)
+        assert provider.tokens_per_second == 20
+
+        monkeypatch.setenv("LLM_PROVIDER", "openai")
+        monkeypatch.setenv("LLM_MODEL", "gpt-4o-mini")
+        monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+        provider = create_provider()
+        assert isinstance(provider, OpenAIProvider)
+        assert provider.model == "gpt-4o-mini"
+
+        with pytest.raises(ValueError):
+            create_provider("unknown")
+
+    def test_provider_must_implement_stream(self):
+        """A provider without stream() is rejected when it is built, not on first use."""
+        from core.providers import LLMProvider
+
+        class Incomplete(LLMProvider):
+            name = "incomplete"
+
+        with pytest.raises(TypeError):
+            Incomplete()
@@ -0,0 +1,133 @@
+"""
+Tests for in-process metrics and the /metrics endpoint.
+"""
+import threading
+
+import pytest
+from httpx import AsyncClient, ASGITransport
+from unittest.mock import patch
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.metrics import (
+    Counter, CounterFunction, Gauge, Histogram, REGISTRY, render,
+    password_hash_duration, streams_in_flight, time_to_first_token, tokens_per_second,
+)
+from core.providers import MockProvider
+
+
+@pytest.fixture
+def scratch_registry():
+    """Metrics created in a test are dropped from the global registry afterwards."""
+    before = list(REGISTRY)
+    yield
+    REGISTRY[:] = before
+
+
+class TestRender:
+    """Prometheus text exposition."""
+
+    def test_counter_and_gauge(self, scratch_registry):
+        counter = Counter("demo_total", "Demo counter")
+        counter.inc(kind="a")
+        counter.inc(2, kind="a")
+        gauge = Gauge("demo_depth", "Demo gauge", function=lambda: 3)
+
+        text = render([counter, gauge])
+        assert "# TYPE demo_total counter" in text
+        assert 'demo_total{kind="a"} 3' in text
+        assert "demo_depth 3" in text
+
+    def test_histogram_buckets_are_cumulative(self, scratch_registry):
+        histogram = Histogram("demo_seconds", "Demo histogram", buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value, route="x")
+
+        text = render([histogram])
+        assert 'demo_seconds_bucket{route="x",le="0.1"} 2' in text
+        assert 'demo_seconds_bucket{route="x",le="1"} 3' in text
+        assert 'demo_seconds_bucket{route="x",le="+Inf"} 4' in text
+        assert 'demo_seconds_count{route="x"} 4' in text
+        assert histogram.sum(route="x") == pytest.approx(2.65)
+
+    def test_label_values_are_escaped(self, scratch_registry):
+        counter = CounterFunction("demo_total", "Demo", lambda: [({"path": 'a"b\\c'}, 1)])
+        assert 'demo_total{path="a\\"b\\\\c"} 1' in render([counter])
+
+    def test_timer_observes_block(self, scratch_registry):
+        histogram = Histogram("demo_seconds", "Demo histogram")
+        with histogram.time(op="x"):
+            pass
+        assert histogram.count(op="x") == 1
+
+    def test_render_while_other_threads_record(self, scratch_registry):
+        """Driver listeners record from their own threads while a scrape renders on the loop."""
+        counter = Counter("demo_total", "Demo counter")
+        gauge = Gauge("demo_depth", "Demo gauge")
+        histogram = Histogram("demo_seconds", "Demo histogram", buckets=(1.0,))
+        per_thread = 2000
+
+        def record(worker):
+            for i in range(per_thread):
+                counter.inc(kind=str(i % 50))
+                gauge.inc(address=f"{worker}-{i}")
+                histogram.observe(0.5, command=f"{worker}-{i}")
+
+        threads = [threading.Thread(target=record, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            render([counter, gauge, histogram])
+        for thread in threads:
+            thread.join()
+
+        assert sum(value for _, _, value in counter.samples()) == 4 * per_thread
+        assert sum(value for _, _, value in gauge.samples()) == 4 * per_thread
+        assert render([histogram]).count("_count{") == 4 * per_thread
+
+
+@pytest.mark.asyncio
+async def test_stream_chat_records_latency():
+    """A live completion records TTFT and throughput and leaves no stream in flight."""
+    from core.llm import stream_chat
+
+    ttft_before = time_to_first_token.count()
+    tps_before = tokens_per_second.count()
+    provider = MockProvider(tokens_per_second=500, ttft_ms=0)
+    with patch("core.llm.get_provider", return_value=provider):
+        async for _ in stream_chat([{"role": "user", "content": "Metrics please"}], use_cache=False):
+            assert streams_in_flight.value() >= 0
+
+    assert time_to_first_token.count() == ttft_before + 1
+    assert tokens_per_second.count() == tps_before + 1
+    assert streams_in_flight.value() == 0
+
+
+@pytest.mark.asyncio
+async def test_password_hashing_is_timed():
+    from api.auth import get_password_hash_async, verify_password_async
+
+    with patch("api.auth.BCRYPT_ROUNDS", 4):
+        hashed = await get_password_hash_async("metricpassword")
+        await verify_password_async("metricpassword", hashed)
+    assert password_hash_duration.count(operation="hash") >= 1
+    assert password_hash_duration.count(operation="verify") >= 1
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(monkeypatch):
+    import main
+
+    async with AsyncClient(transport=ASGITransport(app=main.app), base_url="http://test") as ac:
+        response = await ac.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "# TYPE llm_time_to_first_token_seconds histogram" in response.text
+        assert 'cache_lookups_total{cache="user",result="hit"}' in response.text
+
+        monkeypatch.setattr(main, "METRICS_TOKEN", "scrape-secret")
+        assert (await ac.get("/metrics")).status_code == 401
+        response = await ac.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+        assert response.status_code == 200
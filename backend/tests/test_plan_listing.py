@@ -0,0 +1,68 @@
+"""
+Tests for the paginated, projected plan listing used by the history sidebar.
+"""
+import pytest
+from datetime import datetime, timedelta
+from httpx import AsyncClient
+
+from core.storage import get_storage
+
+
+async def login(client: AsyncClient, email: str) -> dict:
+    await client.post("/api/auth/register", json={"email": email, "password": "password123"})
+    response = await client.post("/api/auth/token", data={"username": email, "password": "password123"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def make_plans(email: str, count: int):
+    storage = get_storage()
+    user = await storage.users.get_by_email(email)
+    base = datetime(2025, 1, 1)
+    plans = []
+    for i in range(count):
+        # Pairs share a timestamp so the _id tie-breaker is exercised
+        plan = await storage.plans.create(user.id, f"Plan {i}", updated_at=base + timedelta(minutes=i // 2),
+                                          steps=[{"id": "1", "title": "Research", "status": "pending"}])
+        plans.append(plan)
+    return plans
+
+
+@pytest.mark.asyncio
+async def test_list_plans_pages_by_updated_at(client: AsyncClient):
+    """Pages are newest first, do not overlap and end without a cursor."""
+    headers = await login(client, "pager@example.com")
+    plans = await make_plans("pager@example.com", 7)
+
+    seen = []
+    cursor = None
+    for _ in range(5):
+        params = {"limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        response = await client.get("/api/plans/", params=params, headers=headers)
+        assert response.status_code == 200
+        seen.extend(p["_id"] for p in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    expected = sorted(plans, key=lambda p: (p.updated_at, str(p.id)), reverse=True)
+    assert seen == [str(p.id) for p in expected]
+
+
+@pytest.mark.asyncio
+async def test_list_plans_returns_summaries_only(client: AsyncClient):
+    """The listing carries id, title and updated_at but no steps."""
+    headers = await login(client, "summary@example.com")
+    await make_plans("summary@example.com", 1)
+
+    response = await client.get("/api/plans/", headers=headers)
+    assert set(response.json()[0]) == {"_id", "title", "updated_at"}
+    assert "X-Next-Cursor" not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_list_plans_rejects_bad_cursor(client: AsyncClient):
+    headers = await login(client, "badcursor@example.com")
+    response = await client.get("/api/plans/", params={"cursor": "not-a-cursor"}, headers=headers)
+    assert response.status_code == 400
@@ -0,0 +1,102 @@
+"""
+Unit tests for incremental plan patches (patch_plan tool).
+"""
+import pytest
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.plan_patch import apply_plan_patch, plan_patch_writes, PlanPatchError
+
+
+def make_steps(n=3):
+    return [{"id": str(i), "title": f"Step {i}", "description": "", "status": "pending"} for i in range(1, n + 1)]
+
+
+class TestApplyPlanPatch:
+    """Tests for apply_plan_patch."""
+
+    def test_update_changes_only_given_fields(self):
+        steps = make_steps()
+        result = apply_plan_patch(steps, [{"op": "update", "id": "2", "step": {"status": "done"}}])
+        assert result[1] == {"id": "2", "title": "Step 2", "description": "", "status": "done"}
+        assert steps[1]["status"] == "pending"  # input untouched
+
+    def test_add_appends_or_inserts_after(self):
+        result = apply_plan_patch(make_steps(), [
+            {"op": "add", "step": {"id": "4", "title": "Serve"}},
+            {"op": "add", "step": {"id": "1a", "title": "Research"}, "after": "1"},
+        ])
+        assert [s["id"] for s in result] == ["1", "1a", "2", "3", "4"]
+        assert result[1]["status"] == "pending"
+
+    def test_remove_and_reorder(self):
+        result = apply_plan_patch(make_steps(), [
+            {"op": "remove", "id": "2"},
+            {"op": "reorder", "order": ["3", "1"]},
+        ])
+        assert [s["id"] for s in result] == ["3", "1"]
+
+    @pytest.mark.parametrize("operation", [
+        {"op": "update", "id": "99", "step": {"status": "done"}},
+        {"op": "remove", "id": "99"},
+        {"op": "add", "step": {"id": "1", "title": "Duplicate"}},
+        {"op": "add", "step": {"title": "No id"}},
+        {"op": "update", "id": "1", "step": {"status": "archived"}},
+        {"op": "reorder", "order": ["1", "2"]},
+        {"op": "rename"},
+    ])
+    def test_invalid_operations_raise(self, operation):
+        with pytest.raises(PlanPatchError):
+            apply_plan_patch(make_steps(), [operation])
+
+    @pytest.mark.parametrize("operations", [
+        {"op": "remove", "id": "1"},
+        ["remove 1"],
+        [None],
+        [{"op": "add", "step": "Serve"}],
+        [{"op": "add", "step": {"id": 4, "title": "Serve"}}],
+        [{"op": "update", "id": "1", "step": ["done"]}],
+        [{"op": "reorder", "order": "1,2,3"}],
+        [{"op": "reorder", "order": ["1", "2", 3]}],
+        [{"op": "reorder", "order": ["1", "2", None]}],
+        [{"op": "reorder", "order": ["1", "1", "2"]}],
+    ])
+    def test_malformed_operations_raise_patch_errors(self, operations):
+        """Model output is untrusted: malformed patches are rejected, not crashes."""
+        with pytest.raises(PlanPatchError):
+            apply_plan_patch(make_steps(), operations)
+
+    @pytest.mark.parametrize("operation", [
+        {"op": "update", "id": "2", "step": {"status": "done"}},
+        {"op": "remove", "id": "2"},
+        {"op": "reorder", "order": ["1", "2", "2"]},
+    ])
+    def test_duplicate_step_ids_are_rejected(self, operation):
+        """MongoDB would edit every step with the id, so the emitted plan would not match the stored one."""
+        steps = make_steps() + [{"id": "2", "title": "Twin", "status": "pending"}]
+        with pytest.raises(PlanPatchError, match="Duplicate step id '2'"):
+            apply_plan_patch(steps, [operation])
+
+
+class TestPlanPatchWrites:
+    """Tests for the MongoDB updates generated from a patch."""
+
+    def test_update_uses_array_filter(self):
+        writes = plan_patch_writes({"_id": 1}, make_steps(), [{"op": "update", "id": "2", "step": {"status": "done"}}])
+        assert len(writes) == 1
+        assert writes[0]._doc == {"$set": {"steps.$[s].status": "done"}}
+        assert writes[0]._array_filters == [{"s.id": "2"}]
+
+    def test_add_remove_reorder_and_title(self):
+        writes = plan_patch_writes({"_id": 1}, make_steps(), [
+            {"op": "add", "step": {"id": "1a", "title": "Research"}, "after": "1"},
+            {"op": "remove", "id": "3"},
+            {"op": "reorder", "order": ["2", "1a", "1"]},
+        ], title="New title", extra_set={"updated_at": "now"})
+
+        assert writes[0]._doc == {"$push": {"steps": {"$each": [{"id": "1a", "title": "Research", "status": "pending"}], "$position": 1}}}
+        assert writes[1]._doc == {"$pull": {"steps": {"id": "3"}}}
+        assert [s["id"] for s in writes[2]._doc["$set"]["steps"]] == ["2", "1a", "1"]
+        assert writes[3]._doc == {"$set": {"updated_at": "now", "title": "New title"}}
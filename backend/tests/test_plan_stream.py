@@ -0,0 +1,87 @@
+"""
+Tests for incremental parsing of streamed manage_plan arguments.
+"""
+import json
+import pytest
+from httpx import AsyncClient
+from unittest.mock import patch
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.plan_stream import PlanStepParser
+from core.providers import MockProvider, split_fragments
+
+
+PLAN = {
+    "title": "Motion to Dismiss \"Strategy\"",
+    "steps": [
+        {"id": "1", "title": "Research {standard}", "description": "Check [local] rules, then \\ file", "status": "pending"},
+        {"id": "2", "title": "Draft", "status": "in-progress", "meta": {"nested": [1, {"x": "}"}]}},
+        {"id": "3", "title": "File", "status": "done"},
+    ],
+}
+
+
+def parse(arguments, size):
+    parser = PlanStepParser()
+    events = []
+    for fragment in split_fragments(arguments, size):
+        events.extend(parser.feed(fragment))
+    return parser, events
+
+
+class TestPlanStepParser:
+    """Steps are emitted as soon as each one is complete."""
+
+    @pytest.mark.parametrize("size", [1, 3, 4, 17, 1000])
+    def test_emits_every_step_for_any_fragmentation(self, size):
+        parser, events = parse(json.dumps(PLAN), size)
+        assert [e.index for e in events] == [0, 1, 2]
+        assert [e.step for e in events] == PLAN["steps"]
+        assert parser.title == PLAN["title"]
+        assert events[0].title == PLAN["title"]
+
+    def test_step_is_emitted_before_the_rest_arrives(self):
+        arguments = json.dumps(PLAN)
+        cut = arguments.index('{"id": "2"')
+        parser = PlanStepParser()
+        events = parser.feed(arguments[:cut])
+        assert [e.step["id"] for e in events] == ["1"]
+
+    def test_steps_before_title(self):
+        parser, events = parse(json.dumps({"steps": [{"id": "a", "title": "A"}], "title": "Late"}), 5)
+        assert events[0].title is None
+        assert parser.title == "Late"
+
+    def test_ignores_other_arrays_and_pretty_printing(self):
+        arguments = json.dumps({"title": "T", "tags": [{"id": "x"}], "steps": [{"id": "1", "title": "One"}]}, indent=2)
+        _, events = parse(arguments, 2)
+        assert [e.step["id"] for e in events] == ["1"]
+
+    def test_malformed_step_is_skipped(self):
+        _, events = parse('{"title": "T", "steps": [{"id": "1", "title": }, {"id": "2", "title": "Two"}]}', 4)
+        assert [e.step["id"] for e in events] == ["2"]
+        assert events[0].index == 0
+
+
+@pytest.mark.asyncio
+async def test_chat_streams_plan_steps_before_saved_plan(client: AsyncClient):
+    """plan_step events arrive during the tool call, before the saved plan."""
+    await client.post("/api/auth/register", json={"email": "steps@example.com", "password": "password123"})
+    token = (await client.post("/api/auth/token", data={"username": "steps@example.com", "password": "password123"})).json()["access_token"]
+
+    with patch("core.llm.get_provider", return_value=MockProvider(tokens_per_second=0, ttft_ms=0)):
+        async with client.stream("POST", "/api/chat", json={"message": "Motion to dismiss"},
+                                 headers={"Authorization": f"Bearer {token}"}) as response:
+            body = "".join([chunk async for chunk in response.aiter_text()])
+
+    events = [json.loads(line) for line in body.splitlines() if line.strip()]
+    types = [e["type"] for e in events]
+    steps = [e for e in events if e["type"] == "plan_step"]
+    saved = next(e for e in events if e["type"] == "plan")
+
+    assert len(steps) == len(saved["plan"]["steps"])
+    assert [e["step"] for e in steps] == saved["plan"]["steps"]
+    assert max(i for i, t in enumerate(types) if t == "plan_step") < types.index("plan")
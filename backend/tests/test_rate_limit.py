@@ -0,0 +1,172 @@
+"""
+Tests for admission control on the auth endpoints.
+"""
+import pytest
+from httpx import AsyncClient, ASGITransport
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.ratelimit import (
+    InFlightLimit,
+    InMemoryRateLimitStore,
+    RateLimit,
+    RateLimitExceeded,
+    RateLimitStore,
+    get_rate_limit_store,
+    parse_rate,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket:
+    """Tests for the in-memory token bucket store."""
+
+    def test_parse_rate(self):
+        assert parse_rate("10/60") == (10.0, 10.0 / 60)
+
+    def test_store_must_implement_every_method(self):
+        class AcquireOnly(RateLimitStore):
+            async def acquire(self, key, capacity, refill_rate, cost=1.0):
+                return 0.0
+
+        with pytest.raises(TypeError):
+            AcquireOnly()
+
+    @pytest.mark.asyncio
+    async def test_burst_then_reject_with_retry_after(self):
+        store = InMemoryRateLimitStore(clock=FakeClock())
+        for _ in range(3):
+            assert await store.acquire("k", capacity=3, refill_rate=1.0) == 0
+        assert await store.acquire("k", capacity=3, refill_rate=1.0) == pytest.approx(1.0)
+
+    @pytest.mark.asyncio
+    async def test_tokens_refill_over_time(self):
+        clock = FakeClock()
+        store = InMemoryRateLimitStore(clock=clock)
+        limit = RateLimit("test", "2/10")
+        await limit.hit("a", store)
+        await limit.hit("a", store)
+        with pytest.raises(RateLimitExceeded) as exc:
+            await limit.hit("a", store)
+        assert exc.value.retry_after_header == "5"
+
+        clock.now = 5.0
+        await limit.hit("a", store)
+
+    @pytest.mark.asyncio
+    async def test_keys_are_independent(self):
+        store = InMemoryRateLimitStore(clock=FakeClock())
+        limit = RateLimit("test", "1/60")
+        await limit.hit("a", store)
+        await limit.hit("b", store)
+        with pytest.raises(RateLimitExceeded):
+            await limit.hit("a", store)
+
+    @pytest.mark.asyncio
+    async def test_least_recently_used_keys_are_dropped(self):
+        store = InMemoryRateLimitStore(max_keys=2, clock=FakeClock())
+        for key in ("a", "b", "c"):
+            await store.acquire(key, capacity=1, refill_rate=1.0)
+        assert list(store._buckets) == ["b", "c"]
+
+
+class TestInFlightLimit:
+    """Tests for the concurrent hash cap."""
+
+    @pytest.mark.asyncio
+    async def test_rejects_beyond_limit_and_releases(self):
+        limit = InFlightLimit(1, retry_after=2)
+        async with limit:
+            with pytest.raises(RateLimitExceeded) as exc:
+                async with limit:
+                    pass
+            assert exc.value.retry_after_header == "2"
+        assert limit.in_flight == 0
+
+        async with limit:
+            assert limit.in_flight == 1
+
+
+@pytest.mark.asyncio
+async def test_login_is_rejected_with_429_per_ip(monkeypatch):
+    """Once the per-IP bucket is empty the endpoint answers 429 before touching the database."""
+    from main import app
+    import api.auth
+
+    ip_limit = RateLimit("auth-ip-test", "1/60")
+    monkeypatch.setattr(api.auth, "auth_ip_limit", ip_limit)
+    get_rate_limit_store().clear()
+    await ip_limit.hit("127.0.0.1")
+
+    async with AsyncClient(transport=ASGITransport(app=app, client=("127.0.0.1", 123)), base_url="http://test") as ac:
+        response = await ac.post("/api/auth/token", data={"username": "a@example.com", "password": "x"})
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "60"
+    get_rate_limit_store().clear()
+
+
+@pytest.mark.asyncio
+async def test_login_is_rejected_with_429_per_account(client: AsyncClient, monkeypatch):
+    """Repeated attempts against one account are limited regardless of the password."""
+    import api.auth
+    monkeypatch.setattr(api.auth, "auth_account_limit", RateLimit("auth-account-test", "3/60"))
+
+    statuses = []
+    for _ in range(4):
+        response = await client.post("/api/auth/token", data={
+            "username": "Target@example.com",
+            "password": "guess"
+        })
+        statuses.append(response.status_code)
+
+    assert statuses == [401, 401, 401, 429]
+    assert int(response.headers["Retry-After"]) > 0
+
+
+@pytest.mark.asyncio
+async def test_account_limit_spans_clients_but_leaves_the_owner_headroom(client: AsyncClient, monkeypatch):
+    """Failures from other addresses do not lock the owner out at once, but guesses across addresses are capped."""
+    from main import app
+    import api.auth
+    monkeypatch.setattr(api.auth, "auth_account_limit", RateLimit("auth-account-owner-test", "2/60"))
+    monkeypatch.setattr(api.auth, "auth_account_total_limit", RateLimit("auth-account-total-test", "4/60"))
+    await client.post("/api/auth/register", json={"email": "owner@example.com", "password": "password123"})
+    get_rate_limit_store().clear()
+
+    async def guess(ip):
+        async with AsyncClient(transport=ASGITransport(app=app, client=(ip, 123)), base_url="http://test") as attacker:
+            response = await attacker.post("/api/auth/token", data={"username": "owner@example.com", "password": "guess"})
+            return response.status_code
+
+    # The third guess from one address stops at the per-client bucket without draining the account-wide one
+    assert [await guess("203.0.113.7") for _ in range(3)] == [401, 401, 429]
+
+    response = await client.post("/api/auth/token", data={"username": "owner@example.com", "password": "password123"})
+    assert response.status_code == 200
+
+    # Spreading over more addresses runs into the account-wide bucket
+    assert [await guess("203.0.113.8"), await guess("203.0.113.9")] == [401, 429]
+
+
+def test_startup_warns_when_proxy_headers_use_the_default_trusted_address(monkeypatch, caplog):
+    """Behind a platform proxy the default would put every client in one per-IP bucket."""
+    import main
+    monkeypatch.setattr(sys, "argv", ["uvicorn", "main:app", "--proxy-headers"])
+    monkeypatch.delenv("FORWARDED_ALLOW_IPS", raising=False)
+    main.warn_if_proxy_unconfigured()
+    assert "FORWARDED_ALLOW_IPS" in caplog.text
+
+    caplog.clear()
+    monkeypatch.setenv("FORWARDED_ALLOW_IPS", "10.0.0.1")
+    main.warn_if_proxy_unconfigured()
+    assert caplog.text == ""
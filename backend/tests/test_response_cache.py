@@ -0,0 +1,154 @@
+"""
+Tests for the exact-match LLM response cache.
+"""
+import pytest
+from httpx import AsyncClient
+from unittest.mock import patch
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.cache import TTLCache, response_cache
+from core.llm import response_cache_key, stream_chat
+from core.metrics import response_cache_lookups
+from core.providers import MockProvider
+
+
+class CountingProvider(MockProvider):
+    """Mock provider that counts upstream calls."""
+    def __init__(self, **kwargs):
+        super().__init__(tokens_per_second=0, ttft_ms=0, **kwargs)
+        self.calls = 0
+
+    def stream(self, messages, tools):
+        self.calls += 1
+        return super().stream(messages, tools)
+
+
+async def run(provider, messages, plan_context="", use_cache=True):
+    with patch("core.llm.get_provider", return_value=provider):
+        return [e.to_dict() async for e in stream_chat(messages, plan_context, use_cache=use_cache)]
+
+
+class TestWeightedEviction:
+    """TTLCache can bound the total weight of its entries."""
+
+    def test_evicts_least_recently_used_by_weight(self):
+        cache = TTLCache(maxsize=100, ttl=60, max_weight=10)
+        cache.set("a", "x", weight=4)
+        cache.set("b", "y", weight=4)
+        cache.get("a")
+        cache.set("c", "z", weight=4)
+        assert cache.get("b") is None
+        assert cache.get("a") == "x"
+        assert cache.weight == 8
+
+    def test_oversized_entries_are_not_stored(self):
+        cache = TTLCache(maxsize=100, ttl=60, max_weight=10)
+        cache.set("a", "x", weight=11)
+        assert len(cache) == 0
+
+    def test_oversized_replacement_drops_the_old_entry(self):
+        cache = TTLCache(maxsize=100, ttl=60, max_weight=10)
+        cache.set("a", "x", weight=4)
+        cache.set("a", "y", weight=11)
+        assert cache.get("a") is None
+        assert cache.weight == 0
+
+    def test_replacing_an_entry_updates_weight(self):
+        cache = TTLCache(maxsize=100, ttl=60, max_weight=10)
+        cache.set("a", "x", weight=6)
+        cache.set("a", "y", weight=3)
+        assert cache.weight == 3
+
+
+class TestResponseCache:
+    """Identical prompts replay the stored turn instead of calling the model."""
+
+    def test_key_normalizes_whitespace_only(self):
+        base = [{"role": "user", "content": "Motion to dismiss in NY"}]
+        spaced = [{"role": "user", "content": "  Motion  to dismiss\nin NY "}]
+        other = [{"role": "user", "content": "Motion to dismiss in CA"}]
+        assert response_cache_key("gpt-4o", base) == response_cache_key("gpt-4o", spaced)
+        assert response_cache_key("gpt-4o", base) != response_cache_key("gpt-4o", other)
+        assert response_cache_key("gpt-4o", base) != response_cache_key("gpt-4o-mini", base)
+
+    @pytest.mark.asyncio
+    async def test_repeated_prompt_is_replayed(self):
+        provider = CountingProvider()
+        hits_before = response_cache_lookups.value(result="hit")
+        messages = [{"role": "user", "content": "Motion to dismiss in NY"}]
+
+        first = await run(provider, messages, plan_context='{"title": "Untitled Strategy", "steps": []}')
+        second = await run(provider, messages, plan_context='{"title": "Untitled Strategy", "steps": []}')
+
+        assert provider.calls == 1
+        assert second[:-1] == first[:-1]
+        assert second[-1] == {**first[-1], "cached": True}
+        assert response_cache_lookups.value(result="hit") == hits_before + 1
+        assert response_cache.stats()["hits"] >= 1
+
+    @pytest.mark.asyncio
+    async def test_entry_weight_approximates_replayed_bytes(self):
+        from core.events import encode_event
+        response_cache.clear()
+        messages = [{"role": "user", "content": "Motion for a protective order"}]
+        await run(CountingProvider(), messages)
+
+        events, _, weight = next(iter(response_cache._data.values()))
+        encoded = sum(len(encode_event(e)) for e in events)
+        assert encoded / 2 < weight < encoded * 2
+
+    @pytest.mark.asyncio
+    async def test_plan_context_is_part_of_the_key(self):
+        provider = CountingProvider()
+        messages = [{"role": "user", "content": "Next steps?"}]
+        await run(provider, messages, plan_context='{"title": "A", "steps": []}')
+        await run(provider, messages, plan_context='{"title": "B", "steps": []}')
+        assert provider.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_bypass_skips_lookup_but_refreshes_entry(self):
+        provider = CountingProvider()
+        messages = [{"role": "user", "content": "Motion to compel"}]
+        await run(provider, messages)
+        await run(provider, messages, use_cache=False)
+        assert provider.calls == 2
+        await run(provider, messages)
+        assert provider.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_failed_turns_are_not_cached(self):
+        class FailingProvider(CountingProvider):
+            async def stream(self, messages, tools):
+                self.calls += 1
+                async for chunk in MockProvider.stream(self, messages, tools):
+                    yield chunk
+                    raise RuntimeError("connection reset")
+
+        provider = FailingProvider()
+        messages = [{"role": "user", "content": "Motion to stay"}]
+        with pytest.raises(RuntimeError):
+            await run(provider, messages)
+        assert len(response_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_cached_turn_still_updates_the_new_plan(client: AsyncClient):
+    """A replayed turn goes through the normal save path; no-cache forces a fresh answer."""
+    await client.post("/api/auth/register", json={"email": "cache@example.com", "password": "password123"})
+    token = (await client.post("/api/auth/token", data={"username": "cache@example.com", "password": "password123"})).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    provider = CountingProvider()
+
+    plans = []
+    with patch("core.llm.get_provider", return_value=provider):
+        for extra in ({}, {}, {"Cache-Control": "no-cache"}):
+            async with client.stream("POST", "/api/chat", json={"message": "Draft a motion to dismiss"},
+                                     headers={**headers, **extra}) as response:
+                body = "".join([chunk async for chunk in response.aiter_text()])
+            plans.append(body)
+
+    assert provider.calls == 2
+    assert all('"type": "plan"' in body for body in plans)
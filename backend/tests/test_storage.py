@@ -0,0 +1,105 @@
+"""
+Tests for the storage repositories; each runs against every backend.
+"""
+import pytest
+from beanie import PydanticObjectId
+from pymongo.errors import DuplicateKeyError
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.plan_patch import PlanPatchError
+from core.storage import MemoryStorage, MongoStorage, UserRepository, create_storage
+
+
+def test_backend_is_selected_by_name(monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    assert isinstance(create_storage(), MemoryStorage)
+    assert isinstance(create_storage("mongo"), MongoStorage)
+    with pytest.raises(ValueError):
+        create_storage("sqlite")
+
+
+def test_incomplete_repositories_cannot_be_built():
+    class Partial(UserRepository):
+        async def get_by_email(self, email):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+@pytest.mark.asyncio
+async def test_emails_are_unique(storage):
+    await storage.users.create("unique@example.com", "x")
+    with pytest.raises(DuplicateKeyError):
+        await storage.users.create("unique@example.com", "y")
+
+
+@pytest.mark.asyncio
+async def test_changes_are_stored_only_through_the_repository(storage):
+    user_id = PydanticObjectId()
+    plan = await storage.plans.create(user_id, "Draft")
+
+    plan.title = "Unsaved"
+    assert (await storage.plans.get(plan.id, user_id)).title == "Draft"
+    assert await storage.plans.get(plan.id, PydanticObjectId()) is None
+
+    await storage.plans.save(plan)
+    assert (await storage.plans.get(plan.id, user_id)).title == "Unsaved"
+
+
+@pytest.mark.asyncio
+async def test_patch_updates_stored_and_local_plan(storage):
+    user_id = PydanticObjectId()
+    plan = await storage.plans.create(user_id, "Motion", steps=[{"id": "1", "title": "Research", "status": "pending"}])
+
+    await storage.plans.patch(plan, [{"op": "update", "id": "1", "step": {"status": "done"}}], title="Motion to compel")
+    with pytest.raises(PlanPatchError):
+        await storage.plans.patch(plan, [{"op": "remove", "id": "missing"}])
+
+    stored = await storage.plans.get(plan.id, user_id)
+    assert stored.title == plan.title == "Motion to compel"
+    assert stored.steps == plan.steps
+    assert stored.steps[0]["status"] == "done"
+
+
+@pytest.mark.asyncio
+async def test_patch_applies_to_the_stored_plan_not_a_stale_copy(storage):
+    """Overlapping turns each load the plan; a later patch must build on the earlier one."""
+    user_id = PydanticObjectId()
+    steps = [{"id": str(i), "title": f"Step {i}", "status": "pending"} for i in (1, 2, 3)]
+    created = await storage.plans.create(user_id, "Motion", steps=steps)
+    first = await storage.plans.get(created.id, user_id)
+    second = await storage.plans.get(created.id, user_id)
+
+    await storage.plans.patch(first, [{"op": "add", "step": {"id": "1a", "title": "Research"}, "after": "1"}])
+    # Positions come from the stored order, which the second copy has not seen
+    await storage.plans.patch(second, [{"op": "add", "step": {"id": "2a", "title": "Draft"}, "after": "2"}])
+    with pytest.raises(PlanPatchError):
+        await storage.plans.patch(second, [{"op": "reorder", "order": ["3", "2", "1"]}])
+    await storage.plans.patch(first, [{"op": "remove", "id": "2"}])
+
+    stored = await storage.plans.get(created.id, user_id)
+    assert [s["id"] for s in stored.steps] == ["1", "1a", "2a", "3"]
+    assert first.steps == stored.steps
+
+
+@pytest.mark.asyncio
+async def test_patching_a_deleted_plan_is_rejected(storage):
+    plan = await storage.plans.create(PydanticObjectId(), "Doomed", steps=[{"id": "1", "title": "A", "status": "pending"}])
+    await storage.plans.delete(plan)
+    with pytest.raises(PlanPatchError):
+        await storage.plans.patch(plan, [{"op": "update", "id": "1", "step": {"status": "done"}}])
+
+
+@pytest.mark.asyncio
+async def test_deleting_a_plan_session_removes_its_messages(storage):
+    plan = await storage.plans.create(PydanticObjectId(), "Doomed")
+    session = await storage.chats.create_session(plan.id, plan.user_id)
+    await storage.chats.append_message(session, {"role": "user", "content": "hi"})
+
+    await storage.chats.delete_for_plan(plan.id)
+    assert await storage.chats.get_session(plan.id) is None
+    assert await storage.chats.get_messages(session.id) == ([], None)
@@ -0,0 +1,44 @@
+"""
+Tests for running several tool calls from one model turn.
+"""
+import asyncio
+import pytest
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.tool_dispatch import dispatch_tool_calls
+
+
+@pytest.mark.asyncio
+async def test_same_resource_runs_in_order():
+    log = []
+
+    async def execute(call):
+        await asyncio.sleep(0.01 if call == "a" else 0)
+        log.append(call)
+        return call.upper()
+
+    results = await dispatch_tool_calls(["a", "b", "c"], execute, resource_of=lambda call: "plan")
+    assert log == ["a", "b", "c"]
+    assert results == ["A", "B", "C"]
+
+
+@pytest.mark.asyncio
+async def test_independent_resources_run_concurrently():
+    running = 0
+    peak = 0
+
+    async def execute(call):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return call
+
+    calls = [("plan-1", 0), ("plan-2", 1), ("plan-1", 2), ("plan-3", 3)]
+    results = await dispatch_tool_calls(calls, execute, resource_of=lambda call: call[0])
+    assert results == calls
+    assert peak == 3
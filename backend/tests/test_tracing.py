@@ -0,0 +1,151 @@
+"""
+Tests for request tracing spans and the opt-in profiler.
+"""
+import asyncio
+import json
+import logging
+import pytest
+import time
+from httpx import AsyncClient, ASGITransport
+from unittest.mock import patch
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.profiling import Profiler, StackSampler
+from core.tracing import Trace, TracingMiddleware, _current, current_trace, span
+
+
+class TestSpans:
+    """Spans are recorded on the current trace and ignored outside one."""
+
+    def test_span_without_trace_is_a_no_op(self):
+        assert current_trace() is None
+        with span("db.plan") as s:
+            s.set(rows=1)
+
+    def test_spans_are_recorded_and_summed_in_server_timing(self):
+        trace = Trace("t1")
+        token = _current.set(trace)
+        try:
+            with span("db.plan", rows=1):
+                pass
+            with span("db.plan"):
+                pass
+            s = span("llm.first_token")
+            s.end()
+            s.end()
+        finally:
+            _current.reset(token)
+
+        assert [s.name for s in trace.spans] == ["db.plan", "db.plan", "llm.first_token"]
+        header = trace.server_timing()
+        assert header.count("db.plan;dur=") == 1
+        assert "llm.first_token;dur=" in header
+        assert header.split(", ")[-1].startswith("total;dur=")
+        assert trace.to_dict()["spans"][0]["rows"] == 1
+
+    def test_errors_are_recorded(self):
+        trace = Trace()
+        token = _current.set(trace)
+        try:
+            with pytest.raises(ValueError):
+                with span("auth.jwt"):
+                    raise ValueError("bad token")
+        finally:
+            _current.reset(token)
+        assert trace.spans[0].attributes["error"] == "ValueError"
+
+    @pytest.mark.asyncio
+    async def test_tasks_started_by_a_request_share_its_trace(self):
+        trace = Trace()
+        token = _current.set(trace)
+        try:
+            async def stage():
+                with span("llm.stream"):
+                    await asyncio.sleep(0)
+            await asyncio.create_task(stage())
+        finally:
+            _current.reset(token)
+        assert [s.name for s in trace.spans] == ["llm.stream"]
+
+
+async def traced_app(scope, receive, send):
+    with span("db.plan"):
+        await asyncio.sleep(0)
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/plain")]})
+    with span("llm.stream"):
+        await send({"type": "http.response.body", "body": b"ok", "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+@pytest.mark.asyncio
+async def test_middleware_sets_header_and_logs_every_span(caplog):
+    app = TracingMiddleware(traced_app)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+        with caplog.at_level(logging.INFO, logger="legal_lens.trace"):
+            response = await ac.get("/api/chat")
+
+    timing = response.headers["Server-Timing"]
+    assert "db.plan;dur=" in timing
+    assert "llm.stream" not in timing  # still running when headers were sent
+    record = json.loads([r for r in caplog.records if r.name == "legal_lens.trace"][-1].getMessage())
+    assert record["path"] == "/api/chat"
+    assert record["trace_id"] == response.headers["X-Trace-Id"]
+    assert [s["name"] for s in record["spans"]] == ["db.plan", "llm.stream"]
+
+
+class TestProfiling:
+    """Per-request sampling profiles."""
+
+    def test_sampler_collects_folded_stacks(self):
+        def busy_wait():
+            deadline = time.perf_counter() + 0.05
+            while time.perf_counter() < deadline:
+                pass
+
+        sampler = StackSampler(interval=0.001)
+        sampler.start()
+        busy_wait()
+        sampler.stop()
+
+        assert sampler.samples > 0
+        assert "busy_wait (test_tracing.py:" in sampler.folded()
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in sampler.folded().splitlines())
+
+    def test_stop_does_not_wait_for_the_sampler_thread(self):
+        sampler = StackSampler(interval=0.001)
+        sampler.start()
+        time.sleep(0.01)
+        with patch("threading.Thread.join", side_effect=AssertionError("stop() blocked the event loop")):
+            sampler.stop()
+        samples = sampler.samples
+        time.sleep(0.01)
+        assert sampler.samples == samples
+
+    def test_one_profile_at_a_time(self):
+        profiler = Profiler(keep=1)
+        assert profiler.start("a") == "a"
+        assert profiler.start("b") is None
+        profiler.stop("a")
+        assert profiler.get("a") is not None
+        profiler.start("c")
+        profiler.stop("c")
+        assert profiler.get("a") is None
+
+    @pytest.mark.asyncio
+    async def test_profile_header_requires_token(self):
+        import main
+
+        with patch("core.tracing.PROFILING_TOKEN", "admin-secret"), patch("main.PROFILING_TOKEN", "admin-secret"):
+            async with AsyncClient(transport=ASGITransport(app=main.app), base_url="http://test") as ac:
+                plain = await ac.get("/", headers={"X-Profile": "wrong"})
+                assert "X-Profile-Id" not in plain.headers
+
+                profiled = await ac.get("/", headers={"X-Profile": "admin-secret"})
+                profile_id = profiled.headers["X-Profile-Id"]
+
+                assert (await ac.get(f"/debug/profiles/{profile_id}")).status_code == 404
+                response = await ac.get(f"/debug/profiles/{profile_id}", headers={"X-Profile": "admin-secret"})
+                assert response.status_code == 200
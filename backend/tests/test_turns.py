@@ -0,0 +1,277 @@
+"""
+Tests for chat turns that run independently of the HTTP connection.
+"""
+import asyncio
+import json
+import pytest
+from httpx import AsyncClient
+from unittest.mock import patch
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.events import StreamError, TextDelta, Usage
+from core.metrics import turn_cancellations
+from core.providers import MockProvider
+from core.turns import TurnRegistry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+async def produce(texts, delay=0.0):
+    for text in texts:
+        if delay:
+            await asyncio.sleep(delay)
+        yield TextDelta(text)
+
+
+async def collect(buffer, after=-1):
+    return [(seq, event.content) async for seq, event in buffer.follow(after)]
+
+
+class TestTurnBuffer:
+    """Events are numbered and replayed from any offset."""
+
+    @pytest.mark.asyncio
+    async def test_followers_see_every_event_in_order(self):
+        registry = TurnRegistry()
+        buffer = registry.start("t1", "u1", produce(["a", "b", "c"], delay=0.01))
+
+        first, late = await asyncio.gather(collect(buffer), collect(buffer, after=1))
+        assert first == [(0, "a"), (1, "b"), (2, "c")]
+        assert late == [(2, "c")]
+
+    @pytest.mark.asyncio
+    async def test_turn_keeps_running_without_followers(self):
+        registry = TurnRegistry()
+        buffer = registry.start("t1", "u1", produce(["a", "b"], delay=0.01))
+
+        async for _ in buffer.follow():
+            break  # client went away after the first event
+        await buffer.task
+
+        assert buffer.done
+        assert await collect(buffer, after=0) == [(1, "b")]
+
+    @pytest.mark.asyncio
+    async def test_failure_ends_turn_with_error_event(self):
+        async def failing():
+            yield TextDelta("partial")
+            raise RuntimeError("upstream went away")
+
+        registry = TurnRegistry()
+        buffer = registry.start("t1", "u1", failing())
+        await buffer.task
+
+        assert buffer.done
+        assert isinstance(buffer.events[-1], StreamError)
+
+    @pytest.mark.asyncio
+    async def test_lookup_checks_owner_and_expiry(self):
+        clock = FakeClock()
+        registry = TurnRegistry(retention=60, clock=clock)
+        buffer = registry.start("t1", "u1", produce(["a"]))
+        await buffer.task
+
+        assert registry.get("t1", "u2") is None
+        assert registry.get("t1", "u1") is buffer
+        clock.now = 61
+        assert registry.get("t1", "u1") is None
+        assert len(registry) == 0
+
+
+async def endless(delay=0.005):
+    i = 0
+    while True:
+        await asyncio.sleep(delay)
+        yield TextDelta(str(i))
+        i += 1
+
+
+async def follow_briefly(buffer, events=1):
+    """Read a few events, then disconnect the way a dropped response does."""
+    follower = buffer.follow()
+    for _ in range(events):
+        await follower.__anext__()
+    await follower.aclose()
+
+
+class TestAbandonedTurns:
+    """Turns nobody follows any more are cancelled after a grace period."""
+
+    @pytest.mark.asyncio
+    async def test_abandoned_turn_is_cancelled_after_grace(self):
+        registry = TurnRegistry(abandon_grace=0.02)
+        cancelled_before = turn_cancellations.value()
+        buffer = registry.start("t1", "u1", endless())
+
+        await follow_briefly(buffer)
+        await asyncio.wait_for(buffer.task, timeout=1)
+
+        assert buffer.cancelled and buffer.done
+        assert isinstance(buffer.events[-1], StreamError)
+        assert turn_cancellations.value() == cancelled_before + 1
+
+    @pytest.mark.asyncio
+    async def test_reconnect_within_grace_keeps_turn_alive(self):
+        registry = TurnRegistry(abandon_grace=0.05)
+        buffer = registry.start("t1", "u1", endless())
+
+        await follow_briefly(buffer)
+        follower = buffer.follow(after=0)
+        await follower.__anext__()
+        await asyncio.sleep(0.1)
+
+        assert not buffer.cancelled and not buffer.done
+        buffer.task.cancel()
+        await follower.aclose()
+
+    @pytest.mark.asyncio
+    async def test_each_abandon_gets_the_full_grace_period(self):
+        registry = TurnRegistry(abandon_grace=60)
+        buffer = registry.start("t1", "u1", endless())
+
+        await follow_briefly(buffer)
+        first = buffer.abandon_timer
+        follower = buffer.follow(after=0)
+        await follower.__anext__()
+        assert first.cancelled() and buffer.abandon_timer is None
+
+        await follower.aclose()
+        second = buffer.abandon_timer
+        assert second is not first and not second.cancelled()
+        assert second.when() > first.when()
+
+        buffer.task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await buffer.task
+        assert second.cancelled()
+
+    @pytest.mark.asyncio
+    async def test_turn_is_not_cancelled_after_generation_finished(self):
+        async def saving_slowly():
+            yield TextDelta("answer")
+            yield Usage({"completion_tokens": 1})
+            await asyncio.sleep(0.05)  # plan update and message saves
+            yield TextDelta("done")
+
+        registry = TurnRegistry(abandon_grace=0)
+        buffer = registry.start("t1", "u1", saving_slowly())
+        await follow_briefly(buffer, events=2)
+        await buffer.task
+
+        assert not buffer.cancelled
+        assert buffer.events[-1].content == "done"
+
+
+class CountingProvider(MockProvider):
+    """Mock provider that counts upstream calls."""
+    def __init__(self):
+        super().__init__(tokens_per_second=0, ttft_ms=0)
+        self.calls = 0
+
+    def stream(self, messages, tools):
+        self.calls += 1
+        return super().stream(messages, tools)
+
+
+@pytest.mark.asyncio
+async def test_reconnect_replays_missed_events(client: AsyncClient):
+    """A client can resume a turn from its last seq without a second LLM call."""
+    await client.post("/api/auth/register", json={"email": "resume@example.com", "password": "password123"})
+    token = (await client.post("/api/auth/token", data={"username": "resume@example.com", "password": "password123"})).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    provider = CountingProvider()
+
+    with patch("core.llm.get_provider", return_value=provider):
+        async with client.stream("POST", "/api/chat", json={"message": "Motion to compel"}, headers=headers) as response:
+            body = "".join([chunk async for chunk in response.aiter_text()])
+    events = [json.loads(line) for line in body.splitlines()]
+    turn_id = events[0]["turn_id"]
+    assert response.headers["X-Turn-Id"] == turn_id
+    assert [e["seq"] for e in events] == list(range(len(events)))
+
+    response = await client.get(f"/api/chat/turns/{turn_id}", params={"after": 4}, headers=headers)
+    replayed = [json.loads(line) for line in response.text.splitlines()]
+    assert replayed == events[5:]
+    assert provider.calls == 1
+
+    await client.post("/api/auth/register", json={"email": "other@example.com", "password": "password123"})
+    other = (await client.post("/api/auth/token", data={"username": "other@example.com", "password": "password123"})).json()["access_token"]
+    response = await client.get(f"/api/chat/turns/{turn_id}", headers={"Authorization": f"Bearer {other}"})
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_abandoned_turn_saves_truncated_answer(storage):
+    """Cancelling a turn mid-answer stores the partial text marked as truncated."""
+    from beanie import PydanticObjectId
+    from api.endpoints import save_and_stream
+    from models import ChatRequest
+
+    plan = await storage.plans.create(PydanticObjectId(), "Untitled Strategy")
+    session = await storage.chats.create_session(plan.id, plan.user_id)
+
+    registry = TurnRegistry(abandon_grace=0)
+    with patch("core.llm.get_provider", return_value=MockProvider(tokens_per_second=200, ttft_ms=0)):
+        buffer = registry.start("t1", str(plan.user_id), save_and_stream(
+            ChatRequest(message="Motion to compel"), None, plan, session, "t1"
+        ))
+        await follow_briefly(buffer, events=4)
+        await asyncio.wait_for(buffer.task, timeout=5)
+
+    assert buffer.cancelled
+    stored, _ = await storage.chats.get_messages(session.id)
+    assert [m["role"] for m in stored] == ["user", "assistant"]
+    assert stored[-1]["truncated"] is True
+    assert stored[-1]["content"]
+    assert "tool_calls" not in stored[-1]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("write_behind", [False, True])
+async def test_plan_deleted_during_turn_ends_with_error(storage, write_behind):
+    """The answer of a turn whose plan was deleted meanwhile is reported as not saved."""
+    from beanie import PydanticObjectId
+    from api.endpoints import save_and_stream
+    from core.storage import set_storage
+    from core.write_behind import WriteBehindStorage
+    from models import ChatRequest
+
+    active = storage
+    if write_behind:
+        active = WriteBehindStorage(storage, max_delay=0.01)
+        set_storage(active)
+
+    plan = await active.plans.create(PydanticObjectId(), "Untitled Strategy")
+    session = await active.chats.create_session(plan.id, plan.user_id)
+
+    events = []
+    with patch("core.llm.get_provider", return_value=MockProvider(tokens_per_second=0, ttft_ms=0, tool_calls=False)):
+        async for event in save_and_stream(ChatRequest(message="Motion to compel"), None, plan, session, "t1"):
+            if isinstance(event, TextDelta) and not any(isinstance(e, TextDelta) for e in events):
+                await active.chats.delete_for_plan(plan.id)
+                await active.plans.delete(plan)
+            events.append(event)
+
+    assert isinstance(events[-1], StreamError)
+    assert "deleted" in events[-1].content
+
+    if write_behind:
+        # A late plan write from the turn must not bring the plan back
+        await active.plans.save(plan)
+        assert await active.plans.get(plan.id, plan.user_id) is None
+        assert await active.plans.list_summaries(plan.user_id, 10) == []
+        await active.close()
+
+    assert await storage.chats.get_session(plan.id) is None
+    assert await storage.plans.get(plan.id, plan.user_id) is None
+    stored, _ = await storage.chats.get_messages(session.id)
+    assert stored == []
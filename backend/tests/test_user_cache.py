@@ -0,0 +1,114 @@
+"""
+Tests for the authenticated-user cache used by get_current_user.
+"""
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.cache import TTLCache, user_cache, invalidate_user
+from api.auth import create_access_token, get_current_user
+from core.storage import MemoryStorage
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache:
+    """Tests for the TTL/LRU cache."""
+
+    def test_hit_and_miss_counters(self):
+        cache = TTLCache(maxsize=10, ttl=60)
+        assert cache.get("a") is None
+        cache.set("a", 1)
+        assert cache.get("a") == 1
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["hit_rate"] == 0.5
+
+    def test_entries_expire(self):
+        clock = FakeClock()
+        cache = TTLCache(maxsize=10, ttl=5, clock=clock)
+        cache.set("a", 1)
+        clock.now = 4.9
+        assert cache.get("a") == 1
+        clock.now = 5.0
+        assert cache.get("a") is None
+        assert len(cache) == 0
+
+    def test_least_recently_used_is_evicted(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.evictions == 1
+
+    def test_zero_ttl_disables_cache(self):
+        cache = TTLCache(maxsize=10, ttl=0)
+        cache.set("a", 1)
+        assert cache.get("a") is None
+
+    def test_invalidate_user_drops_old_email(self):
+        user = MagicMock(id="u1", email="new@example.com")
+        user_cache.set("old@example.com", MagicMock(id="u1", email="old@example.com"))
+        user_cache.set("other@example.com", MagicMock(id="u2", email="other@example.com"))
+        invalidate_user(user)
+        assert user_cache.get("old@example.com") is None
+        assert user_cache.get("other@example.com") is not None
+        user_cache.clear()
+
+
+class TestGetCurrentUserCache:
+    """get_current_user should only hit the database on a cache miss."""
+
+    @pytest.mark.asyncio
+    async def test_second_lookup_is_served_from_cache(self):
+        user_cache.clear()
+        token = create_access_token({"sub": "cached@example.com"})
+        stored = MagicMock(id="u1", email="cached@example.com")
+        storage = MemoryStorage()
+        storage.users.get_by_email = AsyncMock(return_value=stored)
+
+        with patch("api.auth.get_storage", return_value=storage):
+            assert await get_current_user(token) is stored
+            assert await get_current_user(token) is stored
+
+        assert storage.users.get_by_email.await_count == 1
+        user_cache.clear()
+
+    @pytest.mark.asyncio
+    async def test_unknown_user_is_not_cached(self):
+        from fastapi import HTTPException
+        user_cache.clear()
+        token = create_access_token({"sub": "ghost@example.com"})
+        storage = MemoryStorage()
+        storage.users.get_by_email = AsyncMock(return_value=None)
+
+        with patch("api.auth.get_storage", return_value=storage):
+            for _ in range(2):
+                with pytest.raises(HTTPException):
+                    await get_current_user(token)
+
+        assert storage.users.get_by_email.await_count == 2
+        assert len(user_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_deleted_user_is_evicted(storage):
+    """Deleting a user through the storage drops it from the cache."""
+    user = await storage.users.create("deleted@example.com", "x")
+    token = create_access_token({"sub": user.email})
+
+    assert (await get_current_user(token)).id == user.id
+    await storage.users.delete(user)
+    assert user_cache.get(user.email) is None
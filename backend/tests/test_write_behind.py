@@ -0,0 +1,178 @@
+"""
+Tests for write-behind storage: queued turn writes, the read-through overlay,
+batched flushes, retries and flush on shutdown.
+"""
+import asyncio
+import pytest
+from beanie import PydanticObjectId
+from unittest.mock import AsyncMock, patch
+
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from core.metrics import write_behind_dropped
+from core.providers import MockProvider
+from core.storage import MemoryStorage, create_storage, new_document, set_storage
+from core.write_behind import WriteBehindStorage
+from models import ChatMessage
+
+
+async def make_session(storage):
+    plan = await storage.plans.create(PydanticObjectId(), "Untitled Strategy")
+    return plan, await storage.chats.create_session(plan.id, plan.user_id)
+
+
+def test_enabled_by_configuration(monkeypatch):
+    monkeypatch.setenv("STORAGE_WRITE_BEHIND", "true")
+    storage = create_storage("memory")
+    assert isinstance(storage, WriteBehindStorage)
+    assert storage.name == "memory"
+
+
+@pytest.mark.asyncio
+async def test_messages_are_readable_before_they_are_flushed():
+    inner = MemoryStorage()
+    storage = WriteBehindStorage(inner)
+    _, session = await make_session(storage)
+
+    for i in range(3):
+        await storage.chats.append_message(session, {"role": "user", "content": f"m{i}"})
+
+    assert await inner.chats.get_messages(session.id) == ([], None)
+    page, cursor = await storage.chats.get_messages(session.id, limit=2)
+    assert [m["content"] for m in page] == ["m1", "m2"]
+    page, _ = await storage.chats.get_messages(session.id, limit=2, before=cursor)
+    assert [m["content"] for m in page] == ["m0"]
+
+    await storage.flush()
+    stored, _ = await inner.chats.get_messages(session.id)
+    assert [(m["seq"], m["content"]) for m in stored] == [(1, "m0"), (2, "m1"), (3, "m2")]
+    assert storage.pending() == 0
+    assert (await storage.chats.get_session(session.plan_id)).message_count == 3
+
+
+@pytest.mark.asyncio
+async def test_plan_updates_are_read_through_the_overlay():
+    inner = MemoryStorage()
+    storage = WriteBehindStorage(inner)
+    plan = await storage.plans.create(PydanticObjectId(), "Draft", steps=[{"id": "1", "title": "Research", "status": "pending"}])
+
+    await storage.plans.patch(plan, [{"op": "update", "id": "1", "step": {"status": "done"}}], title="Motion")
+
+    assert (await inner.plans.get(plan.id, plan.user_id)).title == "Draft"
+    assert (await storage.plans.get(plan.id, plan.user_id)).steps[0]["status"] == "done"
+    assert await storage.plans.get(plan.id, PydanticObjectId()) is None
+    assert [s.title for s in await storage.plans.list_summaries(plan.user_id, 10)] == ["Motion"]
+
+    await storage.flush()
+    stored = await inner.plans.get(plan.id, plan.user_id)
+    assert (stored.title, stored.steps[0]["status"]) == ("Motion", "done")
+
+
+@pytest.mark.asyncio
+async def test_queue_is_flushed_within_the_delay_bound():
+    inner = MemoryStorage()
+    storage = WriteBehindStorage(inner, max_delay=0.02)
+    _, session = await make_session(storage)
+    await storage.start()
+    try:
+        await storage.chats.append_message(session, {"role": "user", "content": "hello"})
+        await asyncio.sleep(0.1)
+        assert storage.pending() == 0
+        assert (await inner.chats.get_messages(session.id))[0][0]["content"] == "hello"
+    finally:
+        await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_full_batch_is_flushed_without_waiting():
+    inner = MemoryStorage()
+    inner.chats.store_messages = AsyncMock(wraps=inner.chats.store_messages)
+    storage = WriteBehindStorage(inner, max_delay=60, batch_size=4)
+    _, session = await make_session(storage)
+    await storage.start()
+    try:
+        for i in range(4):
+            await storage.chats.append_message(session, {"role": "user", "content": f"m{i}"})
+        await asyncio.sleep(0.05)
+        assert inner.chats.store_messages.await_count == 1
+        assert len(inner.chats.store_messages.await_args.args[0]) == 4
+    finally:
+        await storage.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_flushes_are_retried_then_dropped():
+    inner = MemoryStorage()
+    storage = WriteBehindStorage(inner, max_retries=2, retry_backoff=0)
+    _, session = await make_session(storage)
+    inner.chats.store_messages = AsyncMock(side_effect=[ConnectionError("down"), None])
+
+    await storage.chats.append_message(session, {"role": "user", "content": "kept"})
+    await storage.flush()
+    assert inner.chats.store_messages.await_count == 2
+    assert storage.pending() == 0
+
+    inner.chats.store_messages = AsyncMock(side_effect=ConnectionError("down"))
+    dropped = write_behind_dropped.value(record="message")
+    await storage.chats.append_message(session, {"role": "user", "content": "lost"})
+    await storage.flush()
+    assert inner.chats.store_messages.await_count == 3
+    assert write_behind_dropped.value(record="message") == dropped + 1
+    assert storage.pending() == 0
+
+
+@pytest.mark.asyncio
+async def test_close_flushes_pending_writes():
+    inner = MemoryStorage()
+    storage = WriteBehindStorage(inner, max_delay=60)
+    plan, session = await make_session(storage)
+    await storage.start()
+    await storage.chats.append_message(session, {"role": "user", "content": "last words"})
+    plan.title = "Saved on shutdown"
+    await storage.plans.save(plan)
+
+    await storage.close()
+    assert (await inner.chats.get_messages(session.id))[0][0]["content"] == "last words"
+    assert (await inner.plans.get(plan.id, plan.user_id)).title == "Saved on shutdown"
+
+
+@pytest.mark.asyncio
+async def test_taken_seq_is_stored_under_the_next_one(storage):
+    _, session = await make_session(storage)
+    await storage.chats.append_message(session, {"role": "user", "content": "from another worker"})
+    queued = new_document(ChatMessage, session_id=session.id, plan_id=session.plan_id, seq=1, role="user", content="ours")
+
+    await storage.chats.store_messages([queued])
+    await storage.chats.store_messages([queued])  # a retried batch is not stored twice
+
+    stored, _ = await storage.chats.get_messages(session.id)
+    assert [(m["seq"], m["content"]) for m in stored] == [(1, "from another worker"), (2, "ours")]
+
+
+@pytest.fixture
+def write_behind(storage):
+    wrapped = WriteBehindStorage(storage, max_delay=0.01)
+    set_storage(wrapped)
+    return wrapped
+
+
+@pytest.mark.asyncio
+async def test_chat_turn_through_write_behind(write_behind, client):
+    await client.post("/api/auth/register", json={"email": "queued@example.com", "password": "password123"})
+    token = (await client.post("/api/auth/token", data={"username": "queued@example.com", "password": "password123"})).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    with patch("core.llm.get_provider", return_value=MockProvider(tokens_per_second=1000, ttft_ms=0)):
+        async with client.stream("POST", "/api/chat", json={"message": "Plan a motion to dismiss"}, headers=headers) as response:
+            async for _ in response.aiter_lines():
+                pass
+    plan_id = (await client.get("/api/plans/", headers=headers)).json()[0]["_id"]
+
+    body = (await client.get(f"/api/plans/{plan_id}", headers=headers)).json()
+    assert [m["role"] for m in body["chat_history"]] == ["user", "assistant"]
+
+    await write_behind.flush()
+    stored = await write_behind.inner.plans.get(PydanticObjectId(plan_id), (await write_behind.users.get_by_email("queued@example.com")).id)
+    assert stored.title == body["plan"]["title"]
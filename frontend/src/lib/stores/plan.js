@@ -6,3 +6,20 @@ export const plan = writable({
     steps: [],
     updatedAt: ''
 });
+
+// True while a manage_plan call is streaming steps into the plan pane
+export const planStreaming = writable(false);
+
+/**
+ * Apply a `plan_step` stream event: steps arrive in order, so step `index`
+ * replaces everything from that position on. The first step of a rewrite
+ * therefore clears the steps of the previous version.
+ */
+export function applyPlanStep(current, event) {
+    return {
+        ...current,
+        title: event.title ?? current.title,
+        steps: [...current.steps.slice(0, event.index), event.step],
+        updatedAt: new Date().toISOString()
+    };
+}
@@ -3,7 +3,7 @@
  */
 import { describe, it, expect, beforeEach } from 'vitest';
 import { get } from 'svelte/store';
-import { plan } from './plan.js';
+import { plan, applyPlanStep } from './plan.js';
 
 describe('plan store', () => {
     beforeEach(() => {
@@ -101,4 +101,38 @@ describe('plan store', () => {
             expect(updateCount).toBe(initialCount + 1); // Should not increase
         });
     });
+
+    describe('applyPlanStep', () => {
+        it('replaces previous steps when a rewrite starts streaming', () => {
+            const current = {
+                id: 'plan-123',
+                title: 'Old Title',
+                steps: [
+                    { id: 'a', title: 'Old step', status: 'done' },
+                    { id: 'b', title: 'Another', status: 'pending' }
+                ],
+                updatedAt: ''
+            };
+
+            const next = applyPlanStep(current, {
+                type: 'plan_step',
+                index: 0,
+                step: { id: '1', title: 'Research', status: 'pending' },
+                title: 'New Title'
+            });
+
+            expect(next.id).toBe('plan-123');
+            expect(next.title).toBe('New Title');
+            expect(next.steps).toEqual([{ id: '1', title: 'Research', status: 'pending' }]);
+        });
+
+        it('appends later steps and keeps the title when none is sent', () => {
+            let state = { id: '', title: 'Plan', steps: [], updatedAt: '' };
+            state = applyPlanStep(state, { index: 0, step: { id: '1', title: 'One' } });
+            state = applyPlanStep(state, { index: 1, step: { id: '2', title: 'Two' } });
+
+            expect(state.title).toBe('Plan');
+            expect(state.steps.map(s => s.id)).toEqual(['1', '2']);
+        });
+    });
 });